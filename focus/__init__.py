@@ -1,4 +1,10 @@
 
+import json
+import os
+
+from loguru import logger
+
+
 libname = "focus"
 version = "0.0.1"
 
@@ -10,3 +16,126 @@ from .modules import txt_lab
 SERVER_HOST = "0.0.0.0"
 SERVER_PORT = 8087
 LOG_LEVEL = 3
+
+# Pre-fork serving, see focus/prefork.py: models are loaded once and
+# SERVER_WORKERS processes are forked from the loaded parent, 1 - single
+# process. Torch threads per worker, None: cpus / workers (torch default
+# for a single process). Inter-op threads, None: torch default.
+SERVER_WORKERS = 1
+SERVER_TORCH_THREADS = None
+SERVER_TORCH_INTEROP_THREADS = None
+SERVER_MEM_REPORT_S = 60
+# Dead workers are restarted after SERVER_RESTART_BACKOFF_S seconds, doubled
+# on every consecutive failure up to SERVER_RESTART_MAX_BACKOFF_S; a worker
+# that ran SERVER_RESTART_RESET_S seconds resets the count. After
+# SERVER_MAX_RESTARTS consecutive failures the server (or `focus.jobs`) stops.
+SERVER_RESTART_BACKOFF_S = 1
+SERVER_RESTART_MAX_BACKOFF_S = 30
+SERVER_RESTART_RESET_S = 60
+SERVER_MAX_RESTARTS = 5
+
+# Startup warm-up: one message of every pattern of each size in characters
+# runs through the models before `/ready` reports ready, () - no warm-up
+WARMUP_MSG_CHARS = (200, 2_000)
+
+# Cross-request micro-batching of `/model` calls
+BATCH_MAX_SIZE = 16
+BATCH_MAX_WAIT_MS = 5
+
+# `/model/stream`: messages read ahead of the sent responses, request line limit
+STREAM_MAX_IN_FLIGHT = 32
+STREAM_MAX_LINE_BYTES = 1_000_000
+
+# Job queue, see focus/jobs.py: `python -m focus.jobs` runs JOBS_WORKERS
+# processes that claim JOBS_CLAIM_SIZE items at a time for JOBS_LEASE_S
+# seconds; an item claimed JOBS_MAX_ATTEMPTS times gets an error result.
+# Finished jobs are deleted after JOBS_TTL_S.
+JOBS_DB_PATH = "./jobs/jobs.sqlite"
+JOBS_WORKERS = 1
+JOBS_CLAIM_SIZE = 16
+JOBS_LEASE_S = 300
+JOBS_MAX_ATTEMPTS = 3
+JOBS_POLL_S = 1.0
+JOBS_TTL_S = 7 * 24 * 3600
+JOBS_MAX_UPLOAD_MB = 1024
+# JSON bodies of `POST /jobs` are parsed in memory, larger lists go as jsonl files
+JOBS_MAX_JSON_MB = 32
+JOBS_PAGE_SIZE = 1000
+
+# Inference executor: "thread" or "process" pool, admission limit in texts
+EXECUTOR_KIND = "thread"
+EXECUTOR_WORKERS = 2
+EXECUTOR_QUEUE_LIMIT = 64
+
+# Logging, see focus/log.py. Stage payloads are logged for a sampled share
+# of messages at the stage level, every message gets a JSON summary line.
+LOG_MIN_LEVEL = "INFO"
+LOG_ENQUEUE = True
+LOG_PAYLOAD_SAMPLE_RATE = 0.01
+LOG_MAX_FIELD_CHARS = 300
+LOG_REDACT = True
+LOG_SUMMARY_LEVEL = "INFO"
+LOG_STAGE_LEVELS = {
+    "input": "INFO",
+    "parse": "INFO",
+    "ner": "DEBUG",
+    "fields": "INFO",
+    "target_text": "DEBUG",
+    "cls": "INFO",
+}
+
+# Config written by `python -m focus.tune`, the server entry points apply it
+# over the settings above with `apply_tuned_config`
+TUNED_CONFIG_P = "./tuned.json"
+TUNED_KEYS = (
+    "SERVER_WORKERS",
+    "SERVER_TORCH_THREADS",
+    "SERVER_TORCH_INTEROP_THREADS",
+    "EXECUTOR_WORKERS",
+    "BATCH_MAX_SIZE",
+)
+# settings that may be None: torch default
+TUNED_OPTIONAL_KEYS = ("SERVER_TORCH_THREADS", "SERVER_TORCH_INTEROP_THREADS")
+
+
+def read_tuned_config(path: str) -> dict:
+    """Settings of the tuned config at `path`, {} if there is none.
+
+    Raise ValueError if the file is malformed or a value is not a positive
+    integer.
+    """
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path, "r", encoding="utf-8") as config_file:
+            config = json.load(config_file)["config"]
+    except (json.JSONDecodeError, KeyError, TypeError) as exc:
+        raise ValueError(f"Malformed tuned config {path}: {type(exc).__name__}: {exc}") from exc
+    if not isinstance(config, dict):
+        raise ValueError(f"Malformed tuned config {path}: \"config\" is not an object")
+    tuned = {}
+    for key, value in config.items():
+        if key not in TUNED_KEYS:
+            logger.warning(f"Tuned config {path}: unknown setting {key} is ignored")
+            continue
+        if value is None and key in TUNED_OPTIONAL_KEYS:
+            tuned[key] = value
+            continue
+        if isinstance(value, bool) or not isinstance(value, int) or value < 1:
+            raise ValueError(f"Tuned config {path}: {key} must be a positive integer, got {value!r}")
+        tuned[key] = value
+    return tuned
+
+
+def apply_tuned_config(path: str = TUNED_CONFIG_P) -> dict:
+    """Override the settings of this module with the tuned config at `path`.
+
+    Only takes effect for the modules imported afterwards. Return the
+    overridden settings.
+    """
+    tuned = read_tuned_config(path)
+    settings = globals()
+    for key, value in tuned.items():
+        logger.info(f"Tuned config {path}: {key} = {value!r} (default {settings[key]!r})")
+    settings.update(tuned)
+    return tuned
@@ -1,18 +1,29 @@
-
 import uvicorn
 
-from focus import SERVER_HOST, SERVER_PORT, LOG_LEVEL
-from focus.app import create_app
-
-from focus.routes import init_routes, router
+import focus
+from focus import SERVER_HOST, SERVER_PORT, LOG_LEVEL, apply_tuned_config
+from focus.log import setup_logging
 
 
 if __name__ == "__main__":
-    init_routes()
-    app = create_app(mounts=[], routers=[router])
-    uvicorn.run(
-        app,
-        host=SERVER_HOST,
-        port=SERVER_PORT,
-        log_level=LOG_LEVEL,
-    )
+    setup_logging()
+    # the tuned settings are read from `focus` after they are applied
+    apply_tuned_config()
+    if focus.SERVER_WORKERS > 1:
+        from focus.prefork import serve
+
+        serve(focus.SERVER_WORKERS, focus.SERVER_TORCH_THREADS)
+    else:
+        from focus.app import create_app
+        from focus.modules.backend import set_torch_threads
+        from focus.routes import init_routes, router
+
+        set_torch_threads(focus.SERVER_TORCH_THREADS, focus.SERVER_TORCH_INTEROP_THREADS)
+        init_routes()
+        app = create_app(mounts=[], routers=[router])
+        uvicorn.run(
+            app,
+            host=SERVER_HOST,
+            port=SERVER_PORT,
+            log_level=LOG_LEVEL,
+        )
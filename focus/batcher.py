@@ -0,0 +1,130 @@
+import asyncio
+import time
+from typing import Awaitable, Callable, Optional
+
+from loguru import logger
+
+from focus import ModelRes
+
+
+BatchFunc = Callable[[list[str]], Awaitable[list[ModelRes]]]
+
+
+class MicroBatcher:
+    """Collects concurrent requests into batches for `ExtrClsHandler.batch`.
+
+    The first queued text opens a batch, which is flushed when it reaches
+    `max_batch_size` texts or `max_wait_ms` after it was opened. At most
+    `max_concurrency` batches are processed at once, so requests arriving
+    while all of them are running form the next batch. A failing batch is
+    retried text by text and every text gets its own result or exception.
+    """
+
+    def __init__(
+            self,
+            batch_func: BatchFunc,
+            max_batch_size: int,
+            max_wait_ms: float,
+            max_concurrency: int = 1,
+        ):
+        if max_batch_size < 1:
+            raise ValueError("max_batch_size must be positive")
+        self.batch_func = batch_func
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.max_concurrency = max_concurrency
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+
+    def _ensure_worker(self) -> asyncio.Queue:
+        if self._worker is None or self._worker.done():
+            self._queue = asyncio.Queue()
+            self._slots = asyncio.Semaphore(self.max_concurrency)
+            self._worker = asyncio.create_task(self._run())
+        return self._queue
+
+    async def submit(self, text: str) -> ModelRes:
+        """Process a single text as a part of a batch."""
+        queue = self._ensure_worker()
+        fut = asyncio.get_running_loop().create_future()
+        await queue.put((text, fut))
+        return await fut
+
+    async def submit_many(self, texts: list[str]) -> list[ModelRes]:
+        """Process several texts, keeping their order in the result."""
+        return list(await asyncio.gather(*[self.submit(text) for text in texts]))
+
+    async def _collect(self, queue: asyncio.Queue) -> list[tuple[str, asyncio.Future]]:
+        items = [await queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(items) < self.max_batch_size:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                items.append(await asyncio.wait_for(queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return items
+
+    async def _process(self, items: list[tuple[str, asyncio.Future]]):
+        texts = [text for text, _ in items]
+        logger.debug(f"Batch size: {len(texts)}")
+        try:
+            try:
+                results = await self.batch_func(texts)
+            except Exception:
+                if len(items) == 1:
+                    raise
+                # a failing batch is retried text by text, so a bad message
+                # only fails its own request
+                await self._process_each(items)
+                return
+        except Exception as exc:
+            for _, fut in items:
+                if not fut.done():
+                    fut.set_exception(exc)
+            return
+        finally:
+            self._slots.release()
+        for (_, fut), res in zip(items, results):
+            if not fut.done():
+                fut.set_result(res)
+
+    async def _process_each(self, items: list[tuple[str, asyncio.Future]]):
+        for text, fut in items:
+            if fut.done():
+                continue
+            try:
+                res = (await self.batch_func([text]))[0]
+            except Exception as exc:
+                if not fut.done():
+                    fut.set_exception(exc)
+                continue
+            if not fut.done():
+                fut.set_result(res)
+
+    async def _run(self):
+        queue = self._queue
+        tasks = set()
+        while True:
+            # wait for a free slot, meanwhile requests accumulate in the queue
+            await self._slots.acquire()
+            items = await self._collect(queue)
+            items = [(text, fut) for text, fut in items if not fut.cancelled()]
+            if not items:
+                self._slots.release()
+                continue
+            task = asyncio.create_task(self._process(items))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+
+    async def close(self):
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
@@ -0,0 +1,30 @@
+"""Inputs of the stage benchmarks besides the `focus.samples` messages.
+
+`synthetic_entities` stands in for the NER model, so the stages after it
+can be measured without models.
+"""
+import re
+from typing import Any
+
+
+SIZES = (200, 2_000, 20_000, 200_000)
+
+
+ENTITY_RE = re.compile(
+    r"(?P<greetings>Добрый день!?|Здравствуйте!?)"
+    r"|(?P<corp_info>С уважением[^\n]*)"
+    r"|(?P<card>\b(?:7825|9000)(?: ?\d{4}){3}\b)"
+    r"|(?P<phone>\b[78]\d{10}\b)"
+    r"|(?P<azs>АЗС №?\s?\d+)"
+    r"|(?P<trk>колонка \d+|\w+ колонка)"
+    r"|(?P<fuel>АИ-\d{2,3}|дизель)"
+    r"|(?P<tech_info>https?://\S+)"
+)
+
+
+def synthetic_entities(text: str) -> list[dict[str, Any]]:
+    """NER-like entities of `text`: sorted, not overlapping."""
+    return [
+        {"beg": m.start(), "end": m.end(), "cat": m.lastgroup}
+        for m in ENTITY_RE.finditer(text)
+    ]
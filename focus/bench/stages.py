@@ -0,0 +1,160 @@
+"""Microbenchmarks of the model-free handler stages on synthetic messages.
+
+Every stage is timed on `focus.samples` messages of every pattern and size
+of `corpus.SIZES`: the pattern classifier and the parser of the pattern
+on the message, field extraction, target text and `clear_text` on the parsed
+text, the `txt_lab` operations on the whole message. NER entities are
+synthetic, see `corpus.synthetic_entities`.
+
+Results are written as JSON. With `--baseline` the run is compared with a
+previous results file and the command fails if any stage is slower than the
+baseline by more than `--threshold`.
+
+Usage:
+    python -m focus.bench.stages [--out bench.json] [--baseline baseline.json]
+        [--patterns OTRS UDC] [--sizes 200 2000] [--stages clear_text]
+"""
+import argparse
+import json
+import platform
+import statistics
+import sys
+import time
+import timeit
+from dataclasses import asdict, dataclass
+from typing import Any, Callable, Optional
+
+from focus import txt_lab, version
+from focus.bench.corpus import SIZES, synthetic_entities
+from focus.modules.alg_parser import PARSERS, parse_msg
+from focus.modules.cls_clear_text import clear_text
+from focus.modules.field import extract_fields
+from focus.modules.pattern_cls import PAT_CLS_UNITS, pattern_classifier
+from focus.modules.target_text import extract_target_text, form_tlab
+from focus.samples import PATTERNS, message
+
+
+@dataclass
+class BenchResult:
+    stage: str
+    pattern: str
+    size: int
+    chars: int
+    loops: int
+    min_s: float
+    median_s: float
+
+
+def stage_calls(pattern: str, msg: str) -> dict[str, Callable[[], Any]]:
+    """Benchmarked calls of every stage on `msg` by stage name."""
+    alg_text, alg_fields = parse_msg(pattern, msg)
+    ents = synthetic_entities(alg_text)
+    target_text, _ = extract_target_text(alg_text, ents)
+    msg_tlab = form_tlab(msg, synthetic_entities(msg))
+    msg_lines = txt_lab.split_by_symbol(msg_tlab, "\n")
+    line_ends = [i for i, char in enumerate(msg) if char == "\n"]
+    calls = {
+        "pattern_classifier": lambda: pattern_classifier(msg, PAT_CLS_UNITS),
+        "extract_fields": lambda: extract_fields(alg_text, ents, alg_fields),
+        "extract_target_text": lambda: extract_target_text(alg_text, ents),
+        "clear_text": lambda: clear_text(target_text),
+        "txt_lab.split_by_symbol": lambda: txt_lab.split_by_symbol(msg_tlab, "\n"),
+        "txt_lab.split_by_indices": lambda: txt_lab.split_by_indices(msg_tlab, line_ends),
+        "txt_lab.concat_list": lambda: txt_lab.concat_list(msg_lines, " "),
+        "txt_lab.drop_cats": lambda: txt_lab.drop_cats(msg_tlab, {"greetings", "corp_info", "tech_info"}),
+    }
+    if pattern in PARSERS:
+        calls["parse"] = lambda: PARSERS[pattern](msg)
+    return calls
+
+
+def measure(func: Callable[[], Any], rounds: int, min_time: float) -> tuple[int, float, float]:
+    """Loops per round and the min and median seconds per call over `rounds`."""
+    timer = timeit.Timer(func)
+    loops = 1
+    while timer.timeit(loops) < min_time:
+        loops *= 2
+    times = [t / loops for t in timer.repeat(rounds, loops)]
+    return loops, min(times), statistics.median(times)
+
+
+def run(
+        patterns: list[str],
+        sizes: list[int],
+        stages: Optional[list[str]],
+        rounds: int,
+        min_time: float,
+    ) -> list[BenchResult]:
+    results = []
+    for pattern in patterns:
+        for size in sizes:
+            msg = message(pattern, size)
+            for stage, func in stage_calls(pattern, msg).items():
+                if stages and stage not in stages:
+                    continue
+                loops, min_s, median_s = measure(func, rounds, min_time)
+                res = BenchResult(stage, pattern, size, len(msg), loops, min_s, median_s)
+                results.append(res)
+                print(f"{stage:>24} {pattern:>15} {len(msg):>8} chars: {median_s * 1e3:10.4f} ms", flush=True)
+    return results
+
+
+def compare(
+        results: list[dict[str, Any]],
+        baseline: list[dict[str, Any]],
+        threshold: float,
+    ) -> list[tuple[dict[str, Any], float]]:
+    """Print median ratios to the baseline, return the regressed results and ratios."""
+    base = {(res["stage"], res["pattern"], res["size"]): res for res in baseline}
+    regressions = []
+    for res in results:
+        key = (res["stage"], res["pattern"], res["size"])
+        if key not in base:
+            print(f"{' / '.join(map(str, key))}: not in baseline")
+            continue
+        ratio = res["median_s"] / base[key]["median_s"]
+        flag = "REGRESSION" if ratio > 1 + threshold else ""
+        print(f"{res['stage']:>24} {res['pattern']:>15} {res['size']:>8}: x{ratio:6.2f} {flag}")
+        if flag:
+            regressions.append((res, ratio))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument("--out", default="bench.json", help="results JSON")
+    parser.add_argument("--baseline", default=None, help="results JSON to compare with")
+    parser.add_argument("--threshold", type=float, default=0.2, help="allowed slowdown, 0.2 is 20%%")
+    parser.add_argument("--patterns", nargs="+", default=list(PATTERNS), choices=PATTERNS)
+    parser.add_argument("--sizes", nargs="+", type=int, default=list(SIZES))
+    parser.add_argument("--stages", nargs="+", default=None, help="default: all stages")
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--min-time", type=float, default=0.05, help="seconds per round")
+    args = parser.parse_args()
+
+    results = run(args.patterns, args.sizes, args.stages, args.rounds, args.min_time)
+    report = {
+        "meta": {
+            "version": version,
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "processor": platform.processor(),
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "rounds": args.rounds,
+        },
+        "results": [asdict(res) for res in results],
+    }
+    with open(args.out, "w", encoding="utf-8") as out_file:
+        json.dump(report, out_file, ensure_ascii=False, indent=1)
+
+    if args.baseline is not None:
+        with open(args.baseline, "r", encoding="utf-8") as base_file:
+            baseline = json.load(base_file)["results"]
+        regressions = compare(report["results"], baseline, args.threshold)
+        if regressions:
+            print(f"{len(regressions)} regressions over {args.threshold:.0%}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,317 @@
+"""Offline inference over an export of messages.
+
+Rows are streamed from xlsx (first row is the header), CSV or JSONL and
+processed by a pool of worker processes, each with its own handler. Output
+rows keep the input order and columns, followed by the model fields, the
+row error if any and the processing time. Input columns named like these
+result columns are rejected, `--result-prefix` renames the result columns.
+The output format is chosen by the file extension.
+
+Usage:
+    python -m focus.bulk input.xlsx output.xlsx [--text-column text] [--workers 4]
+        [--result-prefix model_]
+"""
+import abc
+import argparse
+import csv
+import json
+import os
+import time
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from itertools import islice
+from typing import Any, Iterable, Iterator, Optional
+
+from loguru import logger
+
+from focus.log import setup_logging
+from focus.modules.handler import ExtrClsHandler
+
+
+RESULT_COLUMNS = ["card", "azs", "trk", "fuel", "topic", "sub", "error", "elapsed_ms"]
+FORMATS = (".xlsx", ".csv", ".jsonl")
+
+Row = dict[str, Any]
+
+
+def file_format(path: str) -> str:
+    ext = os.path.splitext(path)[1].lower()
+    if ext not in FORMATS:
+        raise ValueError(f"Unsupported file format: {path}. Available: {FORMATS}")
+    return ext
+
+
+def read_xlsx(path: str) -> Iterator[Row]:
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(path, read_only=True, data_only=True)
+    try:
+        rows = workbook.active.iter_rows(values_only=True)
+        header = next(rows, None) or ()
+        columns = [str(col) if col is not None else f"column_{i}" for i, col in enumerate(header)]
+        for values in rows:
+            yield {
+                col: (values[i] if i < len(values) and values[i] is not None else "")
+                for i, col in enumerate(columns)
+            }
+    finally:
+        workbook.close()
+
+
+def read_csv(path: str) -> Iterator[Row]:
+    with open(path, "r", encoding="utf-8-sig", newline="") as csv_file:
+        yield from csv.DictReader(csv_file)
+
+
+def read_jsonl(path: str) -> Iterator[Row]:
+    with open(path, "r", encoding="utf-8") as jsonl_file:
+        for line in jsonl_file:
+            if line.strip():
+                yield json.loads(line)
+
+
+READERS = {".xlsx": read_xlsx, ".csv": read_csv, ".jsonl": read_jsonl}
+
+
+def read_rows(path: str) -> Iterator[Row]:
+    return READERS[file_format(path)](path)
+
+
+class RowWriter(abc.ABC):
+    """Writes rows as they come, the columns are taken from the first row.
+
+    Writers with a header (`fixed_columns`) reject rows with columns that
+    are not in it, rather than dropping their values.
+    """
+    fixed_columns = True
+
+    def __init__(self, path: str):
+        self.path = path
+        self.columns: Optional[list[str]] = None
+        self._column_set: set[str] = set()
+
+    def write(self, row: Row):
+        if self.columns is None:
+            self.columns = list(row)
+            self._column_set = set(self.columns)
+            self._header()
+        elif self.fixed_columns and not self._column_set.issuperset(row):
+            extra = [col for col in row if col not in self._column_set]
+            raise ValueError(f"Row columns {extra} are not in the header {self.columns}, write jsonl instead")
+        self._write(row)
+
+    def flush(self):
+        pass
+
+    def close(self):
+        pass
+
+    def _header(self):
+        pass
+
+    @abc.abstractmethod
+    def _write(self, row: Row):
+        """Write `row` after the header."""
+
+    def __enter__(self) -> "RowWriter":
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class CsvWriter(RowWriter):
+    def __init__(self, path: str):
+        super().__init__(path)
+        self._file = open(path, "w", encoding="utf-8", newline="")
+        self._writer: Optional[csv.DictWriter] = None
+
+    def _header(self):
+        self._writer = csv.DictWriter(self._file, self.columns, restval="")
+        self._writer.writeheader()
+
+    def _write(self, row: Row):
+        self._writer.writerow(row)
+
+    def flush(self):
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+
+class JsonlWriter(RowWriter):
+    fixed_columns = False
+
+    def __init__(self, path: str):
+        super().__init__(path)
+        self._file = open(path, "w", encoding="utf-8")
+
+    def _write(self, row: Row):
+        self._file.write(json.dumps(row, ensure_ascii=False, default=str) + "\n")
+
+    def flush(self):
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+
+class XlsxWriter(RowWriter):
+    """Write-only workbook, rows are streamed to disk and the file is saved on close."""
+
+    def __init__(self, path: str):
+        from openpyxl import Workbook
+
+        super().__init__(path)
+        self._workbook = Workbook(write_only=True)
+        self._sheet = self._workbook.create_sheet()
+
+    def _header(self):
+        self._sheet.append(self.columns)
+
+    def _write(self, row: Row):
+        self._sheet.append([row.get(col, "") for col in self.columns])
+
+    def close(self):
+        self._workbook.save(self.path)
+        self._workbook.close()
+
+
+WRITERS = {".xlsx": XlsxWriter, ".csv": CsvWriter, ".jsonl": JsonlWriter}
+
+
+def open_writer(path: str) -> RowWriter:
+    return WRITERS[file_format(path)](path)
+
+
+# Worker processes hold their own handler
+_bulk_handler: Optional[ExtrClsHandler] = None
+
+
+def _init_bulk_worker(torch_threads: int):
+    global _bulk_handler
+    import torch
+
+    torch.set_num_threads(torch_threads)
+    _bulk_handler = ExtrClsHandler()
+
+
+def process_texts(handler: ExtrClsHandler, texts: list[str]) -> list[Row]:
+    """Model fields, error and elapsed time of each text.
+
+    Texts are processed as one batch, a failing batch is retried text by text
+    to isolate the failing rows.
+    """
+    start = time.perf_counter()
+    try:
+        models_res = handler.batch(texts)
+    except Exception:
+        return [process_text(handler, text) for text in texts]
+    elapsed_ms = (time.perf_counter() - start) * 1000 / max(len(texts), 1)
+    return [
+        {**model_res.model_dump(), "error": "", "elapsed_ms": round(elapsed_ms, 1)}
+        for model_res in models_res
+    ]
+
+
+def process_text(handler: ExtrClsHandler, text: str) -> Row:
+    start = time.perf_counter()
+    try:
+        res = {**handler(text).model_dump(), "error": ""}
+    except Exception as exc:
+        res = {col: "" for col in RESULT_COLUMNS}
+        res["error"] = f"{type(exc).__name__}: {exc}"
+    res["elapsed_ms"] = round((time.perf_counter() - start) * 1000, 1)
+    return res
+
+
+def _process_texts(texts: list[str]) -> list[Row]:
+    return process_texts(_bulk_handler, texts)
+
+
+def chunked(rows: Iterable[Row], size: int) -> Iterator[list[Row]]:
+    rows = iter(rows)
+    while chunk := list(islice(rows, size)):
+        yield chunk
+
+
+def run_bulk(
+        rows: Iterable[Row],
+        writer: RowWriter,
+        text_column: str,
+        workers: int,
+        chunk_size: int,
+        torch_threads: int,
+        result_prefix: str = "",
+    ) -> int:
+    """Process `rows` and write them in input order. Return the number of rows.
+
+    Result columns are named `result_prefix` + `RESULT_COLUMNS`, raise
+    ValueError if a row already has such a column or has no `text_column`. At most two chunks per
+    worker are in flight, so memory does not depend on the number of rows.
+    """
+    result_columns = {col: f"{result_prefix}{col}" for col in RESULT_COLUMNS}
+    result_names = set(result_columns.values())
+    window: deque[tuple[list[Row], Future]] = deque()
+    n_rows = 0
+    start = time.perf_counter()
+
+    def write_next():
+        nonlocal n_rows
+        chunk, future = window.popleft()
+        for row, res in zip(chunk, future.result()):
+            writer.write({**row, **{result_columns[col]: value for col, value in res.items()}})
+        writer.flush()
+        n_rows += len(chunk)
+        logger.warning(f"Rows: {n_rows}, {n_rows / (time.perf_counter() - start):.1f} rows/s")
+
+    n_read = 0
+    with ProcessPoolExecutor(workers, initializer=_init_bulk_worker, initargs=(torch_threads,)) as pool:
+        for chunk in chunked(rows, chunk_size):
+            for row in chunk:
+                n_read += 1
+                if text_column not in row:
+                    raise ValueError(f"Row {n_read} has no {text_column!r} column, columns: {list(row)}")
+                if not result_names.isdisjoint(row):
+                    raise ValueError(
+                        f"Input columns {sorted(result_names.intersection(row))} would be overwritten "
+                        "by the results, set --result-prefix"
+                    )
+            texts = [str(row[text_column]) for row in chunk]
+            window.append((chunk, pool.submit(_process_texts, texts)))
+            if len(window) >= 2 * workers:
+                write_next()
+        while window:
+            write_next()
+    return n_rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument("input", help="xlsx, csv or jsonl file")
+    parser.add_argument("output", help="xlsx, csv or jsonl file")
+    parser.add_argument("--text-column", default="text")
+    parser.add_argument("--workers", type=int, default=max(1, (os.cpu_count() or 1) // 2))
+    parser.add_argument("--chunk-size", type=int, default=16, help="rows per worker task")
+    parser.add_argument("--torch-threads", type=int, default=None, help="per worker, default: cpus / workers")
+    parser.add_argument("--result-prefix", default="", help="prefix of the result column names")
+    args = parser.parse_args()
+    setup_logging()
+    torch_threads = args.torch_threads or max(1, (os.cpu_count() or 1) // args.workers)
+    file_format(args.input)
+    with open_writer(args.output) as writer:
+        n_rows = run_bulk(
+            read_rows(args.input),
+            writer,
+            args.text_column,
+            args.workers,
+            args.chunk_size,
+            torch_threads,
+            args.result_prefix,
+        )
+    logger.warning(f"Done: {n_rows} rows -> {args.output}")
+
+
+if __name__ == "__main__":
+    main()
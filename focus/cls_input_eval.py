@@ -0,0 +1,129 @@
+"""Compare classifier input modes on a corpus.
+
+For every mode reports the classifier input tokens, the classification
+latency per message and the agreement of topic and topic+subtopic labels
+with the raw message input. Corpus is a JSONL file with a "text" field per
+line; messages the stage plans do not classify are skipped.
+
+Usage:
+    python -m focus.cls_input_eval corpus.jsonl [--budgets 128 256] [--out eval.json]
+"""
+import argparse
+import json
+import statistics
+import time
+from dataclasses import asdict, dataclass
+from typing import Optional
+
+from loguru import logger
+
+from focus.modules.cls_input import cls_input
+from focus.modules.handler import CLS_INPUT_HEAD_SHARE, ExtrClsHandler
+from focus.modules.stage_plan import get_plan
+from focus.parity import read_texts
+
+
+@dataclass
+class ModeReport:
+    mode: str
+    n_texts: int
+    mean_tokens: float
+    mean_ms: float
+    p50_ms: float
+    p95_ms: float
+    topic_agreement: float
+    label_agreement: float
+
+
+def target_texts(handler: ExtrClsHandler, texts: list[str]) -> list[tuple[str, str]]:
+    """(message, cleared target text) of the messages the handler classifies."""
+    res = []
+    for text in texts:
+        pat_name, alg_text, alg_fields = handler._parse(text)
+        run_ner, run_cls = get_plan(pat_name).stages(alg_text)
+        if not run_cls:
+            continue
+        ner_res = handler.ner_pipe(alg_text) if run_ner else []
+        _, target_text = handler._extract(alg_text, alg_fields, ner_res)
+        res.append((text, target_text))
+    return res
+
+
+def evaluate(
+        handler: ExtrClsHandler,
+        samples: list[tuple[str, str]],
+        mode: str,
+        max_tokens: int,
+        head_share: float,
+    ) -> tuple[list[tuple[str, str]], list[float], list[int]]:
+    """Labels, latencies in ms and input tokens of every sample."""
+    tokenizer = handler.cls_pipe.topic_pipe.tokenizer
+    labels, latencies, n_tokens = [], [], []
+    for text, target_text in samples:
+        start = time.perf_counter()
+        cls_text = cls_input(mode, text, target_text, tokenizer, max_tokens, head_share)
+        labels.append(handler.cls_pipe.inf(cls_text))
+        latencies.append((time.perf_counter() - start) * 1000)
+        n_tokens.append(len(tokenizer(cls_text, truncation=True)["input_ids"]))
+    return labels, latencies, n_tokens
+
+
+def report(
+        name: str,
+        labels: list[tuple[str, str]],
+        latencies: list[float],
+        n_tokens: list[int],
+        raw_labels: list[tuple[str, str]],
+    ) -> ModeReport:
+    n = max(len(labels), 1)
+    return ModeReport(
+        mode=name,
+        n_texts=len(labels),
+        mean_tokens=statistics.fmean(n_tokens) if n_tokens else 0.0,
+        mean_ms=statistics.fmean(latencies) if latencies else 0.0,
+        p50_ms=statistics.median(latencies) if latencies else 0.0,
+        p95_ms=sorted(latencies)[int(0.95 * (len(latencies) - 1))] if latencies else 0.0,
+        topic_agreement=sum(a[0] == b[0] for a, b in zip(labels, raw_labels)) / n,
+        label_agreement=sum(a == b for a, b in zip(labels, raw_labels)) / n,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument("corpus", help="JSONL file with a \"text\" field per line")
+    parser.add_argument("--budgets", nargs="+", type=int, default=[128, 256], help="token budgets of the budget mode")
+    parser.add_argument("--head-share", type=float, default=CLS_INPUT_HEAD_SHARE)
+    parser.add_argument("--limit", type=int, default=None, help="first texts of the corpus only")
+    parser.add_argument("--out", default=None, help="reports JSON")
+    args = parser.parse_args()
+
+    handler = ExtrClsHandler(cache=None)
+    texts = list(read_texts(args.corpus))[:args.limit]
+    samples = target_texts(handler, texts)
+    logger.warning(f"{len(samples)} of {len(texts)} texts are classified")
+
+    modes: list[tuple[str, str, Optional[int]]] = [("raw", "raw", None), ("target", "target", None)]
+    modes.extend((f"budget-{budget}", "budget", budget) for budget in args.budgets)
+    # warm up the models before timing
+    evaluate(handler, samples[:4], "raw", 0, args.head_share)
+    raw_labels: list[tuple[str, str]] = []
+    reports = []
+    for name, mode, budget in modes:
+        labels, latencies, n_tokens = evaluate(handler, samples, mode, budget or 0, args.head_share)
+        if mode == "raw":
+            raw_labels = labels
+        reports.append(report(name, labels, latencies, n_tokens, raw_labels))
+
+    print(f"{'mode':>12} {'texts':>6} {'tokens':>7} {'mean ms':>8} {'p50 ms':>8} {'p95 ms':>8} {'topic':>6} {'labels':>6}")
+    for rep in reports:
+        print(
+            f"{rep.mode:>12} {rep.n_texts:>6} {rep.mean_tokens:>7.1f} {rep.mean_ms:>8.2f} {rep.p50_ms:>8.2f} "
+            f"{rep.p95_ms:>8.2f} {rep.topic_agreement:>6.1%} {rep.label_agreement:>6.1%}"
+        )
+    if args.out is not None:
+        with open(args.out, "w", encoding="utf-8") as out_file:
+            json.dump([asdict(rep) for rep in reports], out_file, ensure_ascii=False, indent=1)
+
+
+if __name__ == "__main__":
+    main()
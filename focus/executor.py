@@ -0,0 +1,173 @@
+import asyncio
+import threading
+from contextlib import asynccontextmanager, contextmanager
+from concurrent.futures import Executor, ThreadPoolExecutor, ProcessPoolExecutor
+from typing import AsyncIterator, Callable, Iterator, Optional
+
+from focus import ModelRes, metrics
+from focus.modules.handler import ExtrClsHandler
+
+
+HandlerFactory = Callable[[], ExtrClsHandler]
+
+EXECUTOR_KINDS = {"thread", "process"}
+
+
+class Overloaded(Exception):
+    """Raised when the inference queue is full."""
+
+
+class BatchTooLarge(ValueError):
+    """Raised when more texts are submitted at once than the queue can ever admit."""
+
+
+# Process pool workers hold their own handler
+_worker_handler: Optional[ExtrClsHandler] = None
+
+
+def _init_worker(handler_factory: HandlerFactory):
+    global _worker_handler
+    _worker_handler = handler_factory()
+
+
+def _worker_batch(texts: list[str]) -> list[ModelRes]:
+    return _worker_handler.batch(texts)
+
+
+def _worker_warm_up(texts: list[str]):
+    _worker_handler.warm_up(texts)
+
+
+class InferenceExecutor:
+    """Runs blocking handler calls off the event loop with bounded admission.
+
+    `kind="thread"` shares one handler between `workers` threads,
+    `kind="process"` builds a handler in each of `workers` processes.
+    At most `queue_limit` texts may be admitted at once, the rest are
+    rejected with `Overloaded`. A request of more than `queue_limit` texts
+    could never be admitted and is rejected with `BatchTooLarge`.
+    """
+
+    def __init__(
+            self,
+            handler_factory: HandlerFactory,
+            kind: str,
+            workers: int,
+            queue_limit: int,
+        ):
+        if kind not in EXECUTOR_KINDS:
+            raise ValueError(f"Unknown executor kind: {kind}")
+        self.kind = kind
+        self.workers = workers
+        self.queue_limit = queue_limit
+        self.handler: Optional[ExtrClsHandler] = None
+        self._pool: Executor
+        if kind == "thread":
+            self.handler = handler_factory()
+            self._pool = ThreadPoolExecutor(workers, thread_name_prefix="inference")
+        else:
+            self._pool = ProcessPoolExecutor(
+                workers,
+                initializer=_init_worker,
+                initargs=(handler_factory,),
+            )
+        self._pending = 0
+        self._lock = threading.Lock()
+        # streamed texts waiting for room, woken up when admitted texts are done
+        self._room: Optional[asyncio.Condition] = None
+        self._room_loop: Optional[asyncio.AbstractEventLoop] = None
+        self._waiting = 0
+
+    @property
+    def pending(self) -> int:
+        """Number of admitted texts that are not processed yet."""
+        return self._pending
+
+    @contextmanager
+    def admission(self, n: int = 1) -> Iterator[None]:
+        """Admit `n` texts for processing or raise `Overloaded`."""
+        self._check_size(n)
+        if not self._try_admit(n):
+            metrics.REJECTED.inc(n)
+            raise Overloaded(
+                f"Inference queue is full: {self._pending} pending, limit {self.queue_limit}"
+            )
+        with self._admitted(n):
+            yield
+
+    @asynccontextmanager
+    async def wait_admission(self, n: int = 1) -> AsyncIterator[None]:
+        """Admit `n` texts for processing once the queue has room for them."""
+        self._check_size(n)
+        if not self._try_admit(n):
+            room = self._room_condition()
+            self._waiting += 1
+            try:
+                async with room:
+                    await room.wait_for(lambda: self._try_admit(n))
+            finally:
+                self._waiting -= 1
+        with self._admitted(n):
+            yield
+
+    def _check_size(self, n: int):
+        if n > self.queue_limit:
+            raise BatchTooLarge(f"{n} texts submitted at once, limit {self.queue_limit}")
+
+    def _try_admit(self, n: int) -> bool:
+        with self._lock:
+            if self._pending + n > self.queue_limit:
+                return False
+            self._pending += n
+            return True
+
+    def _room_condition(self) -> asyncio.Condition:
+        loop = asyncio.get_running_loop()
+        if self._room is None or self._room_loop is not loop:
+            self._room = asyncio.Condition()
+            self._room_loop = loop
+        return self._room
+
+    async def _notify_room(self):
+        room = self._room
+        if room is not None:
+            async with room:
+                room.notify_all()
+
+    @contextmanager
+    def _admitted(self, n: int) -> Iterator[None]:
+        metrics.QUEUE_DEPTH.inc(n)
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._pending -= n
+            metrics.QUEUE_DEPTH.dec(n)
+            if self._waiting:
+                # admission may be released outside of the waiters' loop
+                self._room_loop.call_soon_threadsafe(self._room_loop.create_task, self._notify_room())
+
+    def _batch_func(self) -> Callable[[list[str]], list[ModelRes]]:
+        if self.handler is not None:
+            return self.handler.batch
+        return _worker_batch
+
+    async def run_batch(self, texts: list[str]) -> list[ModelRes]:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._pool, self._batch_func(), texts)
+
+    def warm_up(self, texts: list[str]):
+        """Run `texts` through the handlers, blocking.
+
+        Process workers build their handlers on the first task, one warm-up
+        task is sent per worker, so usually every worker gets one.
+        """
+        if self.handler is not None:
+            self.handler.warm_up(texts)
+            return
+        futures = [self._pool.submit(_worker_warm_up, texts) for _ in range(self.workers)]
+        for future in futures:
+            future.result()
+
+    def shutdown(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,94 @@
+"""Export NER and classification checkpoints for the ONNX Runtime backends.
+
+Usage:
+    python -m focus.export [--backends onnx int8] [--opset 17]
+"""
+import argparse
+import os
+
+import torch
+from loguru import logger
+from transformers import (
+    AutoModelForSequenceClassification as AMFSC,
+    AutoModelForTokenClassification as AMFTC,
+    AutoTokenizer,
+)
+
+from focus.modules.backend import ONNX_FILES, onnx_path
+from focus.modules.handler import NER_MODEL_P
+from focus.modules.cls_cfg import (
+    TOPT_TOKENIZER_PATH,
+    TOPT_MODELS_PATHS,
+    SUBT_TOKENIZER_PATH,
+    SUBT_MODELS_PATHS,
+)
+
+
+class _LogitsWrapper(torch.nn.Module):
+    """Positional inputs in tokenizer order, logits as the only output."""
+
+    def __init__(self, model: torch.nn.Module, input_names: list[str]):
+        super().__init__()
+        self.model = model
+        self.input_names = input_names
+
+    def forward(self, *inputs: torch.Tensor) -> torch.Tensor:
+        return self.model(**dict(zip(self.input_names, inputs))).logits
+
+
+def export_onnx(model_cls, model_p: str, tokenizer_p: str, opset: int):
+    tokenizer = AutoTokenizer.from_pretrained(tokenizer_p)
+    model = model_cls.from_pretrained(model_p)
+    model.eval()
+    dummy = tokenizer(["Пример текста", "Еще один пример текста"], padding=True, return_tensors="pt")
+    input_names = list(dummy.keys())
+    dst = onnx_path(model_p, "onnx")
+    torch.onnx.export(
+        _LogitsWrapper(model, input_names),
+        tuple(dummy[name] for name in input_names),
+        dst,
+        input_names=input_names,
+        output_names=["logits"],
+        dynamic_axes={
+            **{name: {0: "batch", 1: "sequence"} for name in input_names},
+            "logits": {0: "batch", 1: "sequence"} if model_cls is AMFTC else {0: "batch"},
+        },
+        opset_version=opset,
+        dynamo=False,
+    )
+    logger.warning(f"Exported: {dst}")
+
+
+def quantize_int8(model_p: str):
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    dst = onnx_path(model_p, "int8")
+    quantize_dynamic(onnx_path(model_p, "onnx"), dst, weight_type=QuantType.QInt8)
+    logger.warning(f"Quantized: {dst}")
+
+
+def export_models() -> list[tuple]:
+    """(model class, checkpoint, tokenizer) for every model used by the handler."""
+    models = [(AMFTC, NER_MODEL_P, NER_MODEL_P)]
+    for paths in TOPT_MODELS_PATHS.values():
+        models.append((AMFSC, paths["model"], TOPT_TOKENIZER_PATH))
+    for paths in SUBT_MODELS_PATHS.values():
+        models.append((AMFSC, paths["model"], SUBT_TOKENIZER_PATH))
+    return models
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument("--backends", nargs="+", choices=list(ONNX_FILES), default=list(ONNX_FILES))
+    parser.add_argument("--opset", type=int, default=17)
+    args = parser.parse_args()
+    for model_cls, model_p, tokenizer_p in export_models():
+        # int8 is quantized from the fp32 ONNX graph
+        if not os.path.exists(onnx_path(model_p, "onnx")) or "onnx" in args.backends:
+            export_onnx(model_cls, model_p, tokenizer_p, args.opset)
+        if "int8" in args.backends:
+            quantize_int8(model_p)
+
+
+if __name__ == "__main__":
+    main()
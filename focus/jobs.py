@@ -0,0 +1,431 @@
+"""Durable queue of asynchronous classification jobs.
+
+A job is a list of messages, posted as JSON or as an uploaded xlsx, CSV or
+JSONL export. Its messages are stored as items of a SQLite database and
+drained by local worker processes with a handler each, so a job survives
+restarts of the server and of the workers. A worker claims a chunk of items
+under a lease with a fresh claim token, renews the lease while it processes
+the chunk and commits the results only while it still holds the claim:
+items of a worker that died are claimed again once their lease expires, and
+a late result of an expired claim is dropped. Expired items are claimed
+again one at a time, so a message that crashes the worker does not use up
+the attempts of the rest of its chunk. An item claimed `max_attempts` times
+without a result gets an error result instead.
+
+Usage:
+    python -m focus.jobs [--workers 2] [--torch-threads 1]
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import signal
+import sqlite3
+import threading
+import time
+import uuid
+from dataclasses import asdict, dataclass
+from itertools import islice
+from typing import Any, AsyncIterator, Iterable, Iterator, Optional
+
+from loguru import logger
+
+from focus import (
+    JOBS_CLAIM_SIZE,
+    JOBS_DB_PATH,
+    JOBS_LEASE_S,
+    JOBS_MAX_ATTEMPTS,
+    JOBS_POLL_S,
+    JOBS_TTL_S,
+    JOBS_WORKERS,
+)
+from focus.bulk import RESULT_COLUMNS, Row, process_texts, read_rows
+from focus.log import setup_logging
+
+
+@dataclass
+class Job:
+    """Job progress: "queued" -> "running" -> "done"."""
+    job_id: str
+    status: str
+    n_items: int
+    n_done: int
+    created: float
+    finished: Optional[float]
+
+    def as_dict(self) -> dict[str, Any]:
+        return asdict(self)
+
+
+@dataclass
+class Item:
+    rowid: int
+    job_id: str
+    idx: int
+    text: str
+
+
+class JobStore:
+    """Jobs and their items in a SQLite database.
+
+    Every thread uses its own connection, the database is in WAL mode so
+    readers do not block the writer.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        conn = self._conn()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            "id TEXT PRIMARY KEY, status TEXT NOT NULL, n_items INTEGER NOT NULL, "
+            "n_done INTEGER NOT NULL DEFAULT 0, created REAL NOT NULL, finished REAL)"
+        )
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS items ("
+            "id INTEGER PRIMARY KEY, job_id TEXT NOT NULL, idx INTEGER NOT NULL, "
+            "req_id INTEGER, text TEXT NOT NULL, status TEXT NOT NULL DEFAULT 'queued', "
+            "claim TEXT, lease_until REAL, attempts INTEGER NOT NULL DEFAULT 0, result TEXT, "
+            "UNIQUE (job_id, idx))"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS items_status ON items (status, lease_until)")
+        conn.execute("CREATE INDEX IF NOT EXISTS jobs_finished ON jobs (finished)")
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _write(self, conn: sqlite3.Connection, func, *args):
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            res = func(conn, *args)
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return res
+
+    def create(self, messages: Iterable[tuple[Optional[int], str]], chunk_size: int = 10_000) -> Job:
+        """Job of (req_id, text) `messages`, its items appear at once with the job."""
+        job_id = uuid.uuid4().hex
+        now = time.time()
+
+        def insert(conn: sqlite3.Connection) -> int:
+            n_items = 0
+            messages_it = iter(messages)
+            while chunk := list(islice(messages_it, chunk_size)):
+                conn.executemany(
+                    "INSERT INTO items (job_id, idx, req_id, text) VALUES (?, ?, ?, ?)",
+                    [(job_id, n_items + i, req_id, text) for i, (req_id, text) in enumerate(chunk)],
+                )
+                n_items += len(chunk)
+            conn.execute(
+                "INSERT INTO jobs (id, status, n_items, created, finished) VALUES (?, ?, ?, ?, ?)",
+                (job_id, "done" if n_items == 0 else "queued", n_items, now, now if n_items == 0 else None),
+            )
+            return n_items
+
+        n_items = self._write(self._conn(), insert)
+        return Job(job_id, "done" if n_items == 0 else "queued", n_items, 0, now, None if n_items else now)
+
+    def get(self, job_id: str) -> Optional[Job]:
+        row = self._conn().execute(
+            "SELECT id, status, n_items, n_done, created, finished FROM jobs WHERE id = ?", (job_id,)
+        ).fetchone()
+        return None if row is None else Job(*row)
+
+    def results(self, job_id: str, offset: int, limit: int) -> list[Row]:
+        """Results of the done items with `offset` <= index < `offset` + `limit`."""
+        rows = self._conn().execute(
+            "SELECT idx, req_id, result FROM items "
+            "WHERE job_id = ? AND idx >= ? AND idx < ? AND status = 'done' ORDER BY idx",
+            (job_id, offset, offset + limit),
+        ).fetchall()
+        return [{"idx": idx, "req_id": req_id, **json.loads(result)} for idx, req_id, result in rows]
+
+    def claim(self, n: int, lease_s: float, max_attempts: int) -> tuple[str, list[Item]]:
+        """Claim token and up to `n` queued items, or a single expired one."""
+        token = uuid.uuid4().hex
+
+        def claim_items(conn: sqlite3.Connection) -> list[Item]:
+            now = time.time()
+            # items that took the worker down every time they were claimed
+            failed = [
+                rowid for rowid, in conn.execute(
+                    "SELECT id FROM items WHERE status = 'claimed' AND lease_until < ? AND attempts >= ?",
+                    (now, max_attempts),
+                )
+            ]
+            if failed:
+                self._finish(conn, [(rowid, _failed_result(max_attempts)) for rowid in failed])
+            # an expired item is retried alone, the message that crashed its
+            # worker is then the only one to fail again
+            rowids = [
+                rowid for rowid, in conn.execute(
+                    "SELECT id FROM items WHERE status = 'claimed' AND lease_until < ? ORDER BY id LIMIT 1",
+                    (now,),
+                )
+            ]
+            if not rowids:
+                rowids = [
+                    rowid for rowid, in conn.execute(
+                        "SELECT id FROM items WHERE status = 'queued' ORDER BY id LIMIT ?", (n,)
+                    )
+                ]
+            if not rowids:
+                return []
+            marks = ",".join("?" * len(rowids))
+            conn.execute(
+                f"UPDATE items SET status = 'claimed', claim = ?, lease_until = ?, "
+                f"attempts = attempts + 1 WHERE id IN ({marks})",
+                (token, now + lease_s, *rowids),
+            )
+            rows = conn.execute(
+                f"SELECT id, job_id, idx, text FROM items WHERE id IN ({marks}) ORDER BY id", rowids
+            ).fetchall()
+            conn.execute(
+                f"UPDATE jobs SET status = 'running' WHERE status = 'queued' AND id IN "
+                f"(SELECT DISTINCT job_id FROM items WHERE id IN ({marks}))",
+                rowids,
+            )
+            return [Item(*row) for row in rows]
+
+        return token, self._write(self._conn(), claim_items)
+
+    def renew(self, token: str, lease_s: float) -> int:
+        """Extend the lease of the items of claim `token`. Return their number."""
+
+        def extend(conn: sqlite3.Connection) -> int:
+            return conn.execute(
+                "UPDATE items SET lease_until = ? WHERE claim = ? AND status = 'claimed'",
+                (time.time() + lease_s, token),
+            ).rowcount
+
+        return self._write(self._conn(), extend)
+
+    def complete(self, token: str, results: list[tuple[int, Row]]) -> int:
+        """Store (item rowid, result) `results` of claim `token`. Return the
+        number stored: results of items claimed again since are dropped."""
+
+        def store(conn: sqlite3.Connection) -> int:
+            claimed = {
+                rowid for rowid, in conn.execute(
+                    "SELECT id FROM items WHERE claim = ? AND status = 'claimed'", (token,)
+                )
+            }
+            owned = [(rowid, res) for rowid, res in results if rowid in claimed]
+            self._finish(conn, owned)
+            return len(owned)
+
+        return self._write(self._conn(), store)
+
+    def _finish(self, conn: sqlite3.Connection, results: list[tuple[int, Row]]):
+        if not results:
+            return
+        # the text is not needed once the result is stored
+        conn.executemany(
+            "UPDATE items SET status = 'done', result = ?, text = '', claim = NULL, lease_until = NULL "
+            "WHERE id = ?",
+            [(json.dumps(res, ensure_ascii=False, default=str), rowid) for rowid, res in results],
+        )
+        marks = ",".join("?" * len(results))
+        counts = conn.execute(
+            f"SELECT job_id, COUNT(*) FROM items WHERE id IN ({marks}) GROUP BY job_id",
+            [rowid for rowid, _ in results],
+        ).fetchall()
+        now = time.time()
+        for job_id, n_done in counts:
+            conn.execute("UPDATE jobs SET n_done = n_done + ? WHERE id = ?", (n_done, job_id))
+            conn.execute(
+                "UPDATE jobs SET status = 'done', finished = ? WHERE id = ? AND n_done >= n_items",
+                (now, job_id),
+            )
+
+    def purge(self, ttl_s: float) -> int:
+        """Delete jobs finished more than `ttl_s` ago. Return the number deleted."""
+
+        def delete(conn: sqlite3.Connection) -> int:
+            job_ids = [
+                job_id for job_id, in conn.execute(
+                    "SELECT id FROM jobs WHERE finished < ?", (time.time() - ttl_s,)
+                )
+            ]
+            for job_id in job_ids:
+                conn.execute("DELETE FROM items WHERE job_id = ?", (job_id,))
+                conn.execute("DELETE FROM jobs WHERE id = ?", (job_id,))
+            return len(job_ids)
+
+        return self._write(self._conn(), delete)
+
+
+def _failed_result(attempts: int) -> Row:
+    res = {col: "" for col in RESULT_COLUMNS}
+    res["error"] = f"Worker failed on the message {attempts} times"
+    return res
+
+
+class UploadTooLarge(ValueError):
+    pass
+
+
+async def read_body(chunks: AsyncIterator[bytes], max_bytes: int) -> bytes:
+    """Request body of at most `max_bytes`."""
+    body = bytearray()
+    async for chunk in chunks:
+        body += chunk
+        if len(body) > max_bytes:
+            raise UploadTooLarge(f"Request body is larger than {max_bytes} bytes")
+    return bytes(body)
+
+
+async def save_upload(chunks: AsyncIterator[bytes], path: str, max_bytes: int) -> int:
+    """Write an uploaded body to `path`. Return its size in bytes."""
+    size = 0
+    with open(path, "wb") as upload_file:
+        async for chunk in chunks:
+            size += len(chunk)
+            if size > max_bytes:
+                raise UploadTooLarge(f"Upload is larger than {max_bytes} bytes")
+            upload_file.write(chunk)
+    return size
+
+
+def file_messages(path: str, text_column: str, id_column: Optional[str] = None) -> Iterator[tuple[Optional[int], str]]:
+    """(req_id, text) of the rows of an xlsx, CSV or JSONL file."""
+    for row in read_rows(path):
+        if text_column not in row:
+            raise ValueError(f"No {text_column!r} column, columns: {list(row)}")
+        req_id = row.get(id_column) if id_column is not None else None
+        yield (int(req_id) if req_id not in (None, "") else None), str(row[text_column])
+
+
+def work(
+        store: JobStore,
+        claim_size: int = JOBS_CLAIM_SIZE,
+        lease_s: float = JOBS_LEASE_S,
+        max_attempts: int = JOBS_MAX_ATTEMPTS,
+        poll_s: float = JOBS_POLL_S,
+        ttl_s: float = JOBS_TTL_S,
+        stop: Optional[threading.Event] = None,
+    ):
+    """Drain the queue until `stop` is set, loads its own handler."""
+    from focus.modules.handler import ExtrClsHandler
+
+    handler = ExtrClsHandler()
+    stop = stop or threading.Event()
+    last_purge = 0.0
+    while not stop.is_set():
+        token, items = store.claim(claim_size, lease_s, max_attempts)
+        if not items:
+            if time.monotonic() - last_purge >= 3600:
+                if n_purged := store.purge(ttl_s):
+                    logger.info(f"Purged {n_purged} finished jobs")
+                last_purge = time.monotonic()
+            stop.wait(poll_s)
+            continue
+        renewing = threading.Event()
+        renewer = threading.Thread(target=_renew_lease, args=(store, token, lease_s, renewing), daemon=True)
+        renewer.start()
+        try:
+            results = process_texts(handler, [item.text for item in items])
+        finally:
+            renewing.set()
+            renewer.join()
+        n_stored = store.complete(token, [(item.rowid, res) for item, res in zip(items, results)])
+        logger.info(f"Processed {len(items)} job items, stored {n_stored}")
+
+
+def _renew_lease(store: JobStore, token: str, lease_s: float, done: threading.Event):
+    # renewed well before expiry, a chunk longer than the lease is not claimed again
+    while not done.wait(lease_s / 3):
+        try:
+            store.renew(token, lease_s)
+        except sqlite3.Error:
+            logger.exception("Lease renewal failed")
+
+
+def _run_worker(path: str, torch_threads: int, claim_size: int, lease_s: float):
+    from focus.modules.backend import set_torch_threads
+
+    setup_logging()
+    set_torch_threads(torch_threads, None)
+    stop = threading.Event()
+    signal.signal(signal.SIGTERM, lambda signum, frame: stop.set())
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    work(JobStore(path), claim_size, lease_s, stop=stop)
+
+
+def serve_workers(workers: int, torch_threads: int, path: str, claim_size: int, lease_s: float):
+    """Run `workers` processes draining the queue, restart the ones that die."""
+    from focus.prefork import RestartBackoff
+
+    context = multiprocessing.get_context("spawn")
+    args = (path, torch_threads, claim_size, lease_s)
+
+    def start_worker() -> multiprocessing.Process:
+        proc = context.Process(target=_run_worker, args=args)
+        proc.start()
+        logger.info(f"Started job worker {proc.pid}, torch threads: {torch_threads}")
+        return proc
+
+    # start time by worker process
+    started = {start_worker(): time.monotonic() for _ in range(workers)}
+    restarts = RestartBackoff()
+    stopping = False
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for proc in list(started):
+            proc.terminate()
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    while started or (restarts.pending and not stopping):
+        for proc in list(started):
+            proc.join(0.5)
+            if proc.exitcode is None:
+                continue
+            ran_s = time.monotonic() - started.pop(proc)
+            if stopping:
+                continue
+            delay = restarts.failed(ran_s)
+            if delay is None:
+                logger.error(
+                    f"Job worker {proc.pid} exited with code {proc.exitcode}, "
+                    f"{restarts.max_restarts} restarts failed, stopping"
+                )
+                stop(signal.SIGTERM, None)
+                for other in started:
+                    other.join()
+                raise RuntimeError(f"Job workers keep exiting, gave up after {restarts.max_restarts} restarts")
+            logger.warning(f"Job worker {proc.pid} exited with code {proc.exitcode} after {ran_s:.0f} s, restarting in {delay:g} s")
+        if not stopping:
+            for _ in range(restarts.due()):
+                started[start_worker()] = time.monotonic()
+        if not started:
+            time.sleep(0.5)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument("--workers", type=int, default=JOBS_WORKERS)
+    parser.add_argument("--torch-threads", type=int, default=None, help="per worker, default: cpus / workers")
+    parser.add_argument("--db", default=JOBS_DB_PATH)
+    parser.add_argument("--claim-size", type=int, default=JOBS_CLAIM_SIZE, help="items per claim, one batch")
+    parser.add_argument("--lease-s", type=float, default=JOBS_LEASE_S)
+    args = parser.parse_args()
+    setup_logging()
+    torch_threads = args.torch_threads or max(1, (os.cpu_count() or 1) // args.workers)
+    JobStore(args.db)
+    serve_workers(args.workers, torch_threads, args.db, args.claim_size, args.lease_s)
+
+
+if __name__ == "__main__":
+    main()
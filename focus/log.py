@@ -0,0 +1,107 @@
+"""Structured logging of the handler stages.
+
+Stage payloads (input, parsed text, fields, NER output, target text) are
+logged for a sampled share of messages only, at the level of the stage,
+with long values truncated and card numbers, phones and emails masked.
+Every message gets one compact JSON summary line. `setup_logging` replaces
+the loguru sinks with an enqueued one, so the request path does not wait
+for the writes.
+"""
+import json
+import random
+import re
+import sys
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Iterator
+
+from loguru import logger
+
+from focus import (
+    LOG_ENQUEUE,
+    LOG_MAX_FIELD_CHARS,
+    LOG_MIN_LEVEL,
+    LOG_PAYLOAD_SAMPLE_RATE,
+    LOG_REDACT,
+    LOG_STAGE_LEVELS,
+    LOG_SUMMARY_LEVEL,
+)
+
+
+# 10 to 19 digits, possibly split by spaces or dashes: cards and phones
+DIGITS_RE = re.compile(r'(?<!\d)\d(?:[ -]?\d){9,18}(?!\d)')
+EMAIL_RE = re.compile(r'[\w.+-]+@[\w-]+(?:\.[\w-]+)+')
+
+# Set while the warm-up messages run through the handler
+_quiet: ContextVar[bool] = ContextVar("quiet", default=False)
+
+
+@contextmanager
+def quiet() -> Iterator[None]:
+    """Do not log the messages processed inside, neither payloads nor summaries."""
+    token = _quiet.set(True)
+    try:
+        yield
+    finally:
+        _quiet.reset(token)
+
+
+def setup_logging():
+    logger.remove()
+    logger.add(sys.stderr, level=LOG_MIN_LEVEL, enqueue=LOG_ENQUEUE)
+
+
+def _mask_digits(m: re.Match) -> str:
+    digits = re.sub(r'\D', '', m.group())
+    return "*" * (len(digits) - 4) + digits[-4:]
+
+
+def redact(text: str) -> str:
+    """Mask all but the last 4 digits of long numbers and whole emails."""
+    text = DIGITS_RE.sub(_mask_digits, text)
+    return EMAIL_RE.sub("<email>", text)
+
+
+def shorten(value: Any, max_chars: int = LOG_MAX_FIELD_CHARS) -> str:
+    """One-line value of at most `max_chars`, redacted if `LOG_REDACT`."""
+    text = value if isinstance(value, str) else json.dumps(value, ensure_ascii=False, default=str)
+    # redacted before truncation, so a number cut at the limit is not left partly visible
+    if LOG_REDACT:
+        text = redact(text)
+    if len(text) > max_chars:
+        text = f"{text[:max_chars]}...(+{len(text) - max_chars} chars)"
+    return text.replace("\n", "\\n")
+
+
+class MessageLog:
+    """Log of one message through the handler stages.
+
+    Whether the payloads of the message are logged is drawn once, so a
+    sampled message is logged at every stage.
+    """
+
+    def __init__(self, sample_rate: float = LOG_PAYLOAD_SAMPLE_RATE):
+        self.quiet = _quiet.get()
+        self.sampled = not self.quiet and random.random() < sample_rate
+        self.summary: dict[str, Any] = {}
+        self._start = time.perf_counter()
+
+    def payload(self, stage: str, **fields: Any):
+        """Log `fields` of `stage` if the message is sampled."""
+        if not self.sampled:
+            return
+        level = LOG_STAGE_LEVELS.get(stage, "DEBUG")
+        values = " ".join(f"{name}={shorten(value)}" for name, value in fields.items())
+        logger.log(level, f"[{stage}] {values}")
+
+    def note(self, **fields: Any):
+        """Add `fields` to the summary."""
+        self.summary.update(fields)
+
+    def done(self):
+        """Log the summary with the time since the message log was created."""
+        if self.quiet:
+            return
+        self.summary["ms"] = round((time.perf_counter() - self._start) * 1000, 2)
+        logger.log(LOG_SUMMARY_LEVEL, json.dumps(self.summary, ensure_ascii=False, separators=(",", ":")))
@@ -0,0 +1,117 @@
+"""Prometheus metrics of the service.
+
+Stages of the handler observe their latency per message, labelled with the
+message pattern. Batched stages observe the batch time divided by its size
+for every message of the batch.
+
+With several processes (process executor, several uvicorn workers) set the
+PROMETHEUS_MULTIPROC_DIR environment variable to an empty directory, then
+`/metrics` aggregates the metrics of all processes.
+"""
+import os
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Iterator, Sequence
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+
+
+STAGE_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+STAGE_SECONDS = Histogram(
+    "focus_stage_seconds",
+    "Processing time of a handler stage per message",
+    ["stage", "pattern"],
+    buckets=STAGE_BUCKETS,
+)
+PATTERNS = Counter("focus_pattern_total", "Messages by pattern", ["pattern"])
+PLANS = Counter("focus_plan_total", "Messages by pattern and model stages run", ["pattern", "stages"])
+INPUT_CHARS = Counter("focus_input_chars_total", "Characters of input messages")
+INPUT_TOKENS = Counter("focus_input_tokens_total", "Tokens fed to a model", ["model"])
+TRUNCATIONS = Counter("focus_truncations_total", "Inputs cut at the model max length", ["model"])
+REJECTED = Counter("focus_rejected_total", "Texts rejected with 503 on a full queue")
+RESULT_CACHE_LOOKUPS = Counter("focus_result_cache_total", "Result cache lookups", ["result"])
+QUEUE_DEPTH = Gauge(
+    "focus_queue_depth",
+    "Texts admitted and waiting or being processed",
+    multiprocess_mode="livesum",
+)
+IN_FLIGHT = Gauge(
+    "focus_requests_in_flight",
+    "HTTP requests being handled",
+    multiprocess_mode="livesum",
+)
+
+# Patterns of the messages processed in the current context, one per message
+_patterns: ContextVar[Sequence[str]] = ContextVar("patterns", default=())
+# Off while the warm-up messages run through the handler, they are not traffic
+_observing: ContextVar[bool] = ContextVar("observing", default=True)
+
+
+@contextmanager
+def paused() -> Iterator[None]:
+    """Skip the handler metrics of the messages processed inside."""
+    token = _observing.set(False)
+    try:
+        yield
+    finally:
+        _observing.reset(token)
+
+
+def observing() -> bool:
+    return _observing.get()
+
+
+@contextmanager
+def patterns(names: Sequence[str]) -> Iterator[None]:
+    """Label the stages timed inside with the message patterns."""
+    token = _patterns.set(names)
+    try:
+        yield
+    finally:
+        _patterns.reset(token)
+
+
+@contextmanager
+def stage_timer(stage: str) -> Iterator[None]:
+    """Observe the time of `stage` for every message of the current context."""
+    if not observing():
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        names = _patterns.get() or ("unknown",)
+        elapsed = (time.perf_counter() - start) / len(names)
+        for name in names:
+            STAGE_SECONDS.labels(stage, name).observe(elapsed)
+
+
+def observe_tokens(model: str, lengths: Sequence[int], n_truncated: int):
+    """Count input tokens and the `n_truncated` inputs cut at the max length."""
+    if not observing():
+        return
+    INPUT_TOKENS.labels(model).inc(sum(lengths))
+    if n_truncated:
+        TRUNCATIONS.labels(model).inc(n_truncated)
+
+
+def render() -> tuple[bytes, str]:
+    """Metrics in the Prometheus text format and its content type."""
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
@@ -1,42 +1,11 @@
 
 import re
+import string
+from dataclasses import dataclass
+from typing import Callable, Union
 
 
-OTRS_CONST = {
-    'q_type_n': len('ТИП ОБРАЩЕНИЯ'),
-    'q_topic_n': len('ТЕМА ВОПРОСА'),
-    'card_n': len('НОМЕР КАРТЫ'),
-    'card_old_n': len('НОМЕР СТАРОЙ КАРТЫ'),
-    'card_new_n': len('НОМЕР НОВОЙ КАРТЫ'),
-    'msg_n': len('СООБЩЕНИЕ'),
-    'azs_n': len('НОМЕР АЗС'),
-    'trk_n': len('НОМЕР КОЛОНКИ'),
-    'fuel_n': len('ВИД ТОПЛИВА'),
-    'stars_n': len('*******************************'),
-}
-
-
-HOTLINE_HOTLINE_CONST = {
-    'msg_n': len('Текст сообщения:'),
-}
-
-
-HOTLINE_FREE_CONST = {
-    'Тема: [☝❗EXTERNAL❗]': {
-        'msg_n': len('Тема: [☝❗EXTERNAL❗]'),
-    },
-    'Тема: ': {
-        'msg_n': len('Тема:'),
-    },
-    'Subject: [☝❗EXTERNAL❗]': {
-        'msg_n': len('Subject: [☝❗EXTERNAL❗]'),
-    }
-}
-
-
-HOTLINE_FEEDBACK_CONST = {
-    'msg_n': len('Ваше сообщение:'),
-}
+OTRS_STARS_N = len('*******************************')
 
 
 STANDARD_CONST = {
@@ -46,8 +15,6 @@ STANDARD_CONST = {
 
 
 COMPLAINT_CONST = {
-    "msg_n": len("Суть обращения"),
-    "ans_n": len("Ответ клиенту"),
     "azs_fcs": ["№ Магазина и АЗС", "№ АЗС", "АЗС"],
     "date_fcs": ["Дата обращения клиента", "Дата"],
 }
@@ -58,128 +25,174 @@ ACCREM_CONST = {
 }
 
 
+FIELD_BEG_RE = re.compile(r'^[^A-Za-zА-Яа-я0-9]+')
+FIELD_CHARS = frozenset(
+    string.ascii_letters + string.digits + "".join(map(chr, range(ord('А'), ord('я') + 1)))
+)
+HAS_ALNUM_RE = re.compile(r'[A-Za-zА-Яа-я0-9]')
+
+
 def clean_field(text: str) -> str:
     """Обрезает лишние пробелы и знаки препинания в начале и конце строки."""
     text = text.strip()
-    text = re.sub(r'^[^A-Za-zА-Яа-я0-9]+', '', text)
-    return re.sub(r'[^A-Za-zА-Яа-я0-9]+$', '', text)
+    text = FIELD_BEG_RE.sub('', text)
+    # same as removing r'[^A-Za-zА-Яа-я0-9]+$' from the stripped text, without
+    # the regex trying a match at every position
+    end = len(text)
+    while end and text[end - 1] not in FIELD_CHARS:
+        end -= 1
+    return text[:end]
 
 
-def parse_otrs(msg: str) -> dict[str, str]:
-    """Extract text from OTRS Pattern message."""
-    res = {}
-    # parse question type
-    qtype_start = msg.index('ТИП ОБРАЩЕНИЯ\n*')
-    qtype_end = msg.index('ТЕМА ВОПРОСА\n*')
-    res['request_type'] = (
-        msg[qtype_start + OTRS_CONST['q_type_n']+1
-        + OTRS_CONST['stars_n']+1 : qtype_end]
-    )
-    res['request_type'] = clean_field(res['request_type'])
-    # parse question topic
-    qtopic_start = msg.index('ТЕМА ВОПРОСА\n*')
-    qtopic_end = msg.index('ТИП ВОПРОСА\n*')
-    res['request_topic'] = (
-        msg[qtopic_start + OTRS_CONST['q_topic_n']+1
-        + OTRS_CONST['stars_n']+1 : qtopic_end]
-    )
-    res['request_topic'] = clean_field(res['request_topic'])
-    # parse cards numbers
-    cards = []
-    # card main
-    card_start = msg.index('НОМЕР КАРТЫ\n*')
-    card_end = msg.index('КАК К ВАМ ОБРАЩАТЬСЯ?\n*')
-    card_main = (
-        msg[card_start + OTRS_CONST['card_n']+1
-        + OTRS_CONST['stars_n']+1 : card_end]
-    )
-    cards.append(clean_field(card_main))
-    # card old
-    card_old_start = msg.index('НОМЕР СТАРОЙ КАРТЫ\n*')
-    card_old_end = msg.index('НОМЕР НОВОЙ КАРТЫ\n*')
-    card_old = (
-        msg[card_old_start + OTRS_CONST['card_old_n']+1
-        + OTRS_CONST['stars_n']+1 : card_old_end]
-    )
-    cards.append(clean_field(card_old))
-    # card new
-    card_new_start = msg.index('НОМЕР НОВОЙ КАРТЫ\n*')
-    card_new_end = msg.index('СООБЩЕНИЕ\n*')
-    card_new = (
-        msg[card_new_start + OTRS_CONST['card_new_n']+1
-        + OTRS_CONST['stars_n']+1 : card_new_end]
-    )
-    cards.append(clean_field(card_new))
-    # all cards
-    res['card'] = ", ".join(sorted([crd for crd in cards if crd]))
-    # parse text
-    msg_start = msg.index('СООБЩЕНИЕ\n*')
-    msg_end = msg.index('ФАЙЛ\n*')
-    res['text'] = (
-        msg[msg_start + OTRS_CONST['msg_n']+1
-        + OTRS_CONST['stars_n']+1 : msg_end]
-    )
-    res['text'] = clean_field(res['text'])
-    # parse azs
-    azs_start = msg.index('НОМЕР АЗС\n*')
-    azs_end = msg.index('НОМЕР КОЛОНКИ\n*')
-    res['azs'] = (
-        msg[azs_start + OTRS_CONST['azs_n']+1
-        + OTRS_CONST['stars_n']+1 : azs_end]
-    )
-    res['azs'] = clean_field(res['azs'])
-    # parse trk
-    trk_start = msg.index('НОМЕР КОЛОНКИ\n*')
-    trk_end = msg.index('ВИД ТОПЛИВА\n*')
-    res['trk'] = (
-        msg[trk_start + OTRS_CONST['trk_n']+1
-        + OTRS_CONST['stars_n']+1 : trk_end]
-    )
-    res['trk'] = clean_field(res['trk'])
-    # parse fuel
-    fuel_start = msg.index('ВИД ТОПЛИВА\n*')
-    fuel_end = msg.index('ДАТА ПОСЕЩЕНИЯ АЗС\n*')
-    res['fuel'] = (
-        msg[fuel_start + OTRS_CONST['fuel_n']+1
-        + OTRS_CONST['stars_n']+1 : fuel_end]
-    )
-    res['fuel'] = clean_field(res['fuel'])
-    return res
+def clean_line_field(text: str) -> str:
+    """`clean_field` of the text joined into one line."""
+    return clean_field(text.replace("\n", ""))
 
 
-def parse_hotline_hotline(msg: str) -> dict[str, str]:
-    """Extract text from Hotline Hotline Pattern message."""
-    res = {}
-    # parse message content
-    msg_start = msg.index('Текст сообщения:')
-    msg_end = msg.index('Сообщение сгенерировано автоматически.')
-    res['text'] = msg[msg_start + HOTLINE_HOTLINE_CONST['msg_n']+1 : msg_end]
-    res['text'] = clean_field(res['text'])
-    return res
+@dataclass(frozen=True)
+class Marker:
+    """Section marker, the field starts `gap` chars after the marker end."""
+    text: str
+    gap: int = 1
 
 
-def parse_hotline_feedback(msg: str) -> dict[str, str]:
-    """Extract text from Hotline Feedback Pattern message."""
-    res = {}
-    # parse message content
-    msg_start = msg.index('Ваше сообщение:')
-    msg_end = msg.index('Я ознакомлен(-а) с положением')
-    res['text'] = msg[msg_start + HOTLINE_FEEDBACK_CONST['msg_n']+1 : msg_end]
-    res['text'] = clean_field(res['text'])
-    return res
+@dataclass(frozen=True)
+class Section:
+    """Message field between a `start` marker and an `end` marker.
 
+    Marker candidates are listed in priority order, the first one present in
+    the message is used at its first occurrence. Without `end` the field lasts
+    till the end of the message. A missing marker raises ValueError for a
+    `required` section and gives an empty field otherwise.
+    """
+    key: str
+    start: tuple[Marker, ...]
+    end: tuple[str, ...] = ()
+    required: bool = True
+    clean: Callable[[str], str] = clean_field
 
-def parse_hotline_free(msg: str) -> dict[str, str]:
-    """Extract text from Hotline Free Pattern message."""
-    res = {}
-    for key in HOTLINE_FREE_CONST.keys():
-        if key in msg:
-            # parse message content
-            msg_start = msg.index(key)
-            res['text'] = msg[msg_start + HOTLINE_FREE_CONST[key]['msg_n']+1 :]
-            res['text'] = clean_field(res['text'])
-            return res
-    raise Exception('No key was found for Hotline Free Pattern message.')
+
+@dataclass(frozen=True)
+class PatternSection:
+    """Message field captured by the first group of `pattern`.
+
+    For fields delimited by regular expressions rather than fixed markers.
+    A message the pattern does not match raises ValueError for a `required`
+    section and gives an empty field otherwise.
+    """
+    key: str
+    pattern: re.Pattern
+    required: bool = False
+    clean: Callable[[str], str] = clean_field
+
+
+class SectionParser:
+    """Parser built from a declarative list of sections.
+
+    Sections sharing a key are joined into a sorted comma separated list of
+    their non-empty values.
+    """
+
+    def __init__(self, name: str, sections: list[Union[Section, PatternSection]]):
+        self.name = name
+        self.sections = sections
+
+    def __call__(self, msg: str) -> dict[str, str]:
+        # each marker is searched once and only when needed, shared by all sections
+        found: dict[str, int] = {}
+        values: dict[str, list[str]] = {}
+        for section in self.sections:
+            values.setdefault(section.key, []).append(self._field(msg, found, section))
+        return {
+            key: key_values[0] if len(key_values) == 1 else ", ".join(sorted(v for v in key_values if v))
+            for key, key_values in values.items()
+        }
+
+    @staticmethod
+    def _find(msg: str, found: dict[str, int], marker: str) -> int:
+        if marker not in found:
+            found[marker] = msg.find(marker)
+        return found[marker]
+
+    def _field(self, msg: str, found: dict[str, int], section: Union[Section, PatternSection]) -> str:
+        if isinstance(section, PatternSection):
+            match = section.pattern.search(msg)
+            if match is None:
+                return self._missing(section, [section.pattern.pattern])
+            return section.clean(match.group(1))
+        start = next((m for m in section.start if self._find(msg, found, m.text) != -1), None)
+        if start is None:
+            return self._missing(section, [marker.text for marker in section.start])
+        field_beg = found[start.text] + len(start.text) + start.gap
+        if not section.end:
+            return section.clean(msg[field_beg:])
+        end = next((m for m in section.end if self._find(msg, found, m) != -1), None)
+        if end is None:
+            return self._missing(section, list(section.end))
+        return section.clean(msg[field_beg:found[end]])
+
+    def _missing(self, section: Union[Section, PatternSection], markers: list[str]) -> str:
+        if section.required:
+            raise ValueError(f"{self.name} message has no {section.key} marker: {markers}")
+        return ""
+
+
+def otrs_section(key: str, title: str, next_title: str) -> Section:
+    """OTRS field between the starred `title` and `next_title` headers."""
+    # title header is the title, a line of stars and a line break
+    return Section(key, (Marker(f'{title}\n*', OTRS_STARS_N),), (f'{next_title}\n*',))
+
+
+OTRS_SECTIONS = [
+    otrs_section('request_type', 'ТИП ОБРАЩЕНИЯ', 'ТЕМА ВОПРОСА'),
+    otrs_section('request_topic', 'ТЕМА ВОПРОСА', 'ТИП ВОПРОСА'),
+    # main, old and new cards
+    otrs_section('card', 'НОМЕР КАРТЫ', 'КАК К ВАМ ОБРАЩАТЬСЯ?'),
+    otrs_section('card', 'НОМЕР СТАРОЙ КАРТЫ', 'НОМЕР НОВОЙ КАРТЫ'),
+    otrs_section('card', 'НОМЕР НОВОЙ КАРТЫ', 'СООБЩЕНИЕ'),
+    otrs_section('text', 'СООБЩЕНИЕ', 'ФАЙЛ'),
+    otrs_section('azs', 'НОМЕР АЗС', 'НОМЕР КОЛОНКИ'),
+    otrs_section('trk', 'НОМЕР КОЛОНКИ', 'ВИД ТОПЛИВА'),
+    otrs_section('fuel', 'ВИД ТОПЛИВА', 'ДАТА ПОСЕЩЕНИЯ АЗС'),
+]
+parse_otrs = SectionParser('OTRS', OTRS_SECTIONS)
+
+
+HOTLINE_HOTLINE_SECTIONS = [
+    Section('text', (Marker('Текст сообщения:'),), ('Сообщение сгенерировано автоматически.',)),
+]
+parse_hotline_hotline = SectionParser('HotlineHotline', HOTLINE_HOTLINE_SECTIONS)
+
+
+HOTLINE_FEEDBACK_SECTIONS = [
+    Section('text', (Marker('Ваше сообщение:'),), ('Я ознакомлен(-а) с положением',)),
+]
+parse_hotline_feedback = SectionParser('HotlineFeedback', HOTLINE_FEEDBACK_SECTIONS)
+
+
+HOTLINE_FREE_SECTIONS = [
+    Section('text', (
+        Marker('Тема: [☝❗EXTERNAL❗]'),
+        Marker('Тема: ', gap=0),
+        Marker('Subject: [☝❗EXTERNAL❗]'),
+    )),
+]
+parse_hotline_free = SectionParser('HotlineFree', HOTLINE_FREE_SECTIONS)
+
+
+STANDARD_ORDER_MARKER = "Номер заказа:"
+STANDARD_OTHER_MARKERS = ["Контактный телефон:", "Номер карты", "Объект:", "Адрес:", "Отправлено"]
+STANDARD_SPECIAL_MARKER = "Примечание:"
+STANDARD_MARKERS_RE = re.compile(r'\s*(' + "|".join(
+    re.escape(marker)
+    for marker in STANDARD_OTHER_MARKERS + [STANDARD_ORDER_MARKER, STANDARD_SPECIAL_MARKER]
+) + ')')
+STANDARD_SENT_RE = re.compile(r'^\d{2}:\d{2},\s+\d+\s+\w+\s+\d+\s+г\.,')
+STANDARD_TAG_RE = re.compile(r'<[^>]+>')
+STANDARD_WISHES_RE = re.compile(
+    r'(Напишите\s+ваши\s+пожелания.*?Нам\s+это\s+очень\s+важно\.?)',
+    flags=re.IGNORECASE | re.DOTALL,
+)
 
 
 def filter_standard_service_lines(text: str) -> str:
@@ -187,23 +200,21 @@ def filter_standard_service_lines(text: str) -> str:
     Удаляет служебные строки с маркерами, а также извлекает комментарий после 'Номер заказа:'.
     Переводы строк вставляются перед маркерами для гарантированного разделения, даже если текст "склеен".
     """
-    order_marker = "Номер заказа:"
-    other_markers = ["Контактный телефон:", "Номер карты", "Объект:", "Адрес:", "Отправлено"]
-    special_marker = "Примечание:"
+    order_marker = STANDARD_ORDER_MARKER
+    other_markers = STANDARD_OTHER_MARKERS
+    special_marker = STANDARD_SPECIAL_MARKER
     # Вставляем перенос строки перед всеми маркерами
-    for marker in other_markers + [order_marker, special_marker]:
-        text = re.sub(r'\s*' + re.escape(marker), r'\n' + marker, text)
+    text = STANDARD_MARKERS_RE.sub(r'\n\1', text)
     filtered = []
     for line in text.splitlines():
         line = line.strip()
-        conditions_to_skip = [
-            not line,
-            line.startswith(">"),
-            re.match(r'^\d{2}:\d{2},\s+\d+\s+\w+\s+\d+\s+г\.,', line),
-            re.search(r'<[^>]+>', line),
-            "«АЗС Газпромнефть" in line,
-        ]
-        if any(conditions_to_skip):
+        if (
+            not line
+            or line.startswith(">")
+            or STANDARD_SENT_RE.match(line)
+            or STANDARD_TAG_RE.search(line)
+            or "«АЗС Газпромнефть" in line
+        ):
             continue
         if line.startswith(order_marker):
             content = line[STANDARD_CONST['order_n']:].strip()
@@ -223,41 +234,33 @@ def filter_standard_service_lines(text: str) -> str:
 def parse_standard(msg: str) -> dict[str, str]:
     """Extract text from Standard Pattern message."""
     res = {}
-    pattern = r'(Напишите\s+ваши\s+пожелания.*?Нам\s+это\s+очень\s+важно\.?)'
-    match = re.search(pattern, msg, flags=re.IGNORECASE | re.DOTALL)
+    match = STANDARD_WISHES_RE.search(msg)
     rest_text = msg.replace(match.group(1), "").strip() if match else msg.strip()
     res['text'] = clean_field(filter_standard_service_lines(rest_text))
     return res
 
 
-def extract_udc_field(msg: str, pattern: str) -> str:
-    """
-    Ищет по заданному шаблону, очищает найденный текст с помощью clean_field,
-    и возвращает результат, если в нём есть буквы или цифры, иначе — пустую строку.
-    """
-    m = re.search(pattern, msg, re.DOTALL)
-    if m:
-        field = clean_field(m.group(1).strip())
-        return field if re.search(r'[A-Za-zА-Яа-я0-9]', field) else ""
-    return ""
+def clean_alnum_field(text: str) -> str:
+    """`clean_field`, empty if no letters or digits are left."""
+    field = clean_field(text)
+    return field if HAS_ALNUM_RE.search(field) else ""
 
 
-def parse_udc(msg: str) -> dict[str, str]:
-    """Extract text from UDC Pattern message."""
-    res = {}
-    # parse request topic
-    reason_pattern = r'Причина обращения:\s*(.*?)(?=,?\s*Номер ОРТ)'
-    res['request_topic'] = extract_udc_field(msg, reason_pattern)
-    # parse text
-    message_pattern = r'Краткое описание обращения\(хронология\):\s*(.*?)(?=\n\n|\n>[^\n]*|\nНомер обращения:|\nС уважением|\nИнициатор:|$)'
-    res['text'] = extract_udc_field(msg, message_pattern)
-    # parse trk
-    trk_pattern = r'Номер ТРК:\s*(.*?)(?=,?\s*Вид НП)'
-    res['trk'] = extract_udc_field(msg, trk_pattern)
-    # parse fuel
-    fuel_pattern = r'Вид НП:\s*(.*?)(?=,?\s*Сумма внесённых денежных средств)'
-    res['fuel'] = extract_udc_field(msg, fuel_pattern)
-    return res
+def udc_section(key: str, pattern: str) -> PatternSection:
+    return PatternSection(key, re.compile(pattern, re.DOTALL), clean=clean_alnum_field)
+
+
+UDC_SECTIONS = [
+    udc_section('request_topic', r'Причина обращения:\s*(.*?)(?=,?\s*Номер ОРТ)'),
+    udc_section(
+        'text',
+        r'Краткое описание обращения\(хронология\):\s*(.*?)'
+        r'(?=\n\n|\n>[^\n]*|\nНомер обращения:|\nС уважением|\nИнициатор:|$)',
+    ),
+    udc_section('trk', r'Номер ТРК:\s*(.*?)(?=,?\s*Вид НП)'),
+    udc_section('fuel', r'Вид НП:\s*(.*?)(?=,?\s*Сумма внесённых денежных средств)'),
+]
+parse_udc = SectionParser('UDC', UDC_SECTIONS)
 
 
 def parse_corpres(msg: str) -> dict:
@@ -281,53 +284,32 @@ def parse_corpres(msg: str) -> dict:
     return res
 
 
-def first_valid_idx(idxs: list[int], names: list[str]) -> tuple[int, str]:
-    for idx, name in zip(idxs, names):
-        if idx != -1:
-            return idx, name
-    return -1, ""
-
-
-def complaint_find_azs_borders(msg: str) -> tuple[int, str, int, str]:
-    azs_fc_idxs = [
-        (msg.index(azs_fc) if azs_fc in msg else -1)
-        for azs_fc in COMPLAINT_CONST["azs_fcs"]
-    ]
-    date_fc_idxs = [
-        (msg.index(date_fc) if date_fc in msg else -1)
-        for date_fc in COMPLAINT_CONST["date_fcs"]
-    ]
-    azs_idx, azs_name = first_valid_idx(azs_fc_idxs, COMPLAINT_CONST["azs_fcs"])
-    d_idx, d_name = first_valid_idx(date_fc_idxs, COMPLAINT_CONST["date_fcs"])
-    return azs_idx, azs_name, d_idx, d_name
+COMPLAINT_SECTIONS = [
+    Section("text", (Marker("Суть обращения"),), ("Принятые меры",)),
+    Section("answer", (Marker("Ответ клиенту"),)),
+    Section(
+        "azs",
+        tuple(Marker(azs_fc, gap=0) for azs_fc in COMPLAINT_CONST["azs_fcs"]),
+        tuple(COMPLAINT_CONST["date_fcs"]),
+        required=False,
+        clean=clean_line_field,
+    ),
+]
+parse_complaint_sections = SectionParser('ComplaintBook', COMPLAINT_SECTIONS)
 
 
 def parse_complaint(msg_src: str) -> dict[str, str]:
+    """Extract text from ComplaintBook Pattern message."""
     msg_parts = [
         part.replace("\n", "").strip()
         for part in msg_src.split("\n")
         if part.replace("\n", "").strip()
     ]
     msg = "\n".join(msg_parts)
-    """Extract text from OTRS Pattern message."""
-    res = {}
-    # parse text
-    msg_start = msg.index("Суть обращения")
-    msg_end = msg.index("Принятые меры")
-    res["text"] = msg[msg_start + COMPLAINT_CONST["msg_n"]+1: msg_end]
-    res["text"] = clean_field(res["text"])
-    # parse answer
-    answer_start = msg.index("Ответ клиенту")
-    res["answer"] = msg[answer_start + COMPLAINT_CONST["ans_n"]+1:]
-    res["answer"] = clean_field(res["answer"])
-    # parse azs
-    azs_idx, azs_name, d_idx, d_name = complaint_find_azs_borders(msg)
-    if all([azs_idx != -1, d_idx != -1]):
-        res["azs"] = msg[azs_idx + len(azs_name) : d_idx].replace("\n", "")
-        res["azs"] = clean_field(res["azs"])
-    else:
-        res["azs"] = ""
-    return res
+    return parse_complaint_sections(msg)
+
+
+PHONE_RE = re.compile(r'\b[78]\d{10}\b')
 
 
 def parse_acc_removal(msg: str) -> dict[str, str]:
@@ -344,21 +326,26 @@ def parse_acc_removal(msg: str) -> dict[str, str]:
                 break
             else:
                 card_start = msg.index(field)
-                idx = card_start + 1
-                while msg[idx] != "\n":
-                    idx += 1
-                card_end = idx
+                card_end = msg.find("\n", card_start + 1)
+                if card_end == -1:
+                    raise ValueError(f"AccRemoval message has no line break after the {field!r} card")
                 card = msg[card_start+ACCREM_CONST["card_n"]+1 : card_end]
                 cards.append(card.strip())
         res["card"] = ", ".join(cards)
     # parse phone
-    phone_pattern = r'\b[78]\d{10}\b'
-    res["phone"] = re.findall(phone_pattern, msg)[0]
+    phone = PHONE_RE.search(msg)
+    if phone is None:
+        raise ValueError("AccRemoval message has no phone number")
+    res["phone"] = phone.group()
     # parse text
     res["text"] = ""
     return res
 
 
+# Standard, CorpRes and AccRemoval stay functions: their fields are not
+# spans between markers but filtered lines (Standard), the text after the
+# last of several markers cut at the first footer (CorpRes) and a numbered
+# list of cards with its own "no cards" marker (AccRemoval)
 PARSERS = {
     'OTRS': parse_otrs,
     'HotlineHotline': parse_hotline_hotline,
@@ -0,0 +1,99 @@
+import os
+import threading
+from dataclasses import dataclass
+from typing import Any, Optional
+
+import numpy as np
+import torch
+from transformers import AutoConfig
+
+
+INF_BACKENDS = ("torch", "onnx", "int8")
+
+# Exported files are stored next to the torch checkpoint
+ONNX_FILES = {
+    "onnx": "model.onnx",
+    "int8": "model.int8.onnx",
+}
+
+
+# `from_pretrained` builds the model on the meta device by patching torch
+# globally, models loaded from several threads at once break each other
+_FROM_PRETRAINED_LOCK = threading.Lock()
+
+
+def onnx_path(model_p: str, backend: str) -> str:
+    return os.path.join(model_p, ONNX_FILES[backend])
+
+
+@dataclass
+class OrtOutput:
+    logits: torch.Tensor
+
+
+class OrtModel:
+    """ONNX Runtime session with the calling convention of a transformers model.
+
+    Accepts the tokenizer outputs as keyword arguments and returns an object
+    with `logits`. The model config is read from the torch checkpoint folder.
+    """
+
+    def __init__(self, model_p: str, backend: str):
+        import onnxruntime as ort
+
+        self.model_p = model_p
+        self.backend = backend
+        self.config = AutoConfig.from_pretrained(model_p)
+        sess_options = ort.SessionOptions()
+        sess_options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = ort.InferenceSession(
+            onnx_path(model_p, backend),
+            sess_options,
+            providers=["CPUExecutionProvider"],
+        )
+        self.input_names = [inp.name for inp in self.session.get_inputs()]
+
+    def __call__(self, **inputs: Any) -> OrtOutput:
+        feed = {
+            name: np.asarray(inputs[name], dtype=np.int64)
+            for name in self.input_names
+        }
+        logits = self.session.run(["logits"], feed)[0]
+        return OrtOutput(logits=torch.from_numpy(logits))
+
+
+def set_torch_threads(threads: Optional[int], interop_threads: Optional[int] = None):
+    """Set torch intra-op and inter-op threads, None keeps the torch default.
+
+    Inter-op threads can only be set before the first parallel work of the
+    process.
+    """
+    if threads is not None:
+        torch.set_num_threads(threads)
+    if interop_threads is not None:
+        torch.set_num_interop_threads(interop_threads)
+
+
+def model_nbytes(model: Any, shared_backbone: bool = False) -> int:
+    """Approximate size of model weights, without the shared encoder if any."""
+    if isinstance(model, OrtModel):
+        return os.path.getsize(onnx_path(model.model_p, model.backend))
+    tensors = list(model.parameters()) + list(model.buffers())
+    if shared_backbone:
+        base_ids = {id(t) for t in model.base_model.parameters()}
+        base_ids.update(id(t) for t in model.base_model.buffers())
+        tensors = [t for t in tensors if id(t) not in base_ids]
+    return sum(t.numel() * t.element_size() for t in tensors)
+
+
+def load_model(model_cls: Any, model_p: str, backend: str, device: str) -> Any:
+    """Load `model_p` checkpoint for the selected inference backend."""
+    if backend == "torch":
+        with _FROM_PRETRAINED_LOCK:
+            model = model_cls.from_pretrained(model_p)
+        model.to(device)
+        model.eval()
+        return model
+    if backend in ONNX_FILES:
+        return OrtModel(model_p, backend)
+    raise ValueError(f"Unknown inference backend: {backend}. Available: {INF_BACKENDS}")
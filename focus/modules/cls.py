@@ -1,13 +1,18 @@
-
 import json
+import threading
+from collections import OrderedDict
+from typing import Any, Optional, Sequence
 
 from loguru import logger
 from transformers import (
-    pipeline,
     AutoTokenizer,
     AutoModelForSequenceClassification as AMFSC,
 )
 
+from focus.metrics import stage_timer
+from .backend import load_model, model_nbytes
+from .cls_cascade import BackboneRegistry, CascadeCache, scores
+
 
 def read_json(filepath: str, encoding: str = 'utf-8') -> dict:
     with open(filepath, 'r', encoding=encoding) as json_file:
@@ -21,57 +26,159 @@ class ClsBase:
         tokenizer_path: str,
         models_paths: dict[str, dict[str, str]],
         device: str,
+        registry: Optional[BackboneRegistry] = None,
+        backend: str = "torch",
     ):
         self.tokenizer_path = tokenizer_path
         self.models_paths = models_paths
         self.device = device
+        self.backend = backend
+        self.registry = registry if registry is not None else BackboneRegistry()
         self._init_pipe()
 
     def _init_pipe(self):
         # structures
         self.pipe_models = {}
-        pipe_labels = {}
-        pipe_id2labels = {}
-        self.cls_pipes = {}
+        self.pipe_backbones = {}
+        self.pipe_labels = {}
+        self.pipe_id2labels = {}
         # models
         logger.warning(f"tokenizer: {self.tokenizer_path}")
         self.tokenizer = AutoTokenizer.from_pretrained(self.tokenizer_path)
+        self.tokenizer_key = self.registry.tokenizer_key(self.tokenizer, self.tokenizer_path)
         for lvl, paths in self.models_paths.items():
-            logger.warning(f'{lvl}: {paths["model"]}')
             # Labels
-            pipe_labels[lvl] = read_json(paths["labels"])
-            pipe_id2labels[lvl] = {id: lbl for lbl, id in pipe_labels[lvl].items()}
-            # Models
-            self.pipe_models[lvl] = AMFSC.from_pretrained(paths["model"])
-            self.pipe_models[lvl].config.label2id = pipe_labels[lvl]
-            self.pipe_models[lvl].config.id2label = pipe_id2labels[lvl]
-            self.pipe_models[lvl].eval()
-            # Pipes
-            self.cls_pipes[lvl] = pipeline(
-                "text-classification",
-                model=self.pipe_models[lvl],
-                tokenizer=self.tokenizer,
-                device=self.device,
-            )
+            self.pipe_labels[lvl] = read_json(paths["labels"])
+            self.pipe_id2labels[lvl] = {id: lbl for lbl, id in self.pipe_labels[lvl].items()}
+        self._load_models()
+
+    def _load_models(self):
+        for lvl in self.models_paths:
+            self._load_lvl(lvl)
+
+    def _load_lvl(self, lvl: str) -> tuple[Any, Optional[str]]:
+        paths = self.models_paths[lvl]
+        logger.warning(f'{lvl}: {paths["model"]}')
+        # Models
+        model = load_model(AMFSC, paths["model"], self.backend, self.device)
+        model.config.label2id = self.pipe_labels[lvl]
+        model.config.id2label = self.pipe_id2labels[lvl]
+        self.pipe_models[lvl] = model
+        # Shared encoders
+        self.pipe_backbones[lvl] = self.registry.backbone_key(model)
+        return model, self.pipe_backbones[lvl]
+
+    def _model(self, lvl: str) -> tuple[Any, Optional[str]]:
+        """Return `lvl` model and its backbone key."""
+        return self.pipe_models[lvl], self.pipe_backbones[lvl]
+
+    def _inf_lvl(self, lvl: str, cache: CascadeCache, idxs: list[int]) -> list[tuple[str, float]]:
+        """Classify `cache.texts[idxs]` with the `lvl` model. Return (label, score)."""
+        model, backbone_key = self._model(lvl)
+        logits = cache.logits(
+            model,
+            self.tokenizer_key,
+            self.tokenizer,
+            backbone_key,
+            idxs,
+        )
+        lvl_scores = scores(model, logits)
+        return [
+            (model.config.id2label[int(row.argmax())], float(row.max()))
+            for row in lvl_scores
+        ]
 
 
 class TopicClsPipe(ClsBase):
     def inf(self, text: str) -> tuple[str, float]:
+        return self.inf_batch(CascadeCache([text]))[0]
+
+    def inf_batch(self, cache: CascadeCache) -> list[tuple[str, float]]:
         # Top Topic (Binary)
-        inf_res = self.cls_pipes["top-binary"](text)[0]
-        if inf_res["label"] == "Остальное":
-            # Low Topic (Rest)
-            inf_res = self.cls_pipes["low-rest"](text)[0]
-        res_top, res_prob = inf_res["label"], inf_res["score"]
-        return res_top, res_prob
+        inf_res = self._inf_lvl("top-binary", cache, list(range(len(cache.texts))))
+        # Low Topic (Rest)
+        rest_idxs = [i for i, (label, _) in enumerate(inf_res) if label == "Остальное"]
+        if rest_idxs:
+            rest_res = self._inf_lvl("low-rest", cache, rest_idxs)
+            for i, res in zip(rest_idxs, rest_res):
+                inf_res[i] = res
+        return inf_res
 
 
 class SubtopicClsPipe(ClsBase):
+    """Subtopic models are loaded on first use and kept in an LRU.
+
+    The least recently used models are unloaded once more than `max_loaded`
+    models or more than `max_mem_mb` of weights are loaded. `warmup` topics are
+    loaded at construction, the first ones are the last to be evicted.
+    """
+
+    def __init__(
+        self,
+        tokenizer_path: str,
+        models_paths: dict[str, dict[str, str]],
+        device: str,
+        registry: Optional[BackboneRegistry] = None,
+        backend: str = "torch",
+        max_loaded: Optional[int] = None,
+        max_mem_mb: Optional[float] = None,
+        warmup: Sequence[str] = (),
+    ):
+        self.max_loaded = max_loaded
+        self.max_mem_mb = max_mem_mb
+        self.warmup = list(warmup)
+        self._lock = threading.Lock()
+        super().__init__(tokenizer_path, models_paths, device, registry, backend)
+
+    def _load_models(self):
+        self.pipe_models = OrderedDict()
+        self.pipe_sizes: dict[str, int] = {}
+        for lvl in reversed(self.warmup):
+            self._model(lvl)
+
+    def _loaded_mb(self) -> float:
+        return sum(self.pipe_sizes.values()) / 2**20
+
+    def _over_limit(self) -> bool:
+        if self.max_loaded is not None and len(self.pipe_models) > self.max_loaded:
+            return True
+        return self.max_mem_mb is not None and self._loaded_mb() > self.max_mem_mb
+
+    def _evict(self, keep: str):
+        while len(self.pipe_models) > 1 and self._over_limit():
+            lvl = next(iter(self.pipe_models))
+            if lvl == keep:
+                self.pipe_models.move_to_end(lvl)
+                continue
+            del self.pipe_models[lvl]
+            del self.pipe_sizes[lvl]
+            self.registry.release(self.pipe_backbones.pop(lvl))
+            logger.warning(f"Unloaded {lvl}, loaded: {len(self.pipe_models)} ({self._loaded_mb():.0f} MB)")
+
+    def _model(self, lvl: str) -> tuple[Any, Optional[str]]:
+        with self._lock:
+            if lvl in self.pipe_models:
+                self.pipe_models.move_to_end(lvl)
+                return self.pipe_models[lvl], self.pipe_backbones[lvl]
+            model, backbone_key = self._load_lvl(lvl)
+            self.pipe_sizes[lvl] = model_nbytes(model, self.registry.is_shared(backbone_key))
+            self._evict(keep=lvl)
+            return model, backbone_key
+
     def inf(self, topic: str, text: str) -> tuple[str, float]:
-        inf_res = self.cls_pipes[topic](text)[0]
-        res_top, res_prob = inf_res["label"], inf_res["score"]
-        res_top_f = "_".join(res_top.split("_")[1:])
-        return res_top_f, res_prob
+        return self.inf_batch([topic], CascadeCache([text]))[0]
+
+    def inf_batch(self, topics: list[str], cache: CascadeCache) -> list[tuple[str, float]]:
+        # group texts by topic to run each subtopic model once
+        groups: dict[str, list[int]] = {}
+        for i, topic in enumerate(topics):
+            groups.setdefault(topic, []).append(i)
+        res: list[tuple[str, float]] = [("", 0.0)] * len(topics)
+        for topic, idxs in groups.items():
+            for i, (res_top, res_prob) in zip(idxs, self._inf_lvl(topic, cache, idxs)):
+                res_top_f = "_".join(res_top.split("_")[1:])
+                res[i] = (res_top_f, res_prob)
+        return res
 
 
 class Cls:
@@ -82,6 +189,11 @@ class Cls:
             subt_tokenizer_path: str,
             subt_models_path: dict[str, dict[str, str]],
             device: str,
+            share_backbones: bool = True,
+            backend: str = "torch",
+            subt_max_loaded: Optional[int] = None,
+            subt_max_mem_mb: Optional[float] = None,
+            subt_warmup: Sequence[str] = (),
         ):
         # topic
         self.topt_tokenizer_path = topt_tokenizer_path
@@ -91,6 +203,11 @@ class Cls:
         self.subt_models_path = subt_models_path
         # rest
         self.device = device
+        self.backend = backend
+        self.subt_max_loaded = subt_max_loaded
+        self.subt_max_mem_mb = subt_max_mem_mb
+        self.subt_warmup = subt_warmup
+        self.registry = BackboneRegistry(share_backbones)
         self._init_pipe()
 
     def _init_pipe(self):
@@ -99,15 +216,32 @@ class Cls:
             self.topt_tokenizer_path,
             self.topt_models_path,
             self.device,
+            self.registry,
+            self.backend,
         )
         # subtopic
         self.subtopic_pipe = SubtopicClsPipe(
             self.subt_tokenizer_path,
             self.subt_models_path,
             self.device,
+            self.registry,
+            self.backend,
+            max_loaded=self.subt_max_loaded,
+            max_mem_mb=self.subt_max_mem_mb,
+            warmup=self.subt_warmup,
         )
 
     def inf(self, text: str) -> tuple[str, str]:
-        top_name, top_p = self.topic_pipe.inf(text)
-        sub_name, sub_p = self.subtopic_pipe.inf(top_name, text)
-        return top_name, sub_name
+        return self.inf_batch([text])[0]
+
+    def inf_batch(self, texts: list[str]) -> list[tuple[str, str]]:
+        if not texts:
+            return []
+        # texts are tokenized and encoded once for all cascade stages
+        cache = CascadeCache(texts)
+        with stage_timer("cls_topic"):
+            top_res = self.topic_pipe.inf_batch(cache)
+        top_names = [top_name for top_name, _ in top_res]
+        with stage_timer("cls_subtopic"):
+            sub_res = self.subtopic_pipe.inf_batch(top_names, cache)
+        return [(top_name, sub_name) for top_name, (sub_name, _) in zip(top_names, sub_res)]
@@ -0,0 +1,173 @@
+import hashlib
+from typing import Any, Callable, Optional
+
+import numpy as np
+import torch
+from loguru import logger
+from transformers import PreTrainedModel, PreTrainedTokenizerBase
+
+from focus.metrics import observe_tokens
+
+
+# Model types whose classification head can be applied to a shared encoder
+# output: (encoder output -> head input, (model, head input) -> logits)
+HEADS: dict[str, tuple[Callable[[Any], torch.Tensor], Callable[[Any, torch.Tensor], torch.Tensor]]] = {
+    "bert": (
+        lambda enc_out: enc_out.pooler_output,
+        lambda model, head_in: model.classifier(model.dropout(head_in)),
+    ),
+}
+
+
+def _fingerprint(module: torch.nn.Module) -> tuple:
+    """Cheap weights fingerprint: shapes and a few leading values of each tensor."""
+    return tuple(
+        (name, tuple(tensor.shape), tuple(tensor.reshape(-1)[:4].tolist()))
+        for name, tensor in module.state_dict().items()
+    )
+
+
+def _same_weights(first: torch.nn.Module, second: torch.nn.Module) -> bool:
+    first_state, second_state = first.state_dict(), second.state_dict()
+    if first_state.keys() != second_state.keys():
+        return False
+    return all(torch.equal(first_state[k], second_state[k]) for k in first_state)
+
+
+class BackboneRegistry:
+    """Deduplicates tokenizers and encoders across classification models.
+
+    Tokenizers with the same serialized vocabulary get the same key, so texts
+    are tokenized once per distinct tokenizer. Models with supported heads and
+    bit-identical base weights get the same backbone key and share one encoder
+    module, which is run once per text.
+    """
+
+    def __init__(self, share_backbones: bool = True):
+        self.share_backbones = share_backbones
+        self._tokenizers: dict[str, str] = {}
+        self._backbones: dict[str, tuple[tuple, torch.nn.Module]] = {}
+        self._refs: dict[str, int] = {}
+        self._n_keys = 0
+
+    def tokenizer_key(self, tokenizer: PreTrainedTokenizerBase, path: str) -> str:
+        if not tokenizer.is_fast:
+            return path
+        serialized = (
+            f"{tokenizer.backend_tokenizer.to_str()}"
+            f"{tokenizer.model_max_length}{tokenizer.padding_side}"
+        )
+        digest = hashlib.sha1(serialized.encode()).hexdigest()
+        return self._tokenizers.setdefault(digest, path)
+
+    def backbone_key(self, model: PreTrainedModel) -> Optional[str]:
+        """Register model encoder, return its key or None if it can't be shared."""
+        if not isinstance(model, PreTrainedModel):
+            return None
+        if not self.share_backbones or model.config.model_type not in HEADS:
+            return None
+        base = model.base_model
+        fp = _fingerprint(base)
+        for key, (key_fp, key_base) in self._backbones.items():
+            if key_fp == fp and _same_weights(base, key_base):
+                # keep a single copy of the shared encoder
+                setattr(model, model.base_model_prefix, key_base)
+                self._refs[key] += 1
+                logger.warning(f"Shared backbone: {key}")
+                return key
+        key = f"backbone-{self._n_keys}"
+        self._n_keys += 1
+        self._backbones[key] = (fp, base)
+        self._refs[key] = 1
+        return key
+
+    def is_shared(self, key: Optional[str]) -> bool:
+        return key is not None and self._refs[key] > 1
+
+    def release(self, key: Optional[str]):
+        """Forget the encoder once no registered model uses it."""
+        if key is None:
+            return
+        self._refs[key] -= 1
+        if not self._refs[key]:
+            del self._refs[key]
+            del self._backbones[key]
+
+
+class CascadeCache:
+    """Per-call cache of encodings and encoder outputs across cascade stages."""
+
+    def __init__(self, texts: list[str]):
+        self.texts = texts
+        self._encodings: dict[str, dict[str, torch.Tensor]] = {}
+        # encoder outputs by (backbone key, tokenizer key): a shared encoder
+        # gives different outputs for encodings of different tokenizers
+        self._head_inputs: dict[tuple[str, str], dict[int, torch.Tensor]] = {}
+
+    def encoding(self, tok_key: str, tokenizer: PreTrainedTokenizerBase) -> dict[str, torch.Tensor]:
+        if tok_key not in self._encodings:
+            # unlike the text-classification pipeline, texts longer than the
+            # model inputs are truncated instead of failing
+            self._encodings[tok_key] = dict(tokenizer(
+                self.texts,
+                padding=True,
+                truncation=True,
+                return_tensors="pt",
+            ))
+            lengths = self._encodings[tok_key]["attention_mask"].sum(dim=1).tolist()
+            # the encoding does not tell cut inputs from those of exactly the max length
+            observe_tokens("cls", lengths, sum(length >= tokenizer.model_max_length for length in lengths))
+        return self._encodings[tok_key]
+
+    @staticmethod
+    def _rows(encoding: dict[str, torch.Tensor], idxs: list[int]) -> dict[str, torch.Tensor]:
+        rows = {k: v[idxs] for k, v in encoding.items()}
+        # drop columns that are padding for every selected row
+        keep = rows["attention_mask"].any(dim=0)
+        return {k: v[:, keep] for k, v in rows.items()}
+
+    def head_inputs(
+            self,
+            backbone_key: str,
+            tok_key: str,
+            model: PreTrainedModel,
+            encoding: dict[str, torch.Tensor],
+            idxs: list[int],
+        ) -> torch.Tensor:
+        cached = self._head_inputs.setdefault((backbone_key, tok_key), {})
+        missing = [i for i in idxs if i not in cached]
+        if missing:
+            head_in_func, _ = HEADS[model.config.model_type]
+            enc_out = model.base_model(**self._rows(encoding, missing))
+            for i, head_in in zip(missing, head_in_func(enc_out)):
+                cached[i] = head_in
+        return torch.stack([cached[i] for i in idxs])
+
+    def logits(
+            self,
+            model: PreTrainedModel,
+            tok_key: str,
+            tokenizer: PreTrainedTokenizerBase,
+            backbone_key: Optional[str],
+            idxs: list[int],
+        ) -> np.ndarray:
+        encoding = self.encoding(tok_key, tokenizer)
+        with torch.inference_mode():
+            if backbone_key is None:
+                logits = model(**self._rows(encoding, idxs)).logits
+            else:
+                _, head_func = HEADS[model.config.model_type]
+                logits = head_func(model, self.head_inputs(backbone_key, tok_key, model, encoding, idxs))
+        return logits.float().numpy()
+
+
+def scores(model: PreTrainedModel, logits: np.ndarray) -> np.ndarray:
+    """Logits to scores the same way the text-classification pipeline does."""
+    config = model.config
+    if config.problem_type == "regression":
+        return logits
+    if config.problem_type == "multi_label_classification" or config.num_labels == 1:
+        return 1.0 / (1.0 + np.exp(-logits))
+    maxes = np.max(logits, axis=-1, keepdims=True)
+    shifted_exp = np.exp(logits - maxes)
+    return shifted_exp / shifted_exp.sum(axis=-1, keepdims=True)
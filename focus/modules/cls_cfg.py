@@ -6,7 +6,6 @@ import os
 # Topics
 
 TOPT_MODELS_ROOT_P = "./models/msg-cls_2025-07-31/topic_top-low"
-os.makedirs(TOPT_MODELS_ROOT_P, exist_ok=True)
 
 TOPT_TOKENIZER_PATH = os.path.join(TOPT_MODELS_ROOT_P, "tokenizer.bin")
 
@@ -25,10 +24,15 @@ TOPT_MODELS_PATHS = {
 # Subtopics
 
 SUBT_MODELS_ROOT_P = "./models/msg-cls_2025-07-31/subtopic"
-os.makedirs(SUBT_MODELS_ROOT_P, exist_ok=True)
 
 SUBT_TOKENIZER_PATH = os.path.join(SUBT_MODELS_ROOT_P, "tokenizer.bin")
 
+# Subtopic models are loaded on first use and unloaded in LRU order above the
+# limits (None - no limit). Warm-up topics are loaded at startup, hottest first.
+SUBT_MAX_LOADED = None
+SUBT_MAX_MEM_MB = None
+SUBT_WARMUP_TOPICS: list[str] = []
+
 SUBT_MODELS_PATHS = {
     "Программа лояльности": {
         "model": os.path.join(SUBT_MODELS_ROOT_P, "model_pro.bin"),
@@ -1,57 +1,109 @@
-
 import re
+from dataclasses import dataclass
+from operator import methodcaller
+from typing import Callable, Optional, Union
 
 
-def remove_links(text: str) -> str:
-    """Remove HTTP/HTTPS links from the input text."""
-    url_pattern = re.compile(r'https?://\S+')
-    return url_pattern.sub('', text)
-
-
-def remove_digits_in_brackets(text: str) -> str:
-    """Remove all occurrences of [digits] from the text."""
-    return re.sub(r'\[\d+\]', '', text)
-
+LINK_PATTERN = r'https?://\S+'
+DIGITS_IN_BRACKETS_PATTERN = r'\[\d+\]'
+SPACES_PATTERN = r'\s+'
 
 REM_SYMBOLS = ["\xa0", ">", "<", "❗", "☝", "[", "]"]
-TRANS_TABLE = str.maketrans('', '', "".join(REM_SYMBOLS))
-
-def remove_symbols(text: str) -> str:
-    return text.translate(TRANS_TABLE)
-
 
 FILES_EXTS = ["pdf", "png", "jpg"]
-
-def remove_filenames(text: str) -> str:
-    ext_pattern = "|".join(re.escape(ext) for ext in FILES_EXTS)
-    pattern = re.compile(
-        rf"\b[\w\-\_]+\.({ext_pattern})\b", 
-        re.VERBOSE | re.IGNORECASE
-    )
-    cleaned = pattern.sub('', text)
-    cleaned = re.sub(r'\s+', ' ', cleaned)  # normalize spaces
-    return cleaned.strip()
-
-
-def remove_substrings(text: str) -> str:
-    subs = ["EXTERNAL"]
-    res = text
-    for s in subs:
-        res = res.replace(s, "")
-    return res
-    
-
-TEXT_TRANSFORMS = [
-    remove_links,
-    remove_digits_in_brackets,
-    remove_symbols,
-    remove_filenames,
-    remove_substrings,
+EXTS_PATTERN = "|".join(re.escape(ext) for ext in FILES_EXTS)
+FILENAME_PATTERN = rf"\b[\w\-\_]+\.({EXTS_PATTERN})\b"
+FILENAME_GUARD = rf"\.({EXTS_PATTERN})\b"
+FILENAME_FLAGS = re.VERBOSE | re.IGNORECASE
+
+REM_SUBSTRINGS = ["EXTERNAL"]
+
+
+@dataclass(frozen=True)
+class Sub:
+    """Regex substitution, compiled once.
+
+    The pass is skipped when `guard`, a cheap regex that every match of
+    `pattern` contains, is not found in the text.
+    """
+    pattern: str
+    repl: str = ''
+    flags: int = 0
+    guard: Optional[str] = None
+
+
+@dataclass(frozen=True)
+class Delete:
+    """Removal of single symbols. Adjacent `Delete` steps are one translate pass."""
+    symbols: str
+
+
+@dataclass(frozen=True)
+class Replace:
+    old: str
+    new: str = ''
+
+
+@dataclass(frozen=True)
+class Strip:
+    chars: Optional[str] = None
+
+
+Step = Union[Sub, Delete, Replace, Strip]
+
+
+def _merge_deletes(steps: list[Step]) -> list[Step]:
+    merged: list[Step] = []
+    for step in steps:
+        if isinstance(step, Delete) and merged and isinstance(merged[-1], Delete):
+            merged[-1] = Delete(merged[-1].symbols + step.symbols)
+        else:
+            merged.append(step)
+    return merged
+
+
+def _sub_pass(step: Sub) -> Callable[[str], str]:
+    regex = re.compile(step.pattern, step.flags)
+    if step.guard is None:
+        return lambda text: regex.sub(step.repl, text)
+    guard = re.compile(step.guard, step.flags)
+    return lambda text: regex.sub(step.repl, text) if guard.search(text) else text
+
+
+def compile_steps(steps: list[Step]) -> list[Callable[[str], str]]:
+    """Compile declarative steps into a list of single-pass string transforms."""
+    passes = []
+    for step in _merge_deletes(steps):
+        if isinstance(step, Sub):
+            passes.append(_sub_pass(step))
+        elif isinstance(step, Delete):
+            passes.append(methodcaller("translate", str.maketrans('', '', step.symbols)))
+        elif isinstance(step, Replace):
+            passes.append(methodcaller("replace", step.old, step.new))
+        elif isinstance(step, Strip):
+            passes.append(methodcaller("strip", step.chars))
+        else:
+            raise ValueError(f"Unknown text transform: {step}")
+    return passes
+
+
+# Links, [digits], symbols, file names and substrings are removed in turn,
+# file name removal also normalizes spaces and strips the text
+CLEAR_TEXT_STEPS: list[Step] = [
+    Sub(LINK_PATTERN),
+    Sub(DIGITS_IN_BRACKETS_PATTERN),
+    Delete("".join(REM_SYMBOLS)),
+    Sub(FILENAME_PATTERN, flags=FILENAME_FLAGS, guard=FILENAME_GUARD),
+    Sub(SPACES_PATTERN, ' '),
+    Strip(),
+    *(Replace(s) for s in REM_SUBSTRINGS),
+    Strip(" \t"),
 ]
+CLEAR_TEXT_PASSES = compile_steps(CLEAR_TEXT_STEPS)
 
 
 def clear_text(text: str) -> str:
     res = text
-    for tr in TEXT_TRANSFORMS:
+    for tr in CLEAR_TEXT_PASSES:
         res = tr(res)
-    return res.strip(" \t")
+    return res
@@ -0,0 +1,45 @@
+from transformers import PreTrainedTokenizerBase
+
+
+# "raw": the whole message, "target": the cleared target text,
+# "budget": the cleared target text cut to its head and tail tokens
+CLS_INPUT_MODES = ("raw", "target", "budget")
+
+
+def head_tail(
+        text: str,
+        tokenizer: PreTrainedTokenizerBase,
+        max_tokens: int,
+        head_share: float = 0.5,
+    ) -> str:
+    """Keep the first and the last tokens of `text`, at most `max_tokens` in total.
+
+    The beginning of a message states the request and the end is usually the
+    latest reply, the middle is cut out.
+    """
+    offsets = tokenizer(text, add_special_tokens=False, return_offsets_mapping=True, verbose=False)["offset_mapping"]
+    if len(offsets) <= max_tokens:
+        return text
+    n_head = int(max_tokens * head_share)
+    n_tail = max_tokens - n_head
+    head = text[:offsets[n_head - 1][1]] if n_head else ""
+    tail = text[offsets[-n_tail][0]:] if n_tail else ""
+    return f"{head} {tail}".strip()
+
+
+def cls_input(
+        mode: str,
+        text: str,
+        target_text: str,
+        tokenizer: PreTrainedTokenizerBase,
+        max_tokens: int,
+        head_share: float = 0.5,
+    ) -> str:
+    """Classifier input for the message `text` with the cleared `target_text`."""
+    if mode == "raw":
+        return text
+    if mode == "target":
+        return target_text
+    if mode == "budget":
+        return head_tail(target_text, tokenizer, max_tokens, head_share)
+    raise ValueError(f"Unknown classification input: {mode}. Available: {CLS_INPUT_MODES}")
@@ -1,90 +1,101 @@
 
 import re
-from typing import Any
+from bisect import bisect_right
+from typing import Any, Callable, Iterable
 
 from .field_patterns import (
-    CARD_PATTERNS, AZS_PATTERN,
-    ORD_ROOTS, TRK_PATTERN,
-    FUEL_DT_PATTERNS, FUEL_GAS_PATTERNS,
-    FUEL_NUM_PATTERN
+    CARD_PATTERNS, CARD_NORM_PATTERN, CARD_FALLBACK_PATTERN,
+    AZS_PATTERN,
+    ORD_ROOTS, TRK_FUSED_PATTERN,
+    FUEL_FUSED_PATTERN,
 )
 
 
 TARGET_FIELDS = {"card", "azs", "trk", "fuel", "payment"}
 
-
-def clean_card(content: str) -> list[str]:
-    norm = re.sub(r'[^0-9\*]', '', content)
-    matches = []
+ENT_SEP = "<|ENT_SEP|>"
+# Снипеты сообщения склеиваются через разделитель, на котором не
+# срабатывает ни один шаблон и который для \b равносилен краю строки
+SNIPPET_SEP = "\x00"
+
+FUEL_LABELS = {"dt": "ДТ", "gas": "ГАЗ", "sot": "100"}
+
+WS_RE = re.compile(r'\s+')
+
+
+def _drop_contained(matches: Iterable[str]) -> list[str]:
+    """Уникальные совпадения, не входящие подстрокой в другие.
+
+    Совпадения склеиваются через разделитель: совпадение входит в другое,
+    если встречается в склейке не только на своём месте.
+    """
+    uniq = list(dict.fromkeys(matches))
+    if len(uniq) < 2:
+        return uniq
+    joined = SNIPPET_SEP.join(uniq)
+    res = []
+    pos = 0
+    for x in uniq:
+        if joined.find(x) == pos and joined.find(x, pos + 1) == -1:
+            res.append(x)
+        pos += len(x) + 1
+    return res
+
+
+def norm_card(snippets: list[str]) -> set[str]:
+    # шаблоны карт прогоняются по склейке всех снипетов, совпадения
+    # раскладываются по снипетам: отсев вложенных и запасной вариант - в
+    # пределах снипета
+    norm = CARD_NORM_PATTERN.sub("", SNIPPET_SEP.join(s.replace(SNIPPET_SEP, "") for s in snippets))
+    starts = [0]
+    for part in norm.split(SNIPPET_SEP)[:-1]:
+        starts.append(starts[-1] + len(part) + 1)
+    matches: list[list[str]] = [[] for _ in starts]
     for pat in CARD_PATTERNS:
-        matches.extend([m.group() for m in pat.finditer(norm)])
-    if not matches:
-        m = re.search(r'[\d\*]+', norm)
+        for m in pat.finditer(norm):
+            matches[bisect_right(starts, m.start()) - 1].append(m.group())
+    res = set()
+    for idx, snippet_matches in enumerate(matches):
+        if snippet_matches:
+            res.update(_drop_contained(snippet_matches))
+            continue
+        m = CARD_FALLBACK_PATTERN.search(norm, starts[idx], starts[idx + 1] if idx + 1 < len(starts) else len(norm))
         if m:
-            matches = [m.group()]
-    seen = set()
-    uniq = [x for x in matches if x not in seen and not seen.add(x)]
-    filtered = [x for x in uniq if not any(x != y and x in y for y in uniq)]
-    return filtered
-
-
-def clean_azs(snippet: str) -> list[str]:
-    nums = AZS_PATTERN.findall(snippet)
-    seen = set()
-    uniq = [x for x in nums if x not in seen and not seen.add(x)]
-    return uniq
-
-
-def clean_trk(snippet: str) -> list[str]:
-    norm = snippet.lower()
-    matches = []
-    for m in TRK_PATTERN.finditer(norm):
-        if m.group('num'):
-            matches.append(m.group('num'))
-        else:
-            tok = m.group('ord')
-            for root, num in ORD_ROOTS.items():
-                if tok.startswith(root):
-                    matches.append(num)
-                    break
-    seen = set()
-    uniq = [x for x in matches if x not in seen and not seen.add(x)]
-    return uniq
-
-
-def clean_fuel(snippet: str) -> list[str]:
-    matches = []
-    # дизельные виды - ДТ
-    for pat in FUEL_DT_PATTERNS:
-        if pat.search(snippet):
-            matches.append('ДТ')
-            break
-    # пропан/газ и СУГ - ГАЗ
-    for pat in FUEL_GAS_PATTERNS:
-        if pat.search(snippet):
-            matches.append('ГАЗ')
-            break
-    # сотый и однокоренные - 100
-    if re.compile(r'(?i)\bсот\w*\b').search(snippet):
-        matches.append('100')
-    # бензинные варианты топлива
-    for m in FUEL_NUM_PATTERN.finditer(snippet):
-        matches.append(m.group('num'))
-    seen = set()
-    uniq = [x for x in matches if x not in seen and not seen.add(x)]
-    return uniq
-
-
-def clean_payment(snippet: str) -> list[str]:
-    return [re.sub(r'\s+', ' ', snippet).strip()]
-
-
-CLEAN_FUNCS = {
-    "card": clean_card,
-    "azs": clean_azs,
-    "trk": clean_trk,
-    "fuel": clean_fuel,
-    "payment": clean_payment,
+            res.add(m.group())
+    return res
+
+
+def norm_azs(snippets: list[str]) -> set[str]:
+    return set(AZS_PATTERN.findall(SNIPPET_SEP.join(snippets)))
+
+
+def norm_trk(snippets: list[str]) -> set[str]:
+    res = set()
+    for m in TRK_FUSED_PATTERN.finditer(SNIPPET_SEP.join(snippets).lower()):
+        num = m.group('num') or ORD_ROOTS.get(m.group('root'))
+        if num:
+            res.add(num)
+    return res
+
+
+def norm_fuel(snippets: list[str]) -> set[str]:
+    res = set()
+    for m in FUEL_FUSED_PATTERN.finditer(SNIPPET_SEP.join(snippets)):
+        res.add(m.group('num') or FUEL_LABELS[m.lastgroup])
+    return res
+
+
+def norm_payment(snippets: list[str]) -> set[str]:
+    return {WS_RE.sub(' ', snippet).strip() for snippet in snippets}
+
+
+# Нормализаторы категорий: все снипеты категории в сообщении -> значения поля
+NORM_FUNCS: dict[str, Callable[[list[str]], set[str]]] = {
+    "card": norm_card,
+    "azs": norm_azs,
+    "trk": norm_trk,
+    "fuel": norm_fuel,
+    "payment": norm_payment,
 }
 
 def extract_fields(
@@ -94,21 +105,12 @@ def extract_fields(
     ) -> dict[str, str]:
     # TODO: Алгоритмический парсер должен возвращать строчку из сущностей через
     # специальный разделитель <|ENT_SEP|>. Чтобы их можно было здесь разделить, 
-    # обработать и почистить через CLEAN_FUNCS.
-    parsed_fields = {targ_f: set() for targ_f in TARGET_FIELDS}
+    # обработать и почистить через NORM_FUNCS.
     # alg ents
-    ent_sep = "<|ENT_SEP|>"
-    for targ_f in TARGET_FIELDS:
-        contents = alg_fields.get(targ_f, "").split(ent_sep)
-        for cont in contents:
-            contents_clear = CLEAN_FUNCS[targ_f](cont)
-            parsed_fields[targ_f].update(contents_clear)
+    snippets = {targ_f: alg_fields.get(targ_f, "").split(ENT_SEP) for targ_f in TARGET_FIELDS}
     # ner ents
     for ent in ner_res:
         if ent["cat"] in TARGET_FIELDS:
-            content = text[ent["beg"]:ent["end"]]
-            contents_clear = CLEAN_FUNCS[ent["cat"]](content)
-            parsed_fields[ent["cat"]].update(contents_clear)
-    # post process
-    parsed_fields = {k: ", ".join(sorted(v)) for k, v in parsed_fields.items()}
-    return parsed_fields
+            snippets[ent["cat"]].append(text[ent["beg"]:ent["end"]])
+    # все снипеты категории нормализуются одним вызовом
+    return {targ_f: ", ".join(sorted(NORM_FUNCS[targ_f](snippets[targ_f]))) for targ_f in TARGET_FIELDS}
@@ -9,6 +9,10 @@ CARD_PATTERNS = [
     re.compile(r'(?:7825|9000)\d{12}')# 7825680601252380    # 16 цифр, начинающихся на 7825 или 9000
 ]
 
+# Нормализация снипета карты: остаются только цифры и звёздочки (и разделитель снипетов)
+CARD_NORM_PATTERN = re.compile(r'[^0-9\*\x00]')
+CARD_FALLBACK_PATTERN = re.compile(r'[\d\*]+')
+
 AZS_PATTERN = re.compile(r'(\d+)', flags=re.IGNORECASE)
 
 ORD_ROOTS = {
@@ -17,27 +21,39 @@ ORD_ROOTS = {
     'девят': '9', 'десят': '10'
 }
 
-TRK_PATTERN = re.compile(
-    rf"(?iu)(?P<ord>(?:{'|'.join(ORD_ROOTS.keys())})\w*)"
+# Порядковое числительное по корню, корень ищется группой `root`
+TRK_FUSED_PATTERN = re.compile(
+    rf"(?iu)(?P<root>{'|'.join(ORD_ROOTS.keys())})\w*"
     r"|(?P<num>(?<!\d)\d{1,2}(?!\d))"
 )
 
-FUEL_DT_PATTERNS = [
-    re.compile(r'(?i)\bдиз(?:ел|топ)\w*\b'),
-    re.compile(r'(?i)\bдиз\.\s*топлив\w*\b'),
-    re.compile(r'(?i)\bд/т\b'),
-    re.compile(r'(?i)\bдт\b'),
+FUEL_DT_RES = [
+    r'\bдиз(?:ел|топ)\w*\b',
+    r'\bдиз\.\s*топлив\w*\b',
+    r'\bд/т\b',
+    r'\bдт\b',
 ]
 
-FUEL_GAS_PATTERNS = [
-    re.compile(r'(?i)\b(?:пропан|газ)\w*\b'),
-    re.compile(r'(?i)\bсуг\b'),
+FUEL_GAS_RES = [
+    r'\b(?:пропан|газ)\w*\b',
+    r'\bсуг\b',
 ]
 
-FUEL_NUM_PATTERN = re.compile(
-    r'(?iu)\b'
+FUEL_SOT_RE = r'\bсот\w*\b'     # сотый и однокоренные
+
+FUEL_NUM_RE = (
+    r'\b'
     r'(?:(?:аи|а|g)[-\s]?)?'    # опционально АИ, А или G
     r'(?P<num>\d{2,3})'         # 2–3 цифры
     r'(?:-м|-?го)?'             # опциональный суффикс
     r'\b'
 )
+
+# Все виды топлива за один проход: совпадения альтернатив не пересекаются,
+# так как каждая начинается и заканчивается на границе слова
+FUEL_FUSED_PATTERN = re.compile(
+    rf"(?iu)(?P<dt>{'|'.join(FUEL_DT_RES)})"
+    rf"|(?P<gas>{'|'.join(FUEL_GAS_RES)})"
+    rf"|(?P<sot>{FUEL_SOT_RE})"
+    rf"|{FUEL_NUM_RE}"
+)
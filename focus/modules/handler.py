@@ -1,7 +1,13 @@
 
-from loguru import logger
+import hashlib
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Optional
 
-from focus import ModelRes
+
+from focus import ModelRes, metrics, version
+from focus.log import MessageLog, quiet
 from .pattern_cls import pattern_classifier, PAT_CLS_UNITS
 from .alg_parser import parse_msg
 from .ner import Ner
@@ -9,55 +15,182 @@ from .field import extract_fields
 from .target_text import extract_target_text
 from .cls_clear_text import clear_text
 from .cls import Cls
+from .cls_input import cls_input
+from .result_cache import ResultCache, make_result_cache
+from .stage_plan import STAGE_PLANS, get_plan, plan_label
 from .cls_cfg import (
     TOPT_TOKENIZER_PATH as CLS_TOPT_TOKENIZER_PATH,
     TOPT_MODELS_PATHS as CLS_TOPT_MODELS_PATHS,
     SUBT_TOKENIZER_PATH as CLS_SUBT_TOKENIZER_PATH,
     SUBT_MODELS_PATHS as CLS_SUBT_MODELS_PATHS,
+    SUBT_MAX_LOADED as CLS_SUBT_MAX_LOADED,
+    SUBT_MAX_MEM_MB as CLS_SUBT_MAX_MEM_MB,
+    SUBT_WARMUP_TOPICS as CLS_SUBT_WARMUP_TOPICS,
 )
 
 
 NER_MODEL_P = "./models/ner_2025-07-29_3-shuffle.bin"
 DEVICE = "cpu"
+# "torch", "onnx" or "int8", the latter two need `python -m focus.export`
+INF_BACKEND = "torch"
+# NER runs over windows of at most NER_WINDOW_TOKENS tokens (None: the model
+# max length, 512 if the tokenizer has none) overlapping by NER_WINDOW_OVERLAP,
+# NER_MAX_BATCH_WINDOWS per forward pass. Tokens beyond NER_MAX_TOKENS are not processed, None: no cap.
+NER_WINDOW_TOKENS = None
+NER_WINDOW_OVERLAP = 32
+NER_MAX_BATCH_WINDOWS = 32
+NER_MAX_TOKENS = None
+
+# Classifier input: "raw" message, cleared "target" text or the target text
+# cut to CLS_INPUT_TOKENS head and tail tokens ("budget"), CLS_INPUT_HEAD_SHARE
+# of them from the head. Compare the modes with `python -m focus.cls_input_eval`.
+CLS_INPUT = "raw"
+CLS_INPUT_TOKENS = 256
+CLS_INPUT_HEAD_SHARE = 0.5
+
+# Result cache: None, "memory" (per worker) or "sqlite" (shared by the workers
+# of a node). Limits are None for no limit.
+RESULT_CACHE = None
+RESULT_CACHE_PATH = "./cache/results.sqlite"
+RESULT_CACHE_MAX_ENTRIES = 100_000
+RESULT_CACHE_MAX_MB = None
+RESULT_CACHE_TTL_S = 24 * 3600
+
+
+def model_version(backend: str) -> str:
+    """Identity of the models and settings the handler results depend on.
+
+    Checkpoints are identified by path and modification time, so replacing a
+    model invalidates cached results.
+    """
+    paths = [NER_MODEL_P, CLS_TOPT_TOKENIZER_PATH, CLS_SUBT_TOKENIZER_PATH]
+    for models_paths in (CLS_TOPT_MODELS_PATHS, CLS_SUBT_MODELS_PATHS):
+        for lvl_paths in models_paths.values():
+            paths.extend([lvl_paths["model"], lvl_paths["labels"]])
+    parts = [version, backend, repr(STAGE_PLANS), f"cls:{CLS_INPUT}:{CLS_INPUT_TOKENS}:{CLS_INPUT_HEAD_SHARE}", f"ner:{NER_WINDOW_TOKENS}:{NER_WINDOW_OVERLAP}:{NER_MAX_TOKENS}"]
+    parts.extend(f"{path}:{os.path.getmtime(path) if os.path.exists(path) else ''}" for path in paths)
+    return hashlib.sha256("\n".join(parts).encode("utf-8")).hexdigest()[:16]
 
 
 class ExtrClsHandler:
-    def __init__(self):
-        self.ner_pipe = Ner(NER_MODEL_P, DEVICE)
-        self.cls_pipe = Cls(
+    def __init__(
+            self,
+            backend: str = INF_BACKEND,
+            cache: Optional[str] = RESULT_CACHE,
+            cls_input_mode: str = CLS_INPUT,
+        ):
+        self.backend = backend
+        self.cls_input_mode = cls_input_mode
+        self.cache: Optional[ResultCache] = make_result_cache(
+            cache,
+            model_version(self.backend),
+            max_entries=RESULT_CACHE_MAX_ENTRIES,
+            max_mb=RESULT_CACHE_MAX_MB,
+            ttl_s=RESULT_CACHE_TTL_S,
+            path=RESULT_CACHE_PATH,
+        )
+        # the models are independent, loading them in parallel overlaps the
+        # file reads and the weight deserialization
+        self.load_s: dict[str, float] = {}
+        with ThreadPoolExecutor(2, thread_name_prefix="load") as pool:
+            ner_future = pool.submit(self._timed, "ner", self._load_ner)
+            cls_future = pool.submit(self._timed, "cls", self._load_cls)
+            self.ner_pipe: Ner = ner_future.result()
+            self.cls_pipe: Cls = cls_future.result()
+
+    def _timed(self, name: str, load: Callable[[], Any]) -> Any:
+        start = time.perf_counter()
+        res = load()
+        self.load_s[name] = round(time.perf_counter() - start, 3)
+        return res
+
+    def _load_ner(self) -> Ner:
+        return Ner(
+            NER_MODEL_P,
+            DEVICE,
+            backend=self.backend,
+            window_tokens=NER_WINDOW_TOKENS,
+            window_overlap=NER_WINDOW_OVERLAP,
+            max_tokens=NER_MAX_TOKENS,
+            max_batch_windows=NER_MAX_BATCH_WINDOWS,
+        )
+
+    def _load_cls(self) -> Cls:
+        return Cls(
             CLS_TOPT_TOKENIZER_PATH,
             CLS_TOPT_MODELS_PATHS,
             CLS_SUBT_TOKENIZER_PATH,
             CLS_SUBT_MODELS_PATHS,
             DEVICE,
+            backend=self.backend,
+            subt_max_loaded=CLS_SUBT_MAX_LOADED,
+            subt_max_mem_mb=CLS_SUBT_MAX_MEM_MB,
+            subt_warmup=CLS_SUBT_WARMUP_TOPICS,
         )
 
-    def __call__(self, text: str) -> ModelRes:
-        logger.warning(f"Input text: {text}")
+    @staticmethod
+    def _parse(text: str, msg_log: Optional[MessageLog] = None) -> tuple[str, str, dict[str, str]]:
+        msg_log = msg_log or MessageLog(sample_rate=0)
+        msg_log.payload("input", text=text)
 
-        pat_idx, pat_name = pattern_classifier(text, PAT_CLS_UNITS)
-        logger.warning(f"Pattern: ({pat_idx}, {pat_name})")
+        start = time.perf_counter()
+        _, pat_name = pattern_classifier(text, PAT_CLS_UNITS)
+        if metrics.observing():
+            metrics.STAGE_SECONDS.labels("pattern", pat_name).observe(time.perf_counter() - start)
+            metrics.INPUT_CHARS.inc(len(text))
+            metrics.PATTERNS.labels(pat_name).inc()
+        msg_log.note(pattern=pat_name, chars=len(text))
 
-        alg_text, alg_fields = parse_msg(pat_name, text)
-        logger.warning(f"Alg parsed text: {alg_text}")
-        logger.warning(f"Alg parsed fields: {alg_fields}")
+        with metrics.patterns([pat_name]), metrics.stage_timer("parse"):
+            alg_text, alg_fields = parse_msg(pat_name, text)
+        msg_log.payload("parse", pattern=pat_name, text=alg_text, fields=alg_fields)
+        return pat_name, alg_text, alg_fields
 
-        ner_res = self.ner_pipe(alg_text)
-        logger.warning(f"NER res: {ner_res}")
+    @staticmethod
+    def _extract(
+            alg_text: str,
+            alg_fields: dict[str, str],
+            ner_res: list[dict[str, Any]],
+            msg_log: Optional[MessageLog] = None,
+        ) -> tuple[dict[str, str], str]:
+        msg_log = msg_log or MessageLog(sample_rate=0)
+        msg_log.payload("ner", ents=ner_res)
 
-        target_fields = extract_fields(alg_text, ner_res, alg_fields)
-        logger.warning(f"Target fields: {target_fields}")
-        
-        target_text, target_ents = extract_target_text(alg_text, ner_res)
-        logger.warning(f"Target text: {target_text}")
-        logger.warning(f"Target ents: {target_ents}")
+        with metrics.stage_timer("fields"):
+            target_fields = extract_fields(alg_text, ner_res, alg_fields)
+        msg_log.payload("fields", fields=target_fields)
+        msg_log.note(fields=sorted(field for field, value in target_fields.items() if value))
 
-        target_text_clear = clear_text(target_text)
-        logger.warning(f"Target text Clear: {target_text_clear}")
+        with metrics.stage_timer("target_text"):
+            target_text, target_ents = extract_target_text(alg_text, ner_res)
+        msg_log.payload("target_text", text=target_text, ents=target_ents)
 
-        text_topic, text_sub = self.cls_pipe.inf(text)
-        logger.warning(f"Text topic: {text_topic}")
-        logger.warning(f"Text sub: {text_sub}")
+        with metrics.stage_timer("clear_text"):
+            target_text_clear = clear_text(target_text)
+        msg_log.payload("target_text", clear=target_text_clear)
+        return target_fields, target_text_clear
+
+    def _cls_text(self, text: str, target_text: str) -> str:
+        return cls_input(
+            self.cls_input_mode,
+            text,
+            target_text,
+            self.cls_pipe.topic_pipe.tokenizer,
+            CLS_INPUT_TOKENS,
+            CLS_INPUT_HEAD_SHARE,
+        )
+
+    @staticmethod
+    def _form_res(
+            target_fields: dict[str, str],
+            text_topic: str,
+            text_sub: str,
+            msg_log: Optional[MessageLog] = None,
+        ) -> ModelRes:
+        if msg_log is not None:
+            msg_log.payload("cls", topic=text_topic, sub=text_sub)
+            msg_log.note(topic=text_topic, sub=text_sub)
+            msg_log.done()
 
         res = ModelRes(
             card=target_fields["card"],
@@ -67,5 +200,138 @@ class ExtrClsHandler:
             topic=text_topic,
             sub=text_sub,
         )
+        return res
 
+    def __call__(self, text: str) -> ModelRes:
+        if self.cache is None:
+            return self._process(text)
+        key = self.cache.key(text)
+        res = self.cache.get(key)
+        if res is None:
+            res = self._process(text)
+            self.cache.put(key, res)
+        else:
+            self._log_cached(res)
         return res
+
+    @staticmethod
+    def _log_cached(res: ModelRes):
+        msg_log = MessageLog(sample_rate=0)
+        msg_log.note(cache="hit", topic=res.topic, sub=res.sub)
+        msg_log.done()
+
+    @staticmethod
+    def _report_plan(pat_name: str, run_ner: bool, run_cls: bool, msg_log: MessageLog):
+        if metrics.observing():
+            metrics.PLANS.labels(pat_name, plan_label(run_ner, run_cls)).inc()
+        msg_log.note(stages=plan_label(run_ner, run_cls))
+
+    def _process(self, text: str) -> ModelRes:
+        start = time.perf_counter()
+        msg_log = MessageLog()
+        pat_name, alg_text, alg_fields = self._parse(text, msg_log)
+        plan = get_plan(pat_name)
+        run_ner, run_cls = plan.stages(alg_text)
+        with metrics.patterns([pat_name]):
+            ner_res = []
+            if run_ner:
+                with metrics.stage_timer("ner"):
+                    ner_res = self.ner_pipe(alg_text)
+            target_fields, target_text = self._extract(alg_text, alg_fields, ner_res, msg_log)
+            cls_text = self._cls_text(text, target_text)
+            run_cls = run_cls and plan.classifies(cls_text)
+            if run_cls:
+                text_topic, text_sub = self.cls_pipe.inf(cls_text)
+            else:
+                text_topic, text_sub = plan.fallback_topic, plan.fallback_sub
+        self._report_plan(pat_name, run_ner, run_cls, msg_log)
+        if metrics.observing():
+            metrics.STAGE_SECONDS.labels("total", pat_name).observe(time.perf_counter() - start)
+        return self._form_res(target_fields, text_topic, text_sub, msg_log)
+
+    def warm_up(self, texts: list[str], observe: bool = False):
+        """Run `texts` through the models batched and one by one, bypassing
+        the result cache, so the cached results do not skip the models.
+
+        Warm-up messages are neither counted in the metrics nor logged,
+        unless `observe`.
+        """
+        if observe:
+            self._warm_up(texts)
+            return
+        with metrics.paused(), quiet():
+            self._warm_up(texts)
+
+    def _warm_up(self, texts: list[str]):
+        self._process_batch(texts)
+        for text in texts:
+            self._process(text)
+
+    def batch(self, texts: list[str]) -> list[ModelRes]:
+        """Process several messages with batched NER and classification.
+
+        Results keep the order of `texts` and match per-message `__call__`.
+        Cached and repeated messages are processed once.
+        """
+        if self.cache is None:
+            return self._process_batch(texts)
+        keys = [self.cache.key(text) for text in texts]
+        res: dict[str, ModelRes] = {}
+        miss_texts: dict[str, str] = {}
+        for key, text in zip(keys, texts):
+            if key in res or key in miss_texts:
+                continue
+            cached = self.cache.get(key)
+            if cached is None:
+                miss_texts[key] = text
+            else:
+                res[key] = cached
+                self._log_cached(cached)
+        if miss_texts:
+            for key, miss_res in zip(miss_texts, self._process_batch(list(miss_texts.values()))):
+                self.cache.put(key, miss_res)
+                res[key] = miss_res
+        return [res[key] for key in keys]
+
+    def _process_batch(self, texts: list[str]) -> list[ModelRes]:
+        start = time.perf_counter()
+        msg_logs = [MessageLog() for _ in texts]
+        parsed = [self._parse(text, msg_log) for text, msg_log in zip(texts, msg_logs)]
+        pat_names = [pat_name for pat_name, _, _ in parsed]
+        plans = [get_plan(pat_name) for pat_name in pat_names]
+        stages = [plan.stages(alg_text) for plan, (_, alg_text, _) in zip(plans, parsed)]
+        ners_res: list[list[dict[str, Any]]] = [[] for _ in texts]
+        ner_idxs = [i for i, (run_ner, _) in enumerate(stages) if run_ner]
+        if ner_idxs:
+            with metrics.patterns([pat_names[i] for i in ner_idxs]), metrics.stage_timer("ner"):
+                batch_res = self.ner_pipe.batch([parsed[i][1] for i in ner_idxs])
+            for i, ner_res in zip(ner_idxs, batch_res):
+                ners_res[i] = ner_res
+        targets_fields = []
+        cls_texts = []
+        for text, (pat_name, alg_text, alg_fields), ner_res, msg_log in zip(texts, parsed, ners_res, msg_logs):
+            with metrics.patterns([pat_name]):
+                target_fields, target_text = self._extract(alg_text, alg_fields, ner_res, msg_log)
+            targets_fields.append(target_fields)
+            cls_texts.append(self._cls_text(text, target_text))
+        cls_idxs = [
+            i for i, (plan, (_, run_cls), cls_text) in enumerate(zip(plans, stages, cls_texts))
+            if run_cls and plan.classifies(cls_text)
+        ]
+        cls_res = [(plan.fallback_topic, plan.fallback_sub) for plan in plans]
+        if cls_idxs:
+            with metrics.patterns([pat_names[i] for i in cls_idxs]):
+                batch_res = self.cls_pipe.inf_batch([cls_texts[i] for i in cls_idxs])
+            for i, labels in zip(cls_idxs, batch_res):
+                cls_res[i] = labels
+        cls_run = set(cls_idxs)
+        for i, (pat_name, (run_ner, _)) in enumerate(zip(pat_names, stages)):
+            self._report_plan(pat_name, run_ner, i in cls_run, msg_logs[i])
+        if metrics.observing():
+            elapsed = (time.perf_counter() - start) / len(texts) if texts else 0.0
+            for pat_name in pat_names:
+                metrics.STAGE_SECONDS.labels("total", pat_name).observe(elapsed)
+        return [
+            self._form_res(target_fields, text_topic, text_sub, msg_log)
+            for target_fields, (text_topic, text_sub), msg_log in zip(targets_fields, cls_res, msg_logs)
+        ]
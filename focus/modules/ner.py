@@ -1,51 +1,224 @@
+from typing import Any, Optional
 
-from typing import Any
+import numpy as np
+import torch
 from loguru import logger
 from transformers import (
-    pipeline,
     AutoModelForTokenClassification as AMFTC,
     AutoTokenizer,
 )
 
+from focus.metrics import observe_tokens
+from .backend import load_model
 
-NER_FIELDS_MAP = {
-    "entity_group": "cat",
-    "score": "p",
-    "start": "beg",
-    "end": "end",
-    "word": "word",
-}
+
+# tokenizers without a max length report a huge sentinel, windows are then
+# limited to the max length of the usual encoders
+FALLBACK_MAX_LENGTH = 512
+MAX_LENGTH_LIMIT = 100_000
+
+
+def tokenizer_max_length(tokenizer) -> int:
+    """`model_max_length` of `tokenizer`, FALLBACK_MAX_LENGTH if it is unset."""
+    max_length = tokenizer.model_max_length
+    if not max_length or max_length > MAX_LENGTH_LIMIT:
+        logger.warning(f"Tokenizer has no max length ({max_length}), using {FALLBACK_MAX_LENGTH}")
+        return FALLBACK_MAX_LENGTH
+    return max_length
+
+
+def _get_tag(entity_name: str) -> tuple[str, str]:
+    if entity_name.startswith("B-"):
+        return "B", entity_name[2:]
+    if entity_name.startswith("I-"):
+        return "I", entity_name[2:]
+    # not in B-, I- format: continuation
+    return "I", entity_name
+
+
+class LabelScheme:
+    """BIO tagging of the model labels as arrays indexed by label id."""
+
+    def __init__(self, id2label: dict[int, str]):
+        labels = [id2label[idx] for idx in range(len(id2label))]
+        tags = [_get_tag(label) for label in labels]
+        tag_ids = {tag: idx for idx, tag in enumerate(dict.fromkeys(tag for _, tag in tags))}
+        self.is_begin = np.array([bi == "B" for bi, _ in tags], dtype=bool)
+        self.tag = np.array([tag_ids[tag] for _, tag in tags], dtype=np.int64)
+        # an entity is named after the label of its first token
+        self.cats = [label.split("-", 1)[-1] for label in labels]
+        self.is_outside = np.array([cat == "O" for cat in self.cats], dtype=bool)
+
+
+def aggregate_bio(
+        scores: np.ndarray,
+        offsets: np.ndarray,
+        text_starts: list[int],
+        scheme: LabelScheme,
+    ) -> list[list[dict[str, Any]]]:
+    """Group token predictions into entities like the "ner" pipeline with
+    `aggregation_strategy="simple"` does, for the tokens of several texts at
+    once.
+
+    `scores` and `offsets` are the label scores and character offsets of the
+    tokens of all texts concatenated, `text_starts` - the index of the first
+    token of every text. A token starts a new entity if it is tagged B- or
+    its tag differs from the previous one, entities do not cross texts.
+    Entity score is the mean of its token scores.
+    """
+    token_text = np.repeat(
+        np.arange(len(text_starts)),
+        np.diff(np.append(text_starts, len(scores))),
+    )
+    labels = scores.argmax(axis=-1)
+    token_scores = scores[np.arange(len(scores)), labels]
+    tags = scheme.tag[labels]
+    new_entity = np.ones(len(scores), dtype=bool)
+    new_entity[1:] = scheme.is_begin[labels[1:]] | (tags[1:] != tags[:-1]) | (token_text[1:] != token_text[:-1])
+    begins = np.flatnonzero(new_entity)
+    ends = np.append(begins[1:], len(scores))
+    entity_labels = labels[begins]
+    is_entity = ~scheme.is_outside[entity_labels]
+    res: list[list[dict[str, Any]]] = [[] for _ in text_starts]
+    for text_idx, label, beg_token, end_token, beg, end in zip(
+            token_text[begins[is_entity]].tolist(),
+            entity_labels[is_entity].tolist(),
+            begins[is_entity].tolist(),
+            ends[is_entity].tolist(),
+            offsets[begins[is_entity], 0].tolist(),
+            offsets[ends[is_entity] - 1, 1].tolist(),
+        ):
+        # the pipeline's np.nanmean: float32 sum, divided in float64
+        p = float(np.float32(np.float64(token_scores[beg_token:end_token].sum()) / (end_token - beg_token)))
+        res[text_idx].append({"cat": scheme.cats[label], "p": p, "beg": beg, "end": end})
+    return res
+
+
+def window_starts(n_tokens: int, window: int, overlap: int) -> list[int]:
+    """Token offsets of the windows covering `n_tokens`, consecutive windows
+    share `overlap` tokens."""
+    starts = [0]
+    while starts[-1] + window < n_tokens:
+        starts.append(starts[-1] + window - overlap)
+    return starts
 
 
 class Ner:
-    def __init__(self, model_p: str, device: str):
+    """Token classification over windows of at most `window_tokens` tokens.
+
+    Long texts are split into windows overlapping by `window_overlap` tokens,
+    all windows of a call are run as batches of `max_batch_windows`. Every
+    token takes the scores of the window it is farther from the edge of, then
+    entities are grouped over the whole text, so entities crossing window
+    borders are not split. Tokens beyond `max_tokens`, if set, are not
+    processed.
+    """
+
+    def __init__(
+            self,
+            model_p: str,
+            device: str,
+            backend: str = "torch",
+            window_tokens: Optional[int] = None,
+            window_overlap: int = 32,
+            max_tokens: Optional[int] = None,
+            max_batch_windows: int = 32,
+        ):
         self.model_p = model_p
         self.device = device
+        self.backend = backend
         self.tokenizer = AutoTokenizer.from_pretrained(self.model_p)
         logger.warning(f'NER tokenizer: {self.model_p}')
-        self.model = AMFTC.from_pretrained(self.model_p)
-        logger.warning(f'NER model: {self.model_p}')
-        self.model.to(self.device)
-        self.model.eval()
-        self.ner_pipe = pipeline(
-            "ner",
-            model=self.model,
-            tokenizer=self.tokenizer,
-            aggregation_strategy="simple",
-        )
-        self.ner_pipe
-
-    @staticmethod
-    def _post_proc(ner_raw: list[dict[str, Any]]) -> list[dict[str, Any]]:
-        ner_proc = []
-        for ent in ner_raw:
-            ent_proc = {NER_FIELDS_MAP[k]: v for k, v in ent.items()}
-            del ent_proc["word"]
-            ent_proc["p"] = ent_proc["p"].item()
-            ner_proc.append(ent_proc)
-        return ner_proc
+        self.model = load_model(AMFTC, self.model_p, self.backend, self.device)
+        logger.warning(f'NER model ({self.backend}): {self.model_p}')
+        self.label_scheme = LabelScheme(self.model.config.id2label)
+        # window budget without the special tokens
+        max_window = tokenizer_max_length(self.tokenizer) - self.tokenizer.num_special_tokens_to_add()
+        self.window_tokens = min(window_tokens, max_window) if window_tokens else max_window
+        if not 0 <= window_overlap < self.window_tokens // 2:
+            raise ValueError(
+                f"NER window overlap must be in [0, {self.window_tokens // 2}), got {window_overlap}"
+            )
+        self.window_overlap = window_overlap
+        self.max_tokens = max_tokens
+        self.max_batch_windows = max_batch_windows
+
+    def _scores(self, windows: list[list[int]]) -> list[np.ndarray]:
+        """Label scores of the tokens of every window, without special tokens."""
+        # special tokens before the window tokens
+        n_prefix = self.tokenizer.build_inputs_with_special_tokens([-1]).index(-1)
+        scores = []
+        for i in range(0, len(windows), self.max_batch_windows):
+            batch_ids = [
+                self.tokenizer.build_inputs_with_special_tokens(ids)
+                for ids in windows[i:i + self.max_batch_windows]
+            ]
+            input_ids = np.full((len(batch_ids), max(map(len, batch_ids))), self.tokenizer.pad_token_id)
+            attention_mask = np.zeros_like(input_ids)
+            for j, ids in enumerate(batch_ids):
+                input_ids[j, :len(ids)] = ids
+                attention_mask[j, :len(ids)] = 1
+            enc = {"input_ids": input_ids, "attention_mask": attention_mask}
+            if "token_type_ids" in self.tokenizer.model_input_names:
+                enc["token_type_ids"] = np.zeros_like(input_ids)
+            enc = {name: torch.from_numpy(value).to(self.device) for name, value in enc.items()}
+            with torch.inference_mode():
+                logits = self.model(**enc).logits.float().cpu().numpy()
+            maxes = np.max(logits, axis=-1, keepdims=True)
+            shifted_exp = np.exp(logits - maxes)
+            probs = shifted_exp / shifted_exp.sum(axis=-1, keepdims=True)
+            scores.extend(
+                probs[j, n_prefix:n_prefix + len(ids)]
+                for j, ids in enumerate(windows[i:i + self.max_batch_windows])
+            )
+        return scores
+
+    def _ner(self, texts: list[str]) -> list[list[dict[str, Any]]]:
+        enc = self.tokenizer(texts, add_special_tokens=False, return_offsets_mapping=True, verbose=False)
+        texts_ids = enc["input_ids"]
+        n_truncated = 0
+        if self.max_tokens is not None:
+            for i, ids in enumerate(texts_ids):
+                if len(ids) > self.max_tokens:
+                    logger.warning(f"NER input cut to {self.max_tokens} of {len(ids)} tokens")
+                    texts_ids[i] = ids[:self.max_tokens]
+                    n_truncated += 1
+        observe_tokens("ner", [len(ids) for ids in texts_ids], n_truncated)
+        windows_starts = [window_starts(len(ids), self.window_tokens, self.window_overlap) for ids in texts_ids]
+        windows = [
+            ids[start:start + self.window_tokens]
+            for ids, starts in zip(texts_ids, windows_starts)
+            for start in starts
+        ]
+        windows_scores = iter(self._scores(windows))
+        n_labels = self.model.config.num_labels
+        half_overlap = self.window_overlap // 2
+        # tokens of all texts are aggregated at once
+        text_starts = np.cumsum([0] + [len(ids) for ids in texts_ids[:-1]]).tolist()
+        scores = np.empty((sum(map(len, texts_ids)), n_labels), dtype=np.float32)
+        offsets = np.empty((len(scores), 2), dtype=np.int64)
+        for text_start, ids, text_offsets, starts in zip(text_starts, texts_ids, enc["offset_mapping"], windows_starts):
+            for k, start in enumerate(starts):
+                window_scores = next(windows_scores)
+                beg = start + half_overlap if k else start
+                end = starts[k + 1] + half_overlap if k + 1 < len(starts) else len(ids)
+                scores[text_start + beg:text_start + end] = window_scores[beg - start:end - start]
+            offsets[text_start:text_start + len(ids)] = np.asarray(text_offsets[:len(ids)], dtype=np.int64).reshape(-1, 2)
+        return aggregate_bio(scores, offsets, text_starts, self.label_scheme)
 
     def __call__(self, text: str):
-        ner_raw = self.ner_pipe(text)
-        ner_proc = self._post_proc(ner_raw)
-        return ner_proc
+        if not text.strip():
+            return []
+        return self._ner([text])[0]
+
+    def batch(self, texts: list[str]) -> list[list[dict[str, Any]]]:
+        """Run NER over several texts, windows of all texts are batched together.
+
+        Empty and whitespace-only texts have no entities and skip the model.
+        """
+        res: list[list[dict[str, Any]]] = [[] for _ in texts]
+        idxs = [i for i, text in enumerate(texts) if text.strip()]
+        if idxs:
+            for i, ents in zip(idxs, self._ner([texts[i] for i in idxs])):
+                res[i] = ents
+        return res
@@ -1,116 +1,135 @@
-
 from typing import Any, Callable
 from dataclasses import dataclass
 
 
+NO_TEXT_KEYS = (
+    'no text message => see attachment',
+)
+
+OTRS_KEYS = (
+    'Письмо сгенерировано автоматически',
+    'ДАННЫЕ ДЛЯ OTRS',
+    'СООБЩЕНИЕ',
+)
+
+ACCREMOVAL_KEYS = (
+    'УДАЛИТЬ АККАУНТ',
+)
+
+STANDARD_KEYS = (
+    # 'Номер заказа',
+    'Контактный телефон',
+    'Номер карты ПЛ',
+    'Объект',
+    'Адрес',
+    'Примечание',
+)
+
+UDC_KEYS = (
+    'Причина обращения',
+    'Номер ОРТ',
+    # 'Номер ТРК',
+    'ТРК',
+    'Вид НП',
+    'Наличие транзакции',
+    'Краткое описание обращения(хронология)'
+)
+
+HOTLINE_HOTLINE_EMPTY_KEYS = (
+    "пересылаем на рассмотрение сообщение Горячей линии",
+    "Оператор Горячей линии по противодействию мошенничеству, коррупции и другим нарушениям Корпоративного кодекса",
+    ": Hot-line <hot-line@gazprom-neft.ru>",
+)
+HOTLINE_HOTLINE_EMPTY_ANY_KEYS = (
+    "Voice message 800 700 6500",
+    "The letter was sent automatically, please do not reply to this message.",
+)
+
+HOTLINE_HOTLINE_KEYS = (
+    'пересылаем на рассмотрение сообщение Горячей линии',
+    'Оператор Горячей линии по противодействию мошенничеству, коррупции и другим нарушениям Корпоративного кодекса',
+    ': Hot-line <hot-line@gazprom-neft.ru>',
+    'Сообщение из формы HOTLINE',
+)
+
+HOTLINE_FREE_KEYS = (
+    'пересылаем на рассмотрение сообщение Горячей линии',
+    'Оператор Горячей линии по противодействию мошенничеству, коррупции и другим нарушениям Корпоративного кодекса',
+    'Hot-line <hot-line@gazprom-neft.ru>',
+)
+
+HOTLINE_FEEDBACK_KEYS = (
+    'Информационное сообщение сайта www.gazprom-neft.ru',
+    'Вам было отправлено сообщение через форму обратной связи',
+    'Сообщение сгенерировано автоматически.',
+)
+
+CORP_RES_KEYS = (
+    'Информационная служба',
+    'ПАО "ГАЗПРОМ НЕФТЬ"',
+    'Россия, 190000, Санкт-Петербург, ул. Почтамтская, д.3-5',
+    'WWW.GAZPROM-NEFT.RU',
+)
+
+COMPLAINT_KEYS = (
+    'Суть обращения',
+    'Принятые меры',
+    'Ответ клиенту',
+)
+
+
 def classify_no_text(msg_text: str) -> bool:
     """Classify 0_no-text pattern."""
-    key = 'no text message => see attachment'
-    return key in msg_text
+    return all(key in msg_text for key in NO_TEXT_KEYS)
 
 
 def classify_otrs(msg_text: str) -> bool:
     """Classify 1_otrs pattern."""
-    keys = [
-        'Письмо сгенерировано автоматически',
-        'ДАННЫЕ ДЛЯ OTRS',
-        'СООБЩЕНИЕ',
-    ]
-    return all([key in msg_text for key in keys])
+    return all(key in msg_text for key in OTRS_KEYS)
 
 
 def classify_accremoval(msg_text: str) -> bool:
     """Classify 2_accremoval pattern."""
-    key = 'УДАЛИТЬ АККАУНТ'
-    return key in msg_text
+    return all(key in msg_text for key in ACCREMOVAL_KEYS)
 
 
 def classify_standard(msg_text: str) -> bool:
     """Classify 3_standard pattern."""
-    keys = [
-        # 'Номер заказа',
-        'Контактный телефон',
-        'Номер карты ПЛ',
-        'Объект',
-        'Адрес',
-        'Примечание',
-    ]
-    return all([key in msg_text for key in keys])
+    return all(key in msg_text for key in STANDARD_KEYS)
 
 
 def classify_udc(msg_text: str) -> bool:
     """Classify test udc pattern."""
-    keys = [
-        'Причина обращения',
-        'Номер ОРТ',
-        # 'Номер ТРК',
-        'ТРК',
-        'Вид НП',
-        'Наличие транзакции',
-        'Краткое описание обращения(хронология)'
-    ]
-    return all([key in msg_text for key in keys])
+    return all(key in msg_text for key in UDC_KEYS)
 
 
 def classify_hotline_hotline_empty(msg_text: str) -> bool:
     """Classify test hotline-hotline empty pattern."""
-    keys_hotline = [
-        "пересылаем на рассмотрение сообщение Горячей линии",
-        "Оператор Горячей линии по противодействию мошенничеству, коррупции и другим нарушениям Корпоративного кодекса",
-        ": Hot-line <hot-line@gazprom-neft.ru>",
-        
-    ]
-    keys_empty = [
-        "Voice message 800 700 6500",
-        "The letter was sent automatically, please do not reply to this message.",
-    ]
-    hotline_q = all([key in msg_text for key in keys_hotline])
+    hotline_q = all(key in msg_text for key in HOTLINE_HOTLINE_EMPTY_KEYS)
     if not hotline_q:
         return False
-    emty_q = any([key in msg_text for key in keys_empty])
+    emty_q = any(key in msg_text for key in HOTLINE_HOTLINE_EMPTY_ANY_KEYS)
     return emty_q
 
 
 def classify_hotline_hotline(msg_text: str) -> bool:
     """Classify test hotline-hotline pattern."""
-    keys = [
-        'пересылаем на рассмотрение сообщение Горячей линии',
-        'Оператор Горячей линии по противодействию мошенничеству, коррупции и другим нарушениям Корпоративного кодекса',
-        ': Hot-line <hot-line@gazprom-neft.ru>',
-        'Сообщение из формы HOTLINE',
-    ]
-    return all([key in msg_text for key in keys])
+    return all(key in msg_text for key in HOTLINE_HOTLINE_KEYS)
 
 
 def classify_hotline_free(msg_text: str) -> bool:
     """Classify test hotline-free pattern."""
-    keys = [
-        'пересылаем на рассмотрение сообщение Горячей линии',
-        'Оператор Горячей линии по противодействию мошенничеству, коррупции и другим нарушениям Корпоративного кодекса',
-        'Hot-line <hot-line@gazprom-neft.ru>',
-    ]
-    return all([key in msg_text for key in keys])
+    return all(key in msg_text for key in HOTLINE_FREE_KEYS)
 
 
 def classify_hotline_feedback(msg_text: str) -> bool:
     """Classify test hotline-feedback pattern."""
-    keys = [
-        'Информационное сообщение сайта www.gazprom-neft.ru',
-        'Вам было отправлено сообщение через форму обратной связи',
-        'Сообщение сгенерировано автоматически.',
-    ]
-    return all([key in msg_text for key in keys])
+    return all(key in msg_text for key in HOTLINE_FEEDBACK_KEYS)
 
 
 def classify_corp_res(msg_text: str) -> bool:
     """Classify CorpRes pattern."""
-    keys = [
-        'Информационная служба',
-        'ПАО "ГАЗПРОМ НЕФТЬ"',
-        'Россия, 190000, Санкт-Петербург, ул. Почтамтская, д.3-5',
-        'WWW.GAZPROM-NEFT.RU',
-    ]
-    return all([key in msg_text for key in keys])
+    return all(key in msg_text for key in CORP_RES_KEYS)
 
 
 def classify_other(msg_text: str) -> bool:
@@ -120,12 +139,7 @@ def classify_other(msg_text: str) -> bool:
 
 def classify_complaint(msg_text: str) -> bool:
     """Classify 1_otrs pattern."""
-    keys = [
-        'Суть обращения',
-        'Принятые меры',
-        'Ответ клиенту',
-    ]
-    return all([key in msg_text for key in keys])
+    return all(key in msg_text for key in COMPLAINT_KEYS)
 
 
 @dataclass
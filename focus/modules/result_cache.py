@@ -0,0 +1,226 @@
+import abc
+import hashlib
+import itertools
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from focus import ModelRes
+from focus.metrics import RESULT_CACHE_LOOKUPS
+
+
+RESULT_CACHE_KINDS = ("memory", "sqlite")
+
+
+def cache_key(text: str, model_version: str) -> str:
+    """Content address of a message for the given models.
+
+    The text is hashed exactly as the handler processes it.
+    """
+    payload = f"{model_version}\x00{text}".encode("utf-8")
+    return hashlib.sha256(payload).hexdigest()
+
+
+class ResultCache(abc.ABC):
+    """Handler results by content address, with TTL and LRU eviction.
+
+    At most `max_entries` results or `max_mb` of serialized results are kept,
+    `None` disables the limit. Results older than `ttl_s` are misses.
+    """
+
+    def __init__(
+            self,
+            model_version: str,
+            max_entries: Optional[int] = None,
+            max_mb: Optional[float] = None,
+            ttl_s: Optional[float] = None,
+        ):
+        self.model_version = model_version
+        self.max_entries = max_entries
+        self.max_bytes = int(max_mb * 2**20) if max_mb is not None else None
+        self.ttl_s = ttl_s
+        self.hits = 0
+        self.misses = 0
+        self._stats_lock = threading.Lock()
+
+    def key(self, text: str) -> str:
+        return cache_key(text, self.model_version)
+
+    def get(self, key: str) -> Optional[ModelRes]:
+        value = self._get(key)
+        with self._stats_lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        RESULT_CACHE_LOOKUPS.labels("miss" if value is None else "hit").inc()
+        return ModelRes.model_validate_json(value) if value is not None else None
+
+    def put(self, key: str, res: ModelRes):
+        self._put(key, res.model_dump_json().encode("utf-8"))
+
+    def stats(self) -> dict[str, int]:
+        return {"hits": self.hits, "misses": self.misses}
+
+    def _expires(self) -> float:
+        return time.time() + self.ttl_s if self.ttl_s is not None else float("inf")
+
+    @abc.abstractmethod
+    def _get(self, key: str) -> Optional[bytes]:
+        """Stored value of `key`, None if it is missing or expired."""
+
+    @abc.abstractmethod
+    def _put(self, key: str, value: bytes):
+        """Store `value` of `key` and evict the entries over the limits."""
+
+
+class MemoryResultCache(ResultCache):
+    """In-process cache, not shared between workers."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._lock = threading.Lock()
+        # key -> (expires, value), least recently used first
+        self._entries: OrderedDict[str, tuple[float, bytes]] = OrderedDict()
+        self._nbytes = 0
+
+    def _get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires, value = entry
+            if expires <= time.time():
+                self._pop(key)
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def _put(self, key: str, value: bytes):
+        with self._lock:
+            if key in self._entries:
+                self._pop(key)
+            self._entries[key] = (self._expires(), value)
+            self._nbytes += len(value)
+            while self._entries and self._over_limit():
+                self._pop(next(iter(self._entries)))
+
+    def _pop(self, key: str):
+        _, value = self._entries.pop(key)
+        self._nbytes -= len(value)
+
+    def _over_limit(self) -> bool:
+        if self.max_entries is not None and len(self._entries) > self.max_entries:
+            return True
+        return self.max_bytes is not None and self._nbytes > self.max_bytes
+
+
+class SqliteResultCache(ResultCache):
+    """On-disk cache shared by all workers of a node.
+
+    Every thread uses its own connection, the database is in WAL mode so
+    readers do not block the writer. To keep hits read-only, the last use
+    of an entry is only updated once it is `touch_s` old, and expired and
+    least recently used entries are evicted once every `evict_every` puts,
+    so the limits may be exceeded by that many entries per worker.
+    """
+
+    touch_s = 60.0
+    evict_every = 64
+
+    def __init__(self, path: str, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.path = path
+        self._local = threading.local()
+        self._puts = itertools.count(1)
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with self._conn() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS results ("
+                "key TEXT PRIMARY KEY, value BLOB NOT NULL, size INTEGER NOT NULL, "
+                "expires REAL NOT NULL, used REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS results_used ON results (used)")
+            conn.execute("CREATE INDEX IF NOT EXISTS results_expires ON results (expires)")
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _get(self, key: str) -> Optional[bytes]:
+        conn = self._conn()
+        now = time.time()
+        row = conn.execute(
+            "SELECT value, used FROM results WHERE key = ? AND expires > ?", (key, now)
+        ).fetchone()
+        if row is None:
+            return None
+        value, used = row
+        if now - used >= self.touch_s:
+            conn.execute("UPDATE results SET used = ? WHERE key = ?", (now, key))
+        return value
+
+    def _put(self, key: str, value: bytes):
+        conn = self._conn()
+        conn.execute(
+            "INSERT OR REPLACE INTO results (key, value, size, expires, used) "
+            "VALUES (?, ?, ?, ?, ?)",
+            (key, value, len(value), self._expires(), time.time()),
+        )
+        if next(self._puts) % self.evict_every == 0:
+            self._evict(conn)
+
+    def _evict(self, conn: sqlite3.Connection):
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute("DELETE FROM results WHERE expires <= ?", (time.time(),))
+            if self.max_entries is not None:
+                n_entries = conn.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+                if n_entries > self.max_entries:
+                    conn.execute(
+                        "DELETE FROM results WHERE key IN ("
+                        "SELECT key FROM results ORDER BY used LIMIT ?)",
+                        (n_entries - self.max_entries,),
+                    )
+            if self.max_bytes is not None:
+                n_bytes = conn.execute("SELECT COALESCE(SUM(size), 0) FROM results").fetchone()[0]
+                if n_bytes > self.max_bytes:
+                    # drop least recently used rows beyond the cumulative size limit
+                    conn.execute(
+                        "DELETE FROM results WHERE key IN ("
+                        "SELECT key FROM (SELECT key, SUM(size) OVER (ORDER BY used DESC, key) AS total "
+                        "FROM results) WHERE total > ?)",
+                        (self.max_bytes,),
+                    )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+
+def make_result_cache(
+        kind: Optional[str],
+        model_version: str,
+        max_entries: Optional[int] = None,
+        max_mb: Optional[float] = None,
+        ttl_s: Optional[float] = None,
+        path: Optional[str] = None,
+    ) -> Optional[ResultCache]:
+    """Result cache of `kind`, `None` kind disables caching."""
+    if kind is None:
+        return None
+    if kind == "memory":
+        return MemoryResultCache(model_version, max_entries, max_mb, ttl_s)
+    if kind == "sqlite":
+        if path is None:
+            raise ValueError("sqlite result cache needs a path")
+        return SqliteResultCache(path, model_version, max_entries, max_mb, ttl_s)
+    raise ValueError(f"Unknown result cache: {kind}. Available: {RESULT_CACHE_KINDS}")
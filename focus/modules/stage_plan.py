@@ -0,0 +1,59 @@
+from dataclasses import dataclass
+
+
+# Topic and subtopic of a message whose classification was skipped,
+# documented in `ModelResponse`
+SKIPPED_LABEL = ""
+
+
+@dataclass
+class StagePlan:
+    """Model stages of a message pattern.
+
+    NER is skipped for messages whose parsed text is shorter than
+    `min_text_chars` (without surrounding whitespace). Classification runs
+    for every message, as the classifier also sees the original text,
+    unless the plan disables it (`cls=False`) or opts in to skipping it for
+    too short parsed texts and classifier inputs (`skip_empty_cls=True`).
+    Skipped classification is replaced with the fallback labels.
+    """
+    ner: bool = True
+    cls: bool = True
+    min_text_chars: int = 1
+    skip_empty_cls: bool = False
+    fallback_topic: str = SKIPPED_LABEL
+    fallback_sub: str = SKIPPED_LABEL
+
+    def has_text(self, text: str) -> bool:
+        return len(text.strip()) >= self.min_text_chars
+
+    def stages(self, alg_text: str) -> tuple[bool, bool]:
+        """Return whether to run NER and classification for `alg_text`."""
+        if self.has_text(alg_text):
+            return self.ner, self.cls
+        return False, self.cls and not self.skip_empty_cls
+
+    def classifies(self, cls_text: str) -> bool:
+        """Return whether to classify the classifier input `cls_text`."""
+        return not self.skip_empty_cls or self.has_text(cls_text)
+
+
+DEFAULT_PLAN = StagePlan()
+
+# Keyed by `PatternClassifierUnit.name`, other patterns use `DEFAULT_PLAN`.
+# The parsers of these patterns return no text, so the models have nothing to work on
+# and the messages get `SKIPPED_LABEL` topics.
+STAGE_PLANS = {
+    "NoText": StagePlan(ner=False, cls=False),
+    "HotlineEmpty": StagePlan(ner=False, cls=False),
+    "AccRemoval": StagePlan(ner=False, cls=False),
+}
+
+
+def get_plan(pat_name: str) -> StagePlan:
+    return STAGE_PLANS.get(pat_name, DEFAULT_PLAN)
+
+
+def plan_label(run_ner: bool, run_cls: bool) -> str:
+    """Metrics label of the executed model stages."""
+    return "+".join(stage for stage, run in (("ner", run_ner), ("cls", run_cls)) if run) or "none"
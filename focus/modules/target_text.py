@@ -1,7 +1,6 @@
 
 import string
 from typing import Any
-from dataclasses import asdict
 
 from focus import txt_lab
 
@@ -12,19 +11,22 @@ MEANINGFUL_CATS = {
     'litr', 'money', 'phone', 'time', 'trk', 'payment',
 }
 PUNCTUATION = string.punctuation + "«»—…" + "0123456789"
+NOISE_CODES = {txt_lab.cat_code(cat) for cat in NOISE_CATS}
 
 
 def concat_new_line_ents(text: txt_lab.Text) -> txt_lab.Text:
     txt = text.text
-    txt_new = ""
+    parts = []
     left = 0
-    for ent in text.entities:
-        ent_text = txt[ent.beg:ent.end]
-        if ent.cat not in NOISE_CATS and "\n" in ent_text:
+    for beg, end, code in text.entities.spans():
+        ent_text = txt[beg:end]
+        if code not in NOISE_CODES and "\n" in ent_text:
             ent_text = ent_text.replace("\n", " ")
-        txt_new = f"{txt_new}{txt[left:ent.beg]}{ent_text}"
-        left = ent.end
-    txt_new = f"{txt_new}{txt[left:]}"
+        parts.append(txt[left:beg])
+        parts.append(ent_text)
+        left = end
+    parts.append(txt[left:])
+    txt_new = "".join(parts)
     return txt_lab.Text(txt_new, text.entities)
 
 
@@ -35,13 +37,7 @@ def has_text(line: txt_lab.Text) -> bool:
 
 
 def form_tlab(text: str, ner_ents: list[dict[str, Any]]):
-    return txt_lab.Text(
-        text=text,
-        entities=[
-            txt_lab.Entity(ent["beg"], ent["end"], ent["cat"])
-            for ent in ner_ents
-        ],
-    )
+    return txt_lab.Text(text=text, entities=txt_lab.Entities.from_dicts(ner_ents))
 
 def extract_target_text(
         text: str,
@@ -53,5 +49,5 @@ def extract_target_text(
     clear_lines = txt_lab.split_by_symbol(noise_clear, "\n")
     target_lines = [line for line in clear_lines if has_text(line)]
     target_text_lab = txt_lab.concat_list(target_lines, " ")
-    target_ents = [asdict(ent) for ent in target_text_lab.entities]
+    target_ents = target_text_lab.entities.to_dicts()
     return target_text_lab.text, target_ents
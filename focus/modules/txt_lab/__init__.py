@@ -1,5 +1,5 @@
 
-from .struct import Text, Entity, dict_to_text
+from .struct import Text, Entity, Entities, cat_code, cat_codes, dict_to_text
 from .core import (
     concat,
     split_by_idx,
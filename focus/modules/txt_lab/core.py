@@ -1,5 +1,9 @@
 
-from .struct import Text, Entity
+from array import array
+from bisect import bisect_left, bisect_right
+from typing import Optional
+
+from .struct import Text, Entities, cat_codes
 
 
 def concat(first: Text, second: Text, sep: str = ' ') -> Text:
@@ -18,14 +22,9 @@ def concat(first: Text, second: Text, sep: str = ' ') -> Text:
     """
     combined_text = f'{first.text}{sep}{second.text}'
     shift = len(first.text) + len(sep)
-    first_entities = first.entities.copy()
-    second_entities = [
-        Entity(beg=entity.beg + shift, end=entity.end + shift, cat=entity.cat)
-        for entity in second.entities
-    ]
     return Text(
         text=combined_text,
-        entities=first_entities + second_entities
+        entities=Entities.join([first.entities, second.entities.shifted(shift)])
     )
 
 
@@ -49,40 +48,89 @@ def split_by_idx(text: Text, split_idx: int) -> tuple[Text, Text]:
     Raises:
         ValueError: If split_idx is invalid (negative, out of bounds, or not pointing to a space or '\n').
     """
-    if split_idx < 0 or split_idx >= len(text.text) or (text.text[split_idx] not in [' ', '\n']):
+    _check_split_idx(text.text, split_idx)
+    left_part, right_part = _split(text, [split_idx])
+    return left_part, right_part
+
+
+def _check_split_idx(text: str, split_idx: int):
+    if split_idx < 0 or split_idx >= len(text) or (text[split_idx] not in [' ', '\n']):
         raise ValueError("split_idx must point to a valid space or '\\n' character in the text")
-    left_text = text.text[:split_idx]
-    right_text = text.text[split_idx + 1:]
-    left_entities = []
-    right_entities = []
-    for entity in text.entities:
-        if entity.end <= split_idx:
-            # Entity is completely in the left part
-            left_entities.append(entity)
-        elif entity.beg >= split_idx + 1:
-            # Entity is completely in the right part (shifted)
-            right_entities.append(Entity(
-                beg=entity.beg - (split_idx + 1),
-                end=entity.end - (split_idx + 1),
-                cat=entity.cat
-            ))
+
+
+def _split(text: Text, split_indices: list[int]) -> list[Text]:
+    """Same as applying `split_by_idx` at each of ascending `split_indices`.
+
+    Entities in text order that no split point falls in are split as views
+    of the same columns, otherwise each entity is swept once over the parts
+    it spans, so the cost is linear in the text length and the number of
+    resulting entities.
+    """
+    if not split_indices:
+        return [Text(text=text.text, entities=text.entities)]
+    starts = [0] + [split_idx + 1 for split_idx in split_indices]
+    ends = split_indices + [len(text.text)]
+    parts_entities = None
+    if text.entities.is_sorted():
+        parts_entities = _split_views(text.entities, split_indices, starts)
+    if parts_entities is None:
+        parts_entities = _split_entities(text.entities, split_indices, starts, ends)
+    return [
+        Text(text=text.text[start:end], entities=entities)
+        for start, end, entities in zip(starts, ends, parts_entities)
+    ]
+
+
+def _split_views(entities: Entities, split_indices: list[int], starts: list[int]) -> Optional[list[Entities]]:
+    """Parts of sorted `entities` as views, None if a split point falls in an entity."""
+    parts_entities = [Entities() for _ in starts]
+    begs, ends, shift = entities.begs, entities.ends, entities.shift
+    pos = entities.start
+    while pos < entities.stop:
+        part_idx = bisect_left(split_indices, begs[pos] + shift)
+        if part_idx == len(split_indices):
+            end = entities.stop
         else:
+            # entities ending before the split point, the next one must start after it
+            split_idx = split_indices[part_idx]
+            end = bisect_right(ends, split_idx - shift, pos, entities.stop)
+            if end < entities.stop and begs[end] + shift <= split_idx:
+                return None
+        parts_entities[part_idx] = Entities(begs, ends, entities.codes, pos, end, shift - starts[part_idx])
+        pos = end
+    return parts_entities
+
+
+def _split_entities(
+        entities: Entities,
+        split_indices: list[int],
+        starts: list[int],
+        ends: list[int],
+    ) -> list[Entities]:
+    parts_columns = [(array("q"), array("q"), array("H")) for _ in starts]
+    for ent_beg, ent_end, code in entities.spans():
+        # parts ending before the entity start hold none of it
+        part_idx = bisect_left(split_indices, ent_beg)
+        beg = ent_beg
+        while True:
+            start = starts[part_idx]
+            begs, part_ends, codes = parts_columns[part_idx]
+            if part_idx == len(split_indices) or ent_end <= ends[part_idx]:
+                begs.append(beg - start)
+                part_ends.append(ent_end - start)
+                codes.append(code)
+                break
             # Entity spans across the split point - need to split it
-            if entity.beg < split_idx:
-                left_entities.append(Entity(
-                    beg=entity.beg,
-                    end=split_idx,
-                    cat=entity.cat
-                ))
-            if entity.end > split_idx + 1:
-                right_entities.append(Entity(
-                    beg=0,  # Starts at beginning of right part
-                    end=entity.end - (split_idx + 1),
-                    cat=entity.cat
-                ))
-    left_part = Text(text=left_text, entities=left_entities)
-    right_part = Text(text=right_text, entities=right_entities)
-    return left_part, right_part
+            split_idx = ends[part_idx]
+            if beg < split_idx:
+                begs.append(beg - start)
+                part_ends.append(split_idx - start)
+                codes.append(code)
+            if ent_end <= split_idx + 1:
+                break
+            part_idx += 1
+            beg = starts[part_idx]
+    return [Entities(*columns) for columns in parts_columns]
 
 
 def insert(first: Text, second: Text, space_idx: int, sep: str = ' ') -> Text:
@@ -122,17 +170,13 @@ def split_by_symbol(text: Text, symbol: str) -> list[Text]:
     Raises:
         ValueError: If `symbol` is not pointing to a space or '\n'.
     """
-    result = []
-    current_text = text
-    while True:
-        split_pos = current_text.text.find(symbol)
-        if split_pos == -1:
-            result.append(current_text)
-            break
-        left_part, right_part = split_by_idx(current_text, split_pos)
-        result.append(left_part)
-        current_text = right_part
-    return result
+    split_indices = []
+    split_pos = text.text.find(symbol)
+    while split_pos != -1:
+        _check_split_idx(text.text, split_pos)
+        split_indices.append(split_pos)
+        split_pos = text.text.find(symbol, split_pos + 1)
+    return _split(text, split_indices)
 
 
 def concat_list(texts: list[Text], sep: str = ' ') -> Text:
@@ -148,11 +192,19 @@ def concat_list(texts: list[Text], sep: str = ' ') -> Text:
         - All entities from all texts with proper position adjustments
     """
     if not texts:
-        return Text("", [])
-    result = texts[0]
-    for text in texts[1:]:
-        result = concat(result, text, sep)
-    return result
+        return Text("", Entities())
+    if len(texts) == 1:
+        return texts[0]
+    parts = [texts[0].entities]
+    shift = 0
+    for prev, text in zip(texts, texts[1:]):
+        shift += len(prev.text) + len(sep)
+        if text.entities:
+            parts.append(text.entities.shifted(shift))
+    return Text(
+        text=sep.join(text.text for text in texts),
+        entities=Entities.join(parts),
+    )
 
 
 def split_by_indices(text: Text, split_indices: list[int]) -> list[Text]:
@@ -176,17 +228,9 @@ def split_by_indices(text: Text, split_indices: list[int]) -> list[Text]:
     """
     if any(i >= j for i, j in zip(split_indices, split_indices[1:])):
         raise ValueError("Split indices must be in strictly ascending order")
-    current_text = text
-    result = []
-    cumulative_shift = 0
     for split_idx in split_indices:
-        adjusted_idx = split_idx - cumulative_shift
-        left_part, right_part = split_by_idx(current_text, adjusted_idx)
-        result.append(left_part)
-        current_text = right_part
-        cumulative_shift += len(left_part.text) + 1  # +1 for the removed character
-    result.append(current_text)
-    return result
+        _check_split_idx(text.text, split_idx)
+    return _split(text, split_indices)
 
 
 def drop_empty_lines(text: Text) -> Text:
@@ -214,21 +258,31 @@ def drop_cats(text: Text, drop: set[str], drop_empty: bool = True) -> Text:
     Returns:
         A new Text object with entities whose cats are not in the drop set.
     """
-    new_text = ""
-    new_ents = []
+    if not text.entities:
+        return drop_empty_lines(text) if drop_empty else Text(text.text, Entities())
+    drop_codes = cat_codes(drop)
+    parts = []
+    new_len = 0
+    begs, ends, codes = array("q"), array("q"), array("H")
     old_left = 0
-    for ent in text.entities:
-        if ent.beg != old_left:
-            new_text = f"{new_text}{text.text[old_left:ent.beg]}"
-        old_left = ent.beg
-        if ent.cat not in drop:
-            cat_beg = len(new_text)
-            new_text = f"{new_text}{text.text[ent.beg:ent.end]}"
-            keep_ent = Entity(cat_beg, len(new_text), ent.cat)
-            new_ents.append(keep_ent)
-        old_left = ent.end
-    new_text = f"{new_text}{text.text[old_left:]}"
-    new_text_lab = Text(new_text, new_ents)
+    for beg, end, code in text.entities.spans():
+        if beg != old_left:
+            part = text.text[old_left:beg]
+            parts.append(part)
+            new_len += len(part)
+        old_left = beg
+        if code not in drop_codes:
+            cat_beg = new_len
+            part = text.text[beg:end]
+            parts.append(part)
+            new_len += len(part)
+            begs.append(cat_beg)
+            ends.append(new_len)
+            codes.append(code)
+        old_left = end
+    parts.append(text.text[old_left:])
+    new_text = "".join(parts)
+    new_text_lab = Text(new_text, Entities(begs, ends, codes))
     if drop_empty:
         new_text_lab = drop_empty_lines(new_text_lab)
     return new_text_lab
@@ -1,23 +1,207 @@
-
+import threading
+from array import array
 from dataclasses import dataclass
+from itertools import islice
+from operator import le
+from typing import Any, Iterable, Iterator, Optional, Union
+
+
+# Category names by code, every category is stored once and entities keep its code
+CATS: list[str] = []
+_CAT_CODES: dict[str, int] = {}
+_CATS_LOCK = threading.Lock()
+
+Span = tuple[int, int, int]
+Column = Union[array, memoryview]
+
+
+def cat_code(cat: str) -> int:
+    """Code of category `cat`, interned on first use."""
+    code = _CAT_CODES.get(cat)
+    if code is None:
+        # handler threads may meet a new category at once, intern it once
+        with _CATS_LOCK:
+            code = _CAT_CODES.get(cat)
+            if code is None:
+                CATS.append(cat)
+                code = _CAT_CODES[cat] = len(CATS) - 1
+    return code
+
+
+def cat_codes(cats: Iterable[str]) -> set[int]:
+    """Codes of the known categories of `cats`, unknown ones match no entity."""
+    return {_CAT_CODES[cat] for cat in cats if cat in _CAT_CODES}
 
 
 @dataclass
 class Entity:
+    __slots__ = ("beg", "end", "cat")
     beg: int
     end: int
     cat: str
 
 
+class Entities:
+    """Entities of a text as columns of begins, ends and category codes.
+
+    Slices and `shifted` are views over the same columns: no entity is
+    copied, an `Entity` is only built when an item is accessed. Reading,
+    `append`, `extend`, `copy` and `+` work like on the `list[Entity]` this
+    replaces; other list methods do not exist and `to_dicts` gives the
+    JSON form.
+    """
+    __slots__ = ("begs", "ends", "codes", "start", "stop", "shift")
+
+    def __init__(
+            self,
+            begs: Optional[array] = None,
+            ends: Optional[array] = None,
+            codes: Optional[array] = None,
+            start: int = 0,
+            stop: Optional[int] = None,
+            shift: int = 0,
+        ):
+        self.begs = array("q") if begs is None else begs
+        self.ends = array("q") if ends is None else ends
+        self.codes = array("H") if codes is None else codes
+        self.start = start
+        self.stop = len(self.begs) if stop is None else stop
+        self.shift = shift
+
+    @classmethod
+    def from_spans(cls, spans: Iterable[Span]) -> "Entities":
+        begs, ends, codes = array("q"), array("q"), array("H")
+        for beg, end, code in spans:
+            begs.append(beg)
+            ends.append(end)
+            codes.append(code)
+        return cls(begs, ends, codes)
+
+    @classmethod
+    def from_dicts(cls, ents: Iterable[dict[str, Any]]) -> "Entities":
+        """Entities of the NER output, dicts with "beg", "end" and "cat"."""
+        return cls.from_spans((ent["beg"], ent["end"], cat_code(ent["cat"])) for ent in ents)
+
+    @classmethod
+    def from_entities(cls, ents: Iterable[Entity]) -> "Entities":
+        return cls.from_spans((ent.beg, ent.end, cat_code(ent.cat)) for ent in ents)
+
+    @classmethod
+    def join(cls, parts: list["Entities"]) -> "Entities":
+        """Entities of all `parts` in order, a view of a single non-empty part."""
+        parts = [part for part in parts if part.stop > part.start]
+        if len(parts) == 1:
+            part = parts[0]
+            return cls(part.begs, part.ends, part.codes, part.start, part.stop, part.shift)
+        begs, ends, codes = array("q"), array("q"), array("H")
+        for part in parts:
+            start, stop, shift = part.start, part.stop, part.shift
+            part_begs, part_ends = part.begs[start:stop], part.ends[start:stop]
+            if shift:
+                part_begs, part_ends = map(shift.__add__, part_begs), map(shift.__add__, part_ends)
+            begs.extend(part_begs)
+            ends.extend(part_ends)
+            codes.extend(part.codes[start:stop])
+        return cls(begs, ends, codes)
+
+    def _columns(self) -> tuple[Column, Column, Column]:
+        if self.start == 0 and self.stop == len(self.begs):
+            return self.begs, self.ends, self.codes
+        return (
+            memoryview(self.begs)[self.start:self.stop],
+            memoryview(self.ends)[self.start:self.stop],
+            memoryview(self.codes)[self.start:self.stop],
+        )
+
+    def spans(self) -> Iterator[Span]:
+        """(begin, end, category code) of every entity."""
+        begs, ends, codes = self._columns()
+        if self.shift:
+            begs, ends = map(self.shift.__add__, begs), map(self.shift.__add__, ends)
+        return zip(begs, ends, codes)
+
+    def shifted(self, shift: int) -> "Entities":
+        return Entities(self.begs, self.ends, self.codes, self.start, self.stop, self.shift + shift)
+
+    def is_sorted(self) -> bool:
+        """Entities are in text order and do not overlap."""
+        begs, ends, _ = self._columns()
+        return all(map(le, begs, ends)) and all(map(le, ends, islice(begs, 1, None)))
+
+    def _own_columns(self):
+        # views share their columns: one that does not end at the end of the
+        # columns, or is shifted, appends to a copy of its entities
+        if self.start or self.shift or self.stop != len(self.begs):
+            own = Entities.from_spans(self.spans())
+            self.begs, self.ends, self.codes = own.begs, own.ends, own.codes
+            self.start, self.stop, self.shift = 0, len(own.begs), 0
+
+    def append(self, ent: Entity):
+        self._own_columns()
+        self.begs.append(ent.beg)
+        self.ends.append(ent.end)
+        self.codes.append(cat_code(ent.cat))
+        self.stop += 1
+
+    def extend(self, ents: Iterable[Entity]):
+        for ent in ents:
+            self.append(ent)
+
+    def copy(self) -> "Entities":
+        return Entities.from_spans(self.spans())
+
+    def __add__(self, other: Iterable[Entity]) -> "Entities":
+        res = self.copy()
+        res.extend(other)
+        return res
+
+    def to_dicts(self) -> list[dict[str, Any]]:
+        return [{"beg": beg, "end": end, "cat": CATS[code]} for beg, end, code in self.spans()]
+
+    def __len__(self) -> int:
+        return self.stop - self.start
+
+    def __iter__(self) -> Iterator[Entity]:
+        return (Entity(beg, end, CATS[code]) for beg, end, code in self.spans())
+
+    def __getitem__(self, idx: Union[int, slice]) -> Union[Entity, "Entities"]:
+        if isinstance(idx, slice):
+            start, stop, step = idx.indices(len(self))
+            if step != 1:
+                raise ValueError("Entities slices must be contiguous")
+            return Entities(self.begs, self.ends, self.codes, self.start + start, self.start + max(start, stop), self.shift)
+        if idx < 0:
+            idx += len(self)
+        if not 0 <= idx < len(self):
+            raise IndexError("Entities index out of range")
+        pos = self.start + idx
+        return Entity(self.begs[pos] + self.shift, self.ends[pos] + self.shift, CATS[self.codes[pos]])
+
+    def __eq__(self, other: object) -> bool:
+        if isinstance(other, Entities):
+            return len(self) == len(other) and list(self.spans()) == list(other.spans())
+        if isinstance(other, (list, tuple)):
+            return list(self) == list(other)
+        return NotImplemented
+
+    def __repr__(self) -> str:
+        return f"Entities({list(self)!r})"
+
+    def __reduce__(self):
+        # category codes are interned per process, pickled by name
+        return Entities.from_dicts, (self.to_dicts(),)
+
+
 @dataclass
 class Text:
+    __slots__ = ("text", "entities")
     text: str
-    entities: list[Entity]
+    entities: Entities
+
+    def __post_init__(self):
+        if not isinstance(self.entities, Entities):
+            self.entities = Entities.from_entities(self.entities)
 
 
 def dict_to_text(data: dict) -> Text:
-    ents = [
-        Entity(ent["beg"], ent["end"], ent["cat"])
-        for ent in data["entities"]
-    ]
-    return Text(data["text"], ents)
+    return Text(data["text"], Entities.from_dicts(data["entities"]))
@@ -0,0 +1,64 @@
+"""Check that an inference backend reproduces the torch reference.
+
+Compares topic/subtopic labels and NER spans (cat, beg, end) on a corpus of
+JSONL lines with a "text" field. Exits with code 1 on any difference.
+
+Usage:
+    python -m focus.parity corpus.jsonl --backend int8
+"""
+import argparse
+import json
+import sys
+from typing import Iterator
+
+from loguru import logger
+
+from focus.modules.backend import ONNX_FILES
+from focus.modules.handler import ExtrClsHandler
+
+
+def read_texts(corpus_p: str) -> Iterator[str]:
+    with open(corpus_p, "r", encoding="utf-8") as corpus_file:
+        for line in corpus_file:
+            if line.strip():
+                yield json.loads(line)["text"]
+
+
+def ner_spans(ner_res: list[dict]) -> list[tuple[str, int, int]]:
+    return [(ent["cat"], ent["beg"], ent["end"]) for ent in ner_res]
+
+
+def check_parity(reference: ExtrClsHandler, candidate: ExtrClsHandler, texts: Iterator[str]) -> int:
+    """Return the number of texts with differing labels or NER spans."""
+    n_diff = 0
+    for idx, text in enumerate(texts):
+        _, alg_text, _ = reference._parse(text)
+        ref_spans = ner_spans(reference.ner_pipe(alg_text))
+        cand_spans = ner_spans(candidate.ner_pipe(alg_text))
+        ref_labels = reference.cls_pipe.inf(text)
+        cand_labels = candidate.cls_pipe.inf(text)
+        if ref_spans != cand_spans or ref_labels != cand_labels:
+            n_diff += 1
+            logger.error(
+                f"Text #{idx} differs: labels {ref_labels} != {cand_labels} "
+                f"or NER {ref_spans} != {cand_spans}"
+            )
+    return n_diff
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument("corpus", help="JSONL file with a \"text\" field per line")
+    parser.add_argument("--backend", choices=list(ONNX_FILES), required=True)
+    args = parser.parse_args()
+    reference = ExtrClsHandler(backend="torch")
+    candidate = ExtrClsHandler(backend=args.backend)
+    n_diff = check_parity(reference, candidate, read_texts(args.corpus))
+    if n_diff:
+        logger.error(f"Backend {args.backend}: {n_diff} texts differ from torch")
+        sys.exit(1)
+    logger.warning(f"Backend {args.backend}: parity with torch")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,241 @@
+"""Pre-fork serving with models shared between worker processes.
+
+The parent process loads the models, freezes the garbage collector so the
+loaded objects are not written to by collections, binds the listening
+socket and forks the workers. Model weights are never written after
+loading, so the workers share their pages with the parent copy-on-write.
+Every worker warms the models up itself before its `/ready` reports ready.
+The parent restarts workers that die with a growing delay, gives up after
+repeated failures, and periodically logs the RSS and PSS of every process: PSS counts shared pages divided between the processes
+sharing them, so with shared weights the total PSS stays close to one copy.
+
+Usage:
+    python -m focus.prefork [--workers 4] [--torch-threads 4]
+"""
+import argparse
+import gc
+import os
+import shutil
+import signal
+import socket
+import tempfile
+import time
+from typing import Optional
+
+from loguru import logger
+
+import focus
+from focus import (
+    LOG_LEVEL,
+    SERVER_HOST,
+    SERVER_MAX_RESTARTS,
+    SERVER_MEM_REPORT_S,
+    SERVER_PORT,
+    SERVER_RESTART_BACKOFF_S,
+    SERVER_RESTART_MAX_BACKOFF_S,
+    SERVER_RESTART_RESET_S,
+    apply_tuned_config,
+)
+from focus.log import setup_logging
+
+
+MEMORY_FIELDS = ("Rss", "Pss", "Shared_Clean", "Shared_Dirty", "Private_Clean", "Private_Dirty")
+
+
+def memory_usage(pid: int) -> dict[str, int]:
+    """Memory of process `pid` in bytes by /proc/<pid>/smaps_rollup field."""
+    usage = {}
+    with open(f"/proc/{pid}/smaps_rollup", "r") as smaps:
+        for line in smaps:
+            name, _, value = line.partition(":")
+            if name in MEMORY_FIELDS:
+                usage[name] = int(value.split()[0]) * 1024
+    return usage
+
+
+def log_memory(parent_pid: int, worker_pids: list[int]):
+    total_pss = 0
+    for name, pid in [("parent", parent_pid)] + [(f"worker {pid}", pid) for pid in worker_pids]:
+        try:
+            usage = memory_usage(pid)
+        except OSError:
+            continue
+        total_pss += usage.get("Pss", 0)
+        shared = usage.get("Shared_Clean", 0) + usage.get("Shared_Dirty", 0)
+        private = usage.get("Private_Clean", 0) + usage.get("Private_Dirty", 0)
+        logger.info(
+            f"Memory {name}: RSS {usage.get('Rss', 0) / 2**20:.0f} MB, PSS {usage.get('Pss', 0) / 2**20:.0f} MB, "
+            f"shared {shared / 2**20:.0f} MB, private {private / 2**20:.0f} MB"
+        )
+    logger.info(f"Memory total PSS: {total_pss / 2**20:.0f} MB")
+
+
+def bind_socket(host: str, port: int, backlog: int = 2048) -> socket.socket:
+    sock = socket.socket(socket.AF_INET6 if ":" in host else socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    sock.set_inheritable(True)
+    return sock
+
+
+def run_worker(app, sock: socket.socket, torch_threads: int):
+    import uvicorn
+
+    from focus.modules.backend import set_torch_threads
+
+    set_torch_threads(torch_threads, focus.SERVER_TORCH_INTEROP_THREADS)
+    server = uvicorn.Server(uvicorn.Config(app, log_level=LOG_LEVEL))
+    server.run(sockets=[sock])
+
+
+def fork_worker(app, sock: socket.socket, torch_threads: int) -> int:
+    pid = os.fork()
+    if pid == 0:
+        code = 0
+        try:
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            run_worker(app, sock, torch_threads)
+        except BaseException:
+            logger.exception("Worker failed")
+            code = 1
+        finally:
+            os._exit(code)
+    logger.info(f"Started worker {pid}, torch threads: {torch_threads}")
+    return pid
+
+
+class RestartBackoff:
+    """Restarts of dead workers.
+
+    A restart is delayed by SERVER_RESTART_BACKOFF_S seconds, doubled with
+    every consecutive failure up to SERVER_RESTART_MAX_BACKOFF_S; a worker
+    that ran `reset_s` seconds resets the count and the supervisor gives up
+    after `max_restarts` consecutive failures.
+    """
+
+    def __init__(self, max_restarts: int = SERVER_MAX_RESTARTS, reset_s: float = SERVER_RESTART_RESET_S):
+        self.max_restarts = max_restarts
+        self.reset_s = reset_s
+        self.failures = 0
+        # monotonic times of the scheduled restarts
+        self.pending: list[float] = []
+
+    def failed(self, ran_s: float) -> Optional[float]:
+        """Schedule a restart of a worker that died after `ran_s` seconds.
+        Return its delay, None if the restarts keep failing."""
+        self.failures = 1 if ran_s >= self.reset_s else self.failures + 1
+        if self.failures > self.max_restarts:
+            self.pending.clear()
+            return None
+        delay = min(SERVER_RESTART_BACKOFF_S * 2 ** (self.failures - 1), SERVER_RESTART_MAX_BACKOFF_S)
+        self.pending.append(time.monotonic() + delay)
+        self.pending.sort()
+        return delay
+
+    def due(self) -> int:
+        """Number of the restarts due by now, they are no longer pending."""
+        now = time.monotonic()
+        n_due = 0
+        while n_due < len(self.pending) and self.pending[n_due] <= now:
+            n_due += 1
+        del self.pending[:n_due]
+        return n_due
+
+
+def serve(workers: int, torch_threads: Optional[int] = None, mem_report_s: float = SERVER_MEM_REPORT_S):
+    """Load the models, fork `workers` servers on a shared socket and supervise them."""
+    # metrics of all workers are aggregated through files, the variable must
+    # be set before prometheus_client is imported; a directory created here
+    # is removed on exit, a configured one is left as is
+    metrics_dir = None
+    if "PROMETHEUS_MULTIPROC_DIR" not in os.environ:
+        metrics_dir = os.environ["PROMETHEUS_MULTIPROC_DIR"] = tempfile.mkdtemp(prefix="focus-metrics-")
+    try:
+        supervise(workers, torch_threads, mem_report_s)
+    finally:
+        if metrics_dir is not None:
+            shutil.rmtree(metrics_dir, ignore_errors=True)
+
+
+def supervise(workers: int, torch_threads: Optional[int], mem_report_s: float):
+    from prometheus_client import multiprocess
+
+    from focus import routes
+    from focus.app import create_app
+
+    # the workers only warm up in their lifespan: torch thread pools started
+    # before forking hang in the children
+    routes.load_models()
+    if routes.executor.kind != "thread":
+        raise ValueError("Pre-fork serving needs the thread executor, workers are the processes")
+    torch_threads = torch_threads or max(1, (os.cpu_count() or 1) // workers)
+    routes.init_routes()
+    app = create_app(mounts=[], routers=[routes.router])
+    sock = bind_socket(SERVER_HOST, SERVER_PORT)
+
+    # objects loaded so far are never collected, collections would touch
+    # their pages and unshare them
+    gc.collect()
+    gc.freeze()
+
+    # start time by worker pid
+    started = {fork_worker(app, sock, torch_threads): time.monotonic() for _ in range(workers)}
+    restarts = RestartBackoff()
+    stopping = False
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in list(started):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    last_report = time.monotonic()
+    try:
+        while started or (restarts.pending and not stopping):
+            pid, status = os.waitpid(-1, os.WNOHANG) if started else (0, 0)
+            if pid in started:
+                ran_s = time.monotonic() - started.pop(pid)
+                multiprocess.mark_process_dead(pid)
+                if stopping:
+                    continue
+                delay = restarts.failed(ran_s)
+                if delay is None:
+                    logger.error(f"Worker {pid} exited with status {status}, {restarts.max_restarts} restarts failed, stopping")
+                    stop(signal.SIGTERM, None)
+                    while started:
+                        started.pop(os.waitpid(-1, 0)[0], None)
+                    raise RuntimeError(f"Workers keep exiting, gave up after {restarts.max_restarts} restarts")
+                logger.warning(f"Worker {pid} exited with status {status} after {ran_s:.0f} s, restarting in {delay:g} s")
+                continue
+            if not stopping:
+                for _ in range(restarts.due()):
+                    started[fork_worker(app, sock, torch_threads)] = time.monotonic()
+            if time.monotonic() - last_report >= mem_report_s:
+                log_memory(os.getpid(), list(started))
+                last_report = time.monotonic()
+            time.sleep(0.5)
+    finally:
+        sock.close()
+
+
+def main():
+    setup_logging()
+    # the tuned settings are read from `focus` after they are applied
+    apply_tuned_config()
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument("--workers", type=int, default=max(focus.SERVER_WORKERS, 2))
+    parser.add_argument("--torch-threads", type=int, default=focus.SERVER_TORCH_THREADS, help="per worker, default: cpus / workers")
+    parser.add_argument("--mem-report-s", type=float, default=SERVER_MEM_REPORT_S, help="memory report period")
+    args = parser.parse_args()
+    serve(args.workers, args.torch_threads, args.mem_report_s)
+
+
+if __name__ == "__main__":
+    main()
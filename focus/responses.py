@@ -0,0 +1,42 @@
+"""JSON rendering of the responses.
+
+Responses are rendered with orjson if it is installed (`pip install ".[orjson]"`),
+with the standard json module otherwise. Model results are turned into
+response dicts directly, without building and validating `ModelResponse`.
+"""
+import json
+from typing import Any, Optional
+
+from starlette.responses import JSONResponse
+
+from focus import ModelRes
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def dumps(content: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(content)
+    return json.dumps(content, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode("utf-8")
+
+
+class FastJSONResponse(JSONResponse):
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+def response_dict(req_id: Optional[int], model_res: ModelRes) -> dict[str, Any]:
+    """`ModelResponse` fields of the result of request `req_id`."""
+    # fields are listed explicitly, `model_dump()` is several times slower
+    return {
+        "req_id": req_id,
+        "card": model_res.card,
+        "azs": model_res.azs,
+        "trk": model_res.trk,
+        "fuel": model_res.fuel,
+        "topic": model_res.topic,
+        "sub": model_res.sub,
+    }
@@ -1,33 +1,266 @@
-
+import asyncio
+import os
+import tempfile
+import time
+from contextlib import asynccontextmanager
 from http import HTTPStatus
+from typing import AsyncIterator, Optional
 
 from loguru import logger
-from fastapi import APIRouter
+from fastapi import APIRouter, FastAPI, HTTPException, Query, Request, Response
+from fastapi.responses import JSONResponse, StreamingResponse
+from pydantic import TypeAdapter, ValidationError
 
-from focus import ModelRequest, ModelResponse
+from focus import (
+    ModelRequest, ModelResponse, ModelRes,
+    BATCH_MAX_SIZE, BATCH_MAX_WAIT_MS,
+    EXECUTOR_KIND, EXECUTOR_WORKERS, EXECUTOR_QUEUE_LIMIT,
+    WARMUP_MSG_CHARS,
+    STREAM_MAX_IN_FLIGHT, STREAM_MAX_LINE_BYTES,
+    JOBS_DB_PATH, JOBS_MAX_JSON_MB, JOBS_MAX_UPLOAD_MB, JOBS_PAGE_SIZE,
+)
+from focus import metrics
+from focus.batcher import MicroBatcher
+from focus.bulk import FORMATS
+from focus.executor import BatchTooLarge, InferenceExecutor, Overloaded
+from focus.jobs import Job, JobStore, UploadTooLarge, file_messages, read_body, save_upload
+from focus.responses import FastJSONResponse, dumps, response_dict
 from focus.modules.handler import ExtrClsHandler
+from focus.startup import Startup, warmup_texts
+from focus.stream import NDJSONResponse, read_lines, stream_responses
+
+
+# built by `load_models`, in the lifespan or before forking the workers
+executor: Optional[InferenceExecutor] = None
+batcher: Optional[MicroBatcher] = None
+startup = Startup()
+# opened on the first jobs request
+jobs: Optional[JobStore] = None
+
+REQUESTS_ADAPTER = TypeAdapter(list[ModelRequest])
+
+
+def load_models():
+    """Build the inference executor and the batcher, blocking."""
+    global executor, batcher
+    start = time.perf_counter()
+    executor = InferenceExecutor(
+        ExtrClsHandler,
+        EXECUTOR_KIND,
+        EXECUTOR_WORKERS,
+        EXECUTOR_QUEUE_LIMIT,
+    )
+    batcher = MicroBatcher(
+        executor.run_batch,
+        BATCH_MAX_SIZE,
+        BATCH_MAX_WAIT_MS,
+        max_concurrency=EXECUTOR_WORKERS,
+    )
+    startup.load_s = round(time.perf_counter() - start, 3)
+    if executor.handler is not None:
+        startup.models_load_s = dict(executor.handler.load_s)
+    startup.status = "loaded"
+    logger.info(f"Models loaded in {startup.load_s} s: {startup.models_load_s}")
+
+
+def warm_up():
+    """Run the warm-up messages through the models, blocking."""
+    startup.status = "warming_up"
+    start = time.perf_counter()
+    texts = warmup_texts(WARMUP_MSG_CHARS)
+    if texts:
+        executor.warm_up(texts)
+    startup.warmup_s = round(time.perf_counter() - start, 3)
+    startup.status = "ready"
+    logger.info(f"Warmed up on {len(texts)} messages in {startup.warmup_s} s")
+
+
+def start():
+    """Load the models if not loaded yet and warm them up."""
+    try:
+        if not startup.loaded:
+            load_models()
+        warm_up()
+    except Exception as exc:
+        startup.fail(exc)
+        logger.exception("Startup failed")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI) -> AsyncIterator[None]:
+    # the server accepts requests while the models load, `/` answers right
+    # away and `/ready` once the models are warmed up
+    task = asyncio.create_task(asyncio.to_thread(start))
+    yield
+    if not task.done():
+        logger.warning("Shutting down during startup")
+    if executor is not None:
+        executor.shutdown()
+
+
+router = APIRouter(lifespan=lifespan)
+
+
+def ensure_ready():
+    if not startup.ready:
+        raise HTTPException(
+            status_code=HTTPStatus.SERVICE_UNAVAILABLE,
+            detail=f"Models are not ready: {startup.status}",
+        )
+
 
+async def stream_process(text: str) -> ModelRes:
+    # streamed messages wait for room in the queue instead of being rejected
+    with metrics.IN_FLIGHT.track_inprogress():
+        async with executor.wait_admission():
+            return await batcher.submit(text)
+
+
+def job_store() -> JobStore:
+    global jobs
+    if jobs is None:
+        jobs = JobStore(JOBS_DB_PATH)
+    return jobs
+
+
+def get_job(job_id: str) -> Job:
+    job = job_store().get(job_id)
+    if job is None:
+        raise HTTPException(status_code=HTTPStatus.NOT_FOUND, detail=f"No job {job_id}")
+    return job
+
+
+def create_json_job(body: bytes) -> Job:
+    """Job of a JSON list of `ModelRequest`, validated off the event loop."""
+    annot_reqs = REQUESTS_ADAPTER.validate_json(body)
+    return job_store().create([(req.req_id, req.text) for req in annot_reqs])
+
+
+async def create_file_job(request: Request, ext: str, text_column: str, id_column: Optional[str]) -> Job:
+    """Job of the rows of an uploaded file, spooled to disk next to the database."""
+    fd, path = tempfile.mkstemp(suffix=ext, prefix="upload-", dir=os.path.dirname(job_store().path))
+    os.close(fd)
+    try:
+        await save_upload(request.stream(), path, JOBS_MAX_UPLOAD_MB * 2**20)
+        return await asyncio.to_thread(job_store().create, file_messages(path, text_column, id_column))
+    except UploadTooLarge as exc:
+        raise HTTPException(status_code=HTTPStatus.REQUEST_ENTITY_TOO_LARGE, detail=str(exc)) from exc
+    except (ValueError, KeyError) as exc:
+        raise HTTPException(status_code=HTTPStatus.BAD_REQUEST, detail=f"{type(exc).__name__}: {exc}") from exc
+    finally:
+        os.remove(path)
+
+
+async def job_result_lines(job_id: str, n_items: int) -> AsyncIterator[bytes]:
+    for offset in range(0, n_items, JOBS_PAGE_SIZE):
+        rows = await asyncio.to_thread(job_store().results, job_id, offset, JOBS_PAGE_SIZE)
+        yield b"".join(dumps(row) + b"\n" for row in rows)
 
-router = APIRouter()
-extr_cls_handler = ExtrClsHandler()
 
 def init_routes():
     @router.get("/", status_code=HTTPStatus.OK)
     async def root():
-        logger.warning("Router healh Interaction.")
+        logger.debug("Router healh Interaction.")
+        if startup.status == "failed":
+            return JSONResponse(
+                {"healthy": HTTPStatus.INTERNAL_SERVER_ERROR, "error": startup.error},
+                status_code=HTTPStatus.INTERNAL_SERVER_ERROR,
+            )
         return {"healthy": HTTPStatus.OK}
 
+    @router.get("/ready")
+    async def ready():
+        status_code = HTTPStatus.OK if startup.ready else HTTPStatus.SERVICE_UNAVAILABLE
+        return JSONResponse(startup.as_dict(), status_code=status_code)
+
+    @router.get("/metrics")
+    async def metrics_endpoint():
+        content, content_type = metrics.render()
+        return Response(content=content, media_type=content_type)
+
     @router.post("/model", status_code=HTTPStatus.OK, response_model=ModelResponse)
     async def model(annot_req: ModelRequest):
-        logger.warning("Router model Interaction.")
-        model_res = extr_cls_handler(text=annot_req.text)
-        response = ModelResponse(
-            req_id=annot_req.req_id,
-            card=model_res.card,
-            azs=model_res.azs,
-            trk=model_res.trk,
-            fuel=model_res.fuel,
-            topic=model_res.topic,
-            sub=model_res.sub,
-        )
-        return response
+        logger.debug("Router model Interaction.")
+        ensure_ready()
+        try:
+            with metrics.IN_FLIGHT.track_inprogress(), executor.admission():
+                model_res = await batcher.submit(annot_req.text)
+        except Overloaded as exc:
+            logger.warning(str(exc))
+            raise HTTPException(status_code=HTTPStatus.SERVICE_UNAVAILABLE, detail=str(exc)) from exc
+        return FastJSONResponse(response_dict(annot_req.req_id, model_res))
+
+    @router.post("/model/batch", status_code=HTTPStatus.OK, response_model=list[ModelResponse])
+    async def model_batch(annot_reqs: list[ModelRequest]):
+        logger.debug(f"Router model batch Interaction: {len(annot_reqs)} requests.")
+        ensure_ready()
+        try:
+            with metrics.IN_FLIGHT.track_inprogress(), executor.admission(len(annot_reqs)):
+                models_res = await batcher.submit_many([req.text for req in annot_reqs])
+        except BatchTooLarge as exc:
+            raise HTTPException(status_code=HTTPStatus.REQUEST_ENTITY_TOO_LARGE, detail=str(exc)) from exc
+        except Overloaded as exc:
+            logger.warning(str(exc))
+            raise HTTPException(status_code=HTTPStatus.SERVICE_UNAVAILABLE, detail=str(exc)) from exc
+        return FastJSONResponse([
+            response_dict(req.req_id, model_res)
+            for req, model_res in zip(annot_reqs, models_res)
+        ])
+
+    @router.post("/model/stream")
+    async def model_stream(request: Request):
+        logger.debug("Router model stream Interaction.")
+        ensure_ready()
+        lines = read_lines(request.stream(), STREAM_MAX_LINE_BYTES)
+        return NDJSONResponse(stream_responses(lines, stream_process, STREAM_MAX_IN_FLIGHT))
+
+    @router.post("/jobs", status_code=HTTPStatus.ACCEPTED)
+    async def create_job(
+            request: Request,
+            file_format: Optional[str] = Query(None, alias="format"),
+            text_column: str = "text",
+            id_column: Optional[str] = None,
+        ):
+        logger.debug("Router jobs Interaction.")
+        if file_format is None:
+            # JSON bodies are buffered and parsed whole, large exports go as files
+            try:
+                body = await read_body(request.stream(), JOBS_MAX_JSON_MB * 2**20)
+                job = await asyncio.to_thread(create_json_job, body)
+            except UploadTooLarge as exc:
+                raise HTTPException(status_code=HTTPStatus.REQUEST_ENTITY_TOO_LARGE, detail=str(exc)) from exc
+            except ValidationError as exc:
+                raise HTTPException(status_code=HTTPStatus.UNPROCESSABLE_ENTITY, detail=exc.errors()) from exc
+        else:
+            ext = "." + file_format.lower().lstrip(".")
+            if ext not in FORMATS:
+                raise HTTPException(
+                    status_code=HTTPStatus.BAD_REQUEST,
+                    detail=f"Unsupported file format: {file_format}. Available: {FORMATS}",
+                )
+            job = await create_file_job(request, ext, text_column, id_column)
+        logger.info(f"Job {job.job_id} queued: {job.n_items} messages")
+        return job.as_dict()
+
+    @router.get("/jobs/{job_id}")
+    async def job_status(job_id: str):
+        return (await asyncio.to_thread(get_job, job_id)).as_dict()
+
+    @router.get("/jobs/{job_id}/result")
+    async def job_result(
+            job_id: str,
+            offset: int = Query(0, ge=0),
+            limit: int = Query(JOBS_PAGE_SIZE, ge=1, le=JOBS_PAGE_SIZE),
+            stream: bool = False,
+        ):
+        job = await asyncio.to_thread(get_job, job_id)
+        if stream:
+            if job.status != "done":
+                raise HTTPException(status_code=HTTPStatus.CONFLICT, detail=f"Job {job_id} is {job.status}")
+            return StreamingResponse(job_result_lines(job_id, job.n_items), media_type="application/x-ndjson")
+        items = await asyncio.to_thread(job_store().results, job_id, offset, limit)
+        return FastJSONResponse({
+            "job": job.as_dict(),
+            "items": items,
+            "next_offset": offset + limit if offset + limit < job.n_items else None,
+        })
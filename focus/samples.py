@@ -0,0 +1,209 @@
+"""Synthetic messages of every pattern, for the warm-up and the benchmarks.
+
+Messages follow the layout of real mails of each `PatternClassifierUnit`
+(service headers, markers, the customer text between them) and are padded
+with customer text up to the requested size.
+"""
+import random
+from typing import Callable
+
+from focus.modules.alg_parser import parse_msg
+from focus.modules.pattern_cls import PAT_CLS_UNITS, pattern_classifier
+
+
+PATTERNS = tuple(unit.name for unit in PAT_CLS_UNITS)
+
+STARS = "*" * 31
+
+WORDS = (
+    "добрый день прошу разобраться с начислением баллов на карту вчера заправлялся "
+    "на станции оператор не смог провести оплату по приложению деньги списали дважды "
+    "чек не выдали кассир сказал обратиться на горячую линию спасибо жду ответа"
+).split()
+
+# Fragments carrying the fields the extractors look for
+FIELD_PHRASES = (
+    "карта 7825680601252380",
+    "по карте 9000 1234 1234 1234",
+    "АЗС 123",
+    "на АЗС №45",
+    "колонка 3",
+    "третья колонка",
+    "АИ-95",
+    "дизель",
+    "телефон 79991234567",
+    "https://example.com/check?id=12",
+    "чек.pdf",
+    "[12]",
+)
+
+
+def customer_text(n_chars: int, rnd: random.Random, sep: str = "\n") -> str:
+    """Lines of customer text of at least `n_chars`, joined with `sep`."""
+    lines: list[str] = []
+    size = 0
+    while size < n_chars:
+        words = [rnd.choice(WORDS) for _ in range(rnd.randint(6, 14))]
+        if rnd.random() < 0.5:
+            words.insert(rnd.randrange(len(words)), rnd.choice(FIELD_PHRASES))
+        line = " ".join(words).capitalize() + "."
+        lines.append(line)
+        size += len(line) + len(sep)
+    return sep.join(lines)
+
+
+def no_text(body: str) -> str:
+    return f"no text message => see attachment\n\n{body}"
+
+
+def otrs(body: str) -> str:
+    sections = [
+        ("ТИП ОБРАЩЕНИЯ", "Жалоба"),
+        ("ТЕМА ВОПРОСА", "Программа лояльности"),
+        ("ТИП ВОПРОСА", "Начисление баллов"),
+        ("НОМЕР КАРТЫ", "7825 6806 0125 2380"),
+        ("КАК К ВАМ ОБРАЩАТЬСЯ?", "Иван"),
+        ("НОМЕР СТАРОЙ КАРТЫ", ""),
+        ("НОМЕР НОВОЙ КАРТЫ", ""),
+        ("СООБЩЕНИЕ", body),
+        ("ФАЙЛ", ""),
+        ("НОМЕР АЗС", "123"),
+        ("НОМЕР КОЛОНКИ", "3"),
+        ("ВИД ТОПЛИВА", "АИ-95"),
+        ("ДАТА ПОСЕЩЕНИЯ АЗС", "01.01.2025"),
+    ]
+    parts = ["Письмо сгенерировано автоматически", "ДАННЫЕ ДЛЯ OTRS"]
+    parts.extend(f"{title}\n{STARS}\n{value}\n" for title, value in sections)
+    return "\n".join(parts)
+
+
+def acc_removal(body: str) -> str:
+    return (
+        "УДАЛИТЬ АККАУНТ\n"
+        "Номер карты лояльности №1: 7825000011112222\n"
+        "Номер карты лояльности №2: 9000123412341234\n"
+        "Телефон: 79991234567\n"
+        f"{body}"
+    )
+
+
+def standard(body: str) -> str:
+    return (
+        f"Номер заказа: {body}\n"
+        "Контактный телефон: 79991234567\n"
+        "Номер карты ПЛ: 7825680601252380\n"
+        "Объект: АЗС 123\n"
+        "Адрес: Санкт-Петербург, Невский пр., 1\n"
+        "Примечание: Сообщение подано через мобильное приложение\n"
+        "Напишите ваши пожелания по работе станции. Нам это очень важно."
+    )
+
+
+def udc(body: str) -> str:
+    return (
+        "Причина обращения: Не прошла оплата, Номер ОРТ 123, Номер ТРК: 3, Вид НП: АИ-95, "
+        "Сумма внесённых денежных средств: 1000, Наличие транзакции: да\n"
+        f"Краткое описание обращения(хронология): {body}\n\n"
+        "С уважением, дежурный оператор"
+    )
+
+
+HOTLINE_HEADER = (
+    "Коллеги, пересылаем на рассмотрение сообщение Горячей линии.\n"
+    "Оператор Горячей линии по противодействию мошенничеству, коррупции и другим "
+    "нарушениям Корпоративного кодекса\n"
+)
+
+
+def hotline_empty(body: str) -> str:
+    return (
+        f"{HOTLINE_HEADER}From: Hot-line <hot-line@gazprom-neft.ru>\n"
+        "Voice message 800 700 6500\n"
+        f"{body}"
+    )
+
+
+def hotline_hotline(body: str) -> str:
+    return (
+        f"{HOTLINE_HEADER}From: Hot-line <hot-line@gazprom-neft.ru>\n"
+        "Сообщение из формы HOTLINE\n"
+        f"Текст сообщения: {body}\n"
+        "Сообщение сгенерировано автоматически."
+    )
+
+
+def hotline_free(body: str) -> str:
+    return (
+        f"{HOTLINE_HEADER}От: Hot-line <hot-line@gazprom-neft.ru>\n"
+        f"Тема: [☝❗EXTERNAL❗] Обращение\n{body}"
+    )
+
+
+def hotline_feedback(body: str) -> str:
+    return (
+        "Информационное сообщение сайта www.gazprom-neft.ru\n"
+        "Вам было отправлено сообщение через форму обратной связи\n"
+        f"Ваше сообщение: {body}\n"
+        "Я ознакомлен(-а) с положением о защите персональных данных\n"
+        "Сообщение сгенерировано автоматически."
+    )
+
+
+def corp_res(body: str) -> str:
+    return (
+        "Информационная служба\n"
+        'ПАО "ГАЗПРОМ НЕФТЬ"\n'
+        "Россия, 190000, Санкт-Петербург, ул. Почтамтская, д.3-5\n"
+        "WWW.GAZPROM-NEFT.RU\n"
+        f"Subject: [☝❗EXTERNAL❗] Обращение\n{body}\n"
+        "С уважением, Информационная служба"
+    )
+
+
+def complaint(body: str) -> str:
+    return (
+        f"Суть обращения\n{body}\n"
+        "Принятые меры\nПроведена беседа с персоналом\n"
+        "№ АЗС 45\n"
+        "Дата обращения клиента 01.01.2025\n"
+        "Ответ клиенту\nПриносим извинения за доставленные неудобства"
+    )
+
+
+def other(body: str) -> str:
+    return f"Добрый день!\n{body}\nС уважением, Иван"
+
+
+TEMPLATES: dict[str, Callable[[str], str]] = {
+    "NoText": no_text,
+    "OTRS": otrs,
+    "AccRemoval": acc_removal,
+    "Standard": standard,
+    "UDC": udc,
+    "HotlineEmpty": hotline_empty,
+    "HotlineHotline": hotline_hotline,
+    "HotlineFree": hotline_free,
+    "HotlineFeedback": hotline_feedback,
+    "CorpRes": corp_res,
+    "ComplaintBook": complaint,
+    "Other": other,
+}
+
+
+def message(pattern: str, n_chars: int, seed: int = 0) -> str:
+    """Message of `pattern` of about `n_chars` characters.
+
+    Raise ValueError if the message is not classified as `pattern` or its
+    parser fails, i.e. the template is out of date with the patterns.
+    """
+    if pattern not in TEMPLATES:
+        raise ValueError(f"Unknown pattern: {pattern}. Available: {PATTERNS}")
+    template = TEMPLATES[pattern]
+    rnd = random.Random(f"{pattern}:{n_chars}:{seed}")
+    overhead = len(template(""))
+    msg = template(customer_text(max(n_chars - overhead, 1), rnd))
+    _, pat_name = pattern_classifier(msg, PAT_CLS_UNITS)
+    if pat_name != pattern:
+        raise ValueError(f"{pattern} message is classified as {pat_name}")
+    parse_msg(pat_name, msg)
+    return msg
@@ -0,0 +1,44 @@
+"""Service startup state and warm-up messages.
+
+The models are loaded and warmed up off the event loop, so the liveness
+probe is served right away and `/ready` reports the startup progress.
+Warm-up runs sample messages of every pattern through the models: the first
+calls initialize the tokenizers, the torch thread pools and the allocator
+arenas, which would otherwise fall on the first requests.
+"""
+from dataclasses import asdict, dataclass, field
+from typing import Any, Optional
+
+from focus.samples import PATTERNS, message
+
+
+@dataclass
+class Startup:
+    """Startup progress: "loading" -> "loaded" -> "warming_up" -> "ready",
+    or "failed" at any step with the `error`."""
+    status: str = "loading"
+    load_s: Optional[float] = None
+    warmup_s: Optional[float] = None
+    # load seconds by model
+    models_load_s: dict[str, float] = field(default_factory=dict)
+    error: Optional[str] = None
+
+    @property
+    def ready(self) -> bool:
+        return self.status == "ready"
+
+    @property
+    def loaded(self) -> bool:
+        return self.status in ("loaded", "warming_up", "ready")
+
+    def fail(self, exc: BaseException):
+        self.status = "failed"
+        self.error = f"{type(exc).__name__}: {exc}"
+
+    def as_dict(self) -> dict[str, Any]:
+        return asdict(self)
+
+
+def warmup_texts(sizes: tuple[int, ...]) -> list[str]:
+    """One message of every pattern of each size in characters."""
+    return [message(pattern, n_chars) for n_chars in sizes for pattern in PATTERNS]
@@ -0,0 +1,120 @@
+"""NDJSON streaming of messages through the inference pipeline.
+
+Request lines are `ModelRequest` JSON objects, response lines are
+`ModelResponse` objects in the order of the request lines, or an error
+object `{"line", "req_id", "error"}` for a line that can not be parsed or
+processed. At most `max_in_flight` messages are read ahead of the response:
+while the client does not read the responses, the request body is not read
+either, so the memory of a stream does not depend on its length.
+"""
+import asyncio
+from typing import AsyncIterator, Awaitable, Callable, Optional, Union
+
+from pydantic import ValidationError
+from starlette.requests import ClientDisconnect
+from starlette.responses import StreamingResponse
+from starlette.types import Receive, Scope, Send
+
+from focus import ModelRequest, ModelRes
+from focus.responses import dumps, response_dict
+
+
+ProcessFunc = Callable[[str], Awaitable[ModelRes]]
+
+
+class NDJSONResponse(StreamingResponse):
+    """Streaming response that leaves the request body to the body iterator.
+
+    `StreamingResponse` reads the request messages while streaming to notice
+    a disconnect, which would consume the body chunks the iterator reads.
+    A disconnect is noticed by the iterator through the request stream.
+    """
+    media_type = "application/x-ndjson"
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        try:
+            await self.stream_response(send)
+        except OSError:
+            raise ClientDisconnect()
+
+
+async def read_lines(chunks: AsyncIterator[bytes], max_line_bytes: int) -> AsyncIterator[Optional[bytes]]:
+    """Lines of a chunked body without the line breaks, None for a line
+    longer than `max_line_bytes`, which is skipped without buffering it."""
+    buf = b""
+    skipping = False
+    async for chunk in chunks:
+        buf += chunk
+        start = 0
+        while (end := buf.find(b"\n", start)) != -1:
+            if skipping:
+                skipping = False
+            else:
+                yield buf[start:end] if end - start <= max_line_bytes else None
+            start = end + 1
+        buf = buf[start:]
+        if len(buf) > max_line_bytes:
+            if not skipping:
+                yield None
+            skipping = True
+            buf = b""
+    if buf and not skipping:
+        yield buf if len(buf) <= max_line_bytes else None
+
+
+def _error_line(line_no: int, req_id: Optional[int], error: str) -> bytes:
+    return dumps({"line": line_no, "req_id": req_id, "error": error}) + b"\n"
+
+
+async def _respond(line_no: int, req: ModelRequest, process: ProcessFunc) -> bytes:
+    try:
+        res = await process(req.text)
+    except Exception as exc:
+        return _error_line(line_no, req.req_id, f"{type(exc).__name__}: {exc}")
+    return dumps(response_dict(req.req_id, res)) + b"\n"
+
+
+async def stream_responses(
+        lines: AsyncIterator[Optional[bytes]],
+        process: ProcessFunc,
+        max_in_flight: int,
+    ) -> AsyncIterator[bytes]:
+    """Response lines of the request `lines`, each message is processed by `process`."""
+    # responses in request order, the bounded queue stops reading lines
+    # while `max_in_flight` responses are not sent
+    pending: asyncio.Queue[Union[asyncio.Future, bytes, Exception, None]] = asyncio.Queue(max_in_flight)
+
+    async def read():
+        line_no = 0
+        try:
+            async for line in lines:
+                line_no += 1
+                if line is None:
+                    await pending.put(_error_line(line_no, None, "Request line is too long"))
+                    continue
+                if not line.strip():
+                    continue
+                try:
+                    req = ModelRequest.model_validate_json(line)
+                except ValidationError as exc:
+                    await pending.put(_error_line(line_no, None, str(exc)))
+                    continue
+                await pending.put(asyncio.ensure_future(_respond(line_no, req, process)))
+        except Exception as exc:
+            # e.g. `ClientDisconnect` of the request stream, raised in the response
+            await pending.put(exc)
+            return
+        await pending.put(None)
+
+    reader = asyncio.create_task(read())
+    try:
+        while (item := await pending.get()) is not None:
+            if isinstance(item, Exception):
+                raise item
+            yield item if isinstance(item, bytes) else await item
+    finally:
+        reader.cancel()
+        while not pending.empty():
+            item = pending.get_nowait()
+            if isinstance(item, asyncio.Future):
+                item.cancel()
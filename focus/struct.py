@@ -8,6 +8,11 @@ class ModelRequest(BaseModel):
 
 
 class ModelResponse(BaseModel):
+    """Fields and labels of a message.
+
+    `topic` and `sub` are empty strings when the message pattern skips
+    classification (`STAGE_PLANS` in `focus/modules/stage_plan.py`).
+    """
     req_id: int | None
     card: str
     azs: str
@@ -0,0 +1,184 @@
+"""Find the torch threads, worker processes and batch size of the best throughput.
+
+Replays a corpus through `ExtrClsHandler` for every configuration of the
+grid: `workers` processes with a handler each, `threads` torch threads per
+process, the corpus split into batches of `batch_size` messages that the
+processes take in turn. Reports the throughput and the per-message latency
+(the time of its batch) of every configuration and writes the best one to
+the tuned config file that the server applies at startup. Configurations
+with more torch threads in total than cpus are skipped unless
+`--oversubscribe`. Corpus is a JSONL file with a "text" field per line.
+
+Usage:
+    python -m focus.tune corpus.jsonl [--threads 1 2 4] [--workers 1 2 4] [--batch-sizes 1 8 16]
+"""
+import argparse
+import itertools
+import json
+import multiprocessing
+import os
+import statistics
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import asdict, dataclass
+from typing import Any, Optional
+
+from loguru import logger
+
+from focus import TUNED_CONFIG_P
+from focus.log import setup_logging
+from focus.modules.backend import set_torch_threads
+from focus.modules.handler import ExtrClsHandler
+from focus.parity import read_texts
+
+
+@dataclass
+class TuneResult:
+    threads: int
+    interop_threads: int
+    workers: int
+    batch_size: int
+    n_texts: int
+    texts_per_s: float
+    p50_ms: float
+    p95_ms: float
+
+    def config(self) -> dict[str, Any]:
+        """Settings of `focus/__init__.py` the server takes from the tuned config."""
+        return {
+            "SERVER_WORKERS": self.workers,
+            "SERVER_TORCH_THREADS": self.threads,
+            "SERVER_TORCH_INTEROP_THREADS": self.interop_threads,
+            # the processes run one batch at a time
+            "EXECUTOR_WORKERS": 1,
+            "BATCH_MAX_SIZE": self.batch_size,
+        }
+
+
+# Every process of the measured pool holds its own handler
+_handler: Optional[ExtrClsHandler] = None
+
+
+def _init_worker(threads: int, interop_threads: int):
+    global _handler
+    setup_logging()
+    set_torch_threads(threads, interop_threads)
+    _handler = ExtrClsHandler(cache=None)
+
+
+def _warm_up(texts: list[str]):
+    _handler.warm_up(texts)
+
+
+def _run_batch(texts: list[str]) -> float:
+    start = time.perf_counter()
+    _handler.batch(texts)
+    return time.perf_counter() - start
+
+
+def grid(
+        threads: list[int],
+        interop_threads: list[int],
+        workers: list[int],
+        batch_sizes: list[int],
+        cpus: int,
+        oversubscribe: bool = False,
+    ) -> list[tuple[int, int, int, int]]:
+    """(threads, interop threads, workers, batch size) configurations to measure."""
+    return [
+        conf for conf in itertools.product(threads, interop_threads, workers, batch_sizes)
+        if oversubscribe or conf[0] * conf[2] <= cpus
+    ]
+
+
+def measure(
+        texts: list[str],
+        threads: int,
+        interop_threads: int,
+        workers: int,
+        batch_size: int,
+        n_warmup: int = 8,
+    ) -> TuneResult:
+    """Replay `texts` with a fresh process pool, loading and warm-up excluded."""
+    # torch threads are set in fresh processes, inter-op threads can not be
+    # changed once set
+    with ProcessPoolExecutor(
+            workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(threads, interop_threads),
+        ) as pool:
+        for future in [pool.submit(_warm_up, texts[:n_warmup]) for _ in range(workers)]:
+            future.result()
+        batches = [texts[i:i + batch_size] for i in range(0, len(texts), batch_size)]
+        start = time.perf_counter()
+        batches_s = list(pool.map(_run_batch, batches))
+        elapsed = time.perf_counter() - start
+    latencies = sorted(
+        batch_s * 1000
+        for batch, batch_s in zip(batches, batches_s)
+        for _ in batch
+    )
+    return TuneResult(
+        threads=threads,
+        interop_threads=interop_threads,
+        workers=workers,
+        batch_size=batch_size,
+        n_texts=len(texts),
+        texts_per_s=len(texts) / elapsed,
+        p50_ms=statistics.median(latencies),
+        p95_ms=latencies[int(0.95 * (len(latencies) - 1))],
+    )
+
+
+def best(results: list[TuneResult], max_p95_ms: Optional[float] = None) -> Optional[TuneResult]:
+    """Result of the highest throughput, with p95 within `max_p95_ms` if set."""
+    fitting = [res for res in results if max_p95_ms is None or res.p95_ms <= max_p95_ms]
+    return max(fitting, key=lambda res: res.texts_per_s, default=None)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument("corpus", help="JSONL file with a \"text\" field per line")
+    parser.add_argument("--threads", nargs="+", type=int, default=[1, 2, 4, 8], help="torch threads per process")
+    parser.add_argument("--interop-threads", nargs="+", type=int, default=[1], help="torch inter-op threads per process")
+    parser.add_argument("--workers", nargs="+", type=int, default=[1, 2, 4, 8], help="processes")
+    parser.add_argument("--batch-sizes", nargs="+", type=int, default=[1, 8, 16, 32])
+    parser.add_argument("--cpus", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--oversubscribe", action="store_true", help="also measure threads * workers > cpus")
+    parser.add_argument("--max-p95-ms", type=float, default=None, help="latency limit of the best config")
+    parser.add_argument("--limit", type=int, default=None, help="first texts of the corpus only")
+    parser.add_argument("--out", default=TUNED_CONFIG_P, help="tuned config JSON")
+    parser.add_argument("--report", default=None, help="results of all configs JSON")
+    args = parser.parse_args()
+    setup_logging()
+
+    texts = list(read_texts(args.corpus))[:args.limit]
+    confs = grid(args.threads, args.interop_threads, args.workers, args.batch_sizes, args.cpus, args.oversubscribe)
+    logger.warning(f"{len(confs)} configs, {len(texts)} texts, {args.cpus} cpus")
+
+    print(f"{'threads':>7} {'interop':>7} {'workers':>7} {'batch':>5} {'texts/s':>8} {'p50 ms':>8} {'p95 ms':>8}")
+    results = []
+    for threads, interop_threads, workers, batch_size in confs:
+        res = measure(texts, threads, interop_threads, workers, batch_size)
+        results.append(res)
+        print(
+            f"{res.threads:>7} {res.interop_threads:>7} {res.workers:>7} {res.batch_size:>5} "
+            f"{res.texts_per_s:>8.1f} {res.p50_ms:>8.1f} {res.p95_ms:>8.1f}",
+            flush=True,
+        )
+    if args.report is not None:
+        with open(args.report, "w", encoding="utf-8") as report_file:
+            json.dump([asdict(res) for res in results], report_file, indent=1)
+
+    top = best(results, args.max_p95_ms)
+    if top is None:
+        logger.error(f"No config within p95 {args.max_p95_ms} ms, {args.out} is not written")
+        return
+    with open(args.out, "w", encoding="utf-8") as out_file:
+        json.dump({"config": top.config(), "measured": asdict(top), "cpus": args.cpus}, out_file, indent=1)
+    logger.warning(f"Best config {top.config()}: {top.texts_per_s:.1f} texts/s, p95 {top.p95_ms:.1f} ms -> {args.out}")
+
+
+if __name__ == "__main__":
+    main()
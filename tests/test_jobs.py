@@ -0,0 +1,73 @@
+"""Claims, leases and attempts of the job queue."""
+import pytest
+
+from focus.jobs import JobStore
+
+# a lease that has already expired when the claim returns
+EXPIRED = -1.0
+
+
+@pytest.fixture
+def store(tmp_path) -> JobStore:
+    return JobStore(str(tmp_path / "jobs.sqlite"))
+
+
+def create(store: JobStore, n: int) -> str:
+    return store.create([(i, f"message {i}") for i in range(n)]).job_id
+
+
+def test_claimed_items_are_not_claimed_again(store):
+    create(store, 3)
+    first, first_items = store.claim(2, lease_s=60, max_attempts=3)
+    second, second_items = store.claim(2, lease_s=60, max_attempts=3)
+    assert first != second
+    assert [item.idx for item in first_items] == [0, 1]
+    assert [item.idx for item in second_items] == [2]
+    assert store.claim(2, lease_s=60, max_attempts=3)[1] == []
+
+
+def test_complete_stores_results_and_finishes_job(store):
+    job_id = create(store, 2)
+    token, items = store.claim(2, lease_s=60, max_attempts=3)
+    assert store.complete(token, [(item.rowid, {"topic": item.text}) for item in items]) == 2
+    job = store.get(job_id)
+    assert (job.status, job.n_done) == ("done", 2)
+    assert [row["topic"] for row in store.results(job_id, 0, 10)] == ["message 0", "message 1"]
+
+
+def test_renewed_lease_is_not_reclaimed(store):
+    create(store, 2)
+    token, _ = store.claim(2, lease_s=EXPIRED, max_attempts=3)
+    assert store.renew(token, 60) == 2
+    assert store.claim(2, lease_s=60, max_attempts=3)[1] == []
+
+
+def test_expired_items_are_reclaimed_one_at_a_time(store):
+    create(store, 3)
+    store.claim(3, lease_s=EXPIRED, max_attempts=3)
+    _, items = store.claim(3, lease_s=60, max_attempts=3)
+    assert [item.idx for item in items] == [0]
+
+
+def test_stale_claim_result_is_dropped(store):
+    job_id = create(store, 1)
+    stale, items = store.claim(1, lease_s=EXPIRED, max_attempts=3)
+    fresh, reclaimed = store.claim(1, lease_s=60, max_attempts=3)
+    assert [item.rowid for item in reclaimed] == [item.rowid for item in items]
+    assert store.complete(stale, [(items[0].rowid, {"topic": "stale"})]) == 0
+    assert store.get(job_id).n_done == 0
+    assert store.complete(fresh, [(items[0].rowid, {"topic": "fresh"})]) == 1
+    assert store.complete(fresh, [(items[0].rowid, {"topic": "again"})]) == 0
+    assert [row["topic"] for row in store.results(job_id, 0, 10)] == ["fresh"]
+
+
+def test_item_gets_error_after_max_attempts(store):
+    job_id = create(store, 2)
+    for _ in range(2):
+        store.claim(1, lease_s=EXPIRED, max_attempts=2)
+    _, items = store.claim(1, lease_s=60, max_attempts=2)
+    assert [item.idx for item in items] == [1]
+    failed, = store.results(job_id, 0, 10)
+    assert failed["idx"] == 0
+    assert "2 times" in failed["error"]
+    assert store.get(job_id).n_done == 1
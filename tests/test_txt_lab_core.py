@@ -0,0 +1,198 @@
+"""Equivalence of the txt_lab splitting and joining with the original list-based implementation."""
+from dataclasses import dataclass
+
+from hypothesis import given, settings
+from hypothesis import strategies as st
+
+from focus.modules.txt_lab.core import concat_list, drop_cats, split_by_indices, split_by_symbol
+from focus.modules.txt_lab.struct import Entity, Text
+
+CATS = ["card", "azs", "trk", "fuel"]
+
+
+# Reference: the implementation before entities were stored as columns
+
+
+@dataclass
+class RefText:
+    text: str
+    entities: list[Entity]
+
+
+def ref_concat(first: RefText, second: RefText, sep: str = ' ') -> RefText:
+    shift = len(first.text) + len(sep)
+    second_entities = [Entity(ent.beg + shift, ent.end + shift, ent.cat) for ent in second.entities]
+    return RefText(f'{first.text}{sep}{second.text}', first.entities.copy() + second_entities)
+
+
+def ref_split_by_idx(text: RefText, split_idx: int) -> tuple[RefText, RefText]:
+    if split_idx < 0 or split_idx >= len(text.text) or (text.text[split_idx] not in [' ', '\n']):
+        raise ValueError("split_idx must point to a valid space or '\\n' character in the text")
+    left_entities = []
+    right_entities = []
+    for entity in text.entities:
+        if entity.end <= split_idx:
+            left_entities.append(entity)
+        elif entity.beg >= split_idx + 1:
+            right_entities.append(Entity(
+                entity.beg - (split_idx + 1), entity.end - (split_idx + 1), entity.cat
+            ))
+        else:
+            if entity.beg < split_idx:
+                left_entities.append(Entity(entity.beg, split_idx, entity.cat))
+            if entity.end > split_idx + 1:
+                right_entities.append(Entity(0, entity.end - (split_idx + 1), entity.cat))
+    return (
+        RefText(text.text[:split_idx], left_entities),
+        RefText(text.text[split_idx + 1:], right_entities),
+    )
+
+
+def ref_split_by_symbol(text: RefText, symbol: str) -> list[RefText]:
+    result = []
+    current_text = text
+    while True:
+        split_pos = current_text.text.find(symbol)
+        if split_pos == -1:
+            result.append(current_text)
+            break
+        left_part, current_text = ref_split_by_idx(current_text, split_pos)
+        result.append(left_part)
+    return result
+
+
+def ref_split_by_indices(text: RefText, split_indices: list[int]) -> list[RefText]:
+    current_text = text
+    result = []
+    cumulative_shift = 0
+    for split_idx in split_indices:
+        left_part, current_text = ref_split_by_idx(current_text, split_idx - cumulative_shift)
+        result.append(left_part)
+        cumulative_shift += len(left_part.text) + 1
+    result.append(current_text)
+    return result
+
+
+def ref_concat_list(texts: list[RefText], sep: str = ' ') -> RefText:
+    if not texts:
+        return RefText("", [])
+    result = texts[0]
+    for text in texts[1:]:
+        result = ref_concat(result, text, sep)
+    return result
+
+
+def ref_drop_empty_lines(text: RefText) -> RefText:
+    lines = ref_split_by_symbol(text, "\n")
+    return ref_concat_list([line for line in lines if line.text.strip(" \t")], sep="\n")
+
+
+def ref_drop_cats(text: RefText, drop: set[str], drop_empty: bool = True) -> RefText:
+    new_text = ""
+    new_ents = []
+    old_left = 0
+    for ent in text.entities:
+        if ent.beg != old_left:
+            new_text = f"{new_text}{text.text[old_left:ent.beg]}"
+        old_left = ent.beg
+        if ent.cat not in drop:
+            cat_beg = len(new_text)
+            new_text = f"{new_text}{text.text[ent.beg:ent.end]}"
+            new_ents.append(Entity(cat_beg, len(new_text), ent.cat))
+        old_left = ent.end
+    new_text_lab = RefText(f"{new_text}{text.text[old_left:]}", new_ents)
+    if drop_empty:
+        new_text_lab = ref_drop_empty_lines(new_text_lab)
+    return new_text_lab
+
+
+# Strategies
+
+
+@st.composite
+def texts(draw) -> RefText:
+    text = draw(st.text(alphabet="ab \n\t", max_size=40))
+    bounds = st.integers(min_value=0, max_value=len(text))
+    spans = draw(st.lists(st.tuples(bounds, bounds, st.sampled_from(CATS)), max_size=8))
+    if draw(st.booleans()):
+        # in text order and not overlapping, as the NER outputs them
+        points = sorted(pos for beg, end, _ in spans for pos in (beg, end))
+        spans = [(beg, end, cat) for beg, end, (_, _, cat) in zip(points[::2], points[1::2], spans)]
+    entities = [Entity(min(beg, end), max(beg, end), cat) for beg, end, cat in spans]
+    return RefText(text, entities)
+
+
+def to_text(ref: RefText) -> Text:
+    return Text(ref.text, list(ref.entities))
+
+
+def as_tuple(text) -> tuple[str, list[tuple[int, int, str]]]:
+    return text.text, [(ent.beg, ent.end, ent.cat) for ent in text.entities]
+
+
+def split_points(text: str) -> list[int]:
+    return [pos for pos, char in enumerate(text) if char in " \n"]
+
+
+# Properties
+
+
+@settings(max_examples=500)
+@given(texts(), st.data())
+def test_split_by_indices(ref, data):
+    points = split_points(ref.text)
+    split_indices = sorted(data.draw(st.sets(st.sampled_from(points)) if points else st.just(set())))
+    expected = [as_tuple(part) for part in ref_split_by_indices(ref, split_indices)]
+    assert [as_tuple(part) for part in split_by_indices(to_text(ref), split_indices)] == expected
+
+
+@settings(max_examples=500)
+@given(texts(), st.sampled_from([" ", "\n"]))
+def test_split_by_symbol(ref, symbol):
+    expected = [as_tuple(part) for part in ref_split_by_symbol(ref, symbol)]
+    assert [as_tuple(part) for part in split_by_symbol(to_text(ref), symbol)] == expected
+
+
+@settings(max_examples=500)
+@given(st.lists(texts(), max_size=5), st.sampled_from([" ", "\n", ""]))
+def test_concat_list(refs, sep):
+    expected = as_tuple(ref_concat_list(refs, sep))
+    assert as_tuple(concat_list([to_text(ref) for ref in refs], sep)) == expected
+
+
+@settings(max_examples=500)
+@given(texts(), st.sets(st.sampled_from(CATS + ["other"])), st.booleans())
+def test_drop_cats(ref, drop, drop_empty):
+    expected = as_tuple(ref_drop_cats(ref, drop, drop_empty))
+    assert as_tuple(drop_cats(to_text(ref), drop, drop_empty)) == expected
+
+
+@settings(max_examples=200)
+@given(texts(), st.data())
+def test_split_then_concat_views(ref, data):
+    # parts of a split are views over the same columns, joining them must not mix them up
+    points = split_points(ref.text)
+    split_indices = sorted(data.draw(st.sets(st.sampled_from(points)) if points else st.just(set())))
+    parts = split_by_indices(to_text(ref), split_indices)
+    ref_parts = ref_split_by_indices(ref, split_indices)
+    assert as_tuple(concat_list(parts)) == as_tuple(ref_concat_list(ref_parts))
+
+
+@settings(max_examples=200)
+@given(texts(), st.data())
+def test_append_to_split_parts(ref, data):
+    # appending to the concatenation of parts and to the parts behaves like appending to lists
+    points = split_points(ref.text)
+    split_indices = sorted(data.draw(st.sets(st.sampled_from(points)) if points else st.just(set())))
+    parts = split_by_indices(to_text(ref), split_indices)
+    ref_parts = ref_split_by_indices(ref, split_indices)
+    new = Entity(0, 0, CATS[0])
+    joined, ref_joined = concat_list(parts), ref_concat_list(ref_parts)
+    joined.entities.append(new)
+    ref_joined.entities.append(new)
+    assert as_tuple(joined) == as_tuple(ref_joined)
+    assert [as_tuple(part) for part in parts] == [as_tuple(ref_part) for ref_part in ref_parts]
+    for part, ref_part in zip(parts, ref_parts):
+        part.entities.append(new)
+        ref_part.entities.append(new)
+    assert [as_tuple(part) for part in parts] == [as_tuple(ref_part) for ref_part in ref_parts]